@@ -1,3 +1,30 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ApiUsage, SystemMetrics, UsageRollup
+
+
+@admin.register(SystemMetrics)
+class SystemMetricsAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value', 'timestamp')
+    list_filter = ('name',)
+    date_hierarchy = 'timestamp'
+    readonly_fields = ('name', 'value', 'timestamp', 'metadata')
+
+
+@admin.register(ApiUsage)
+class ApiUsageAdmin(admin.ModelAdmin):
+    list_display = ('method', 'endpoint', 'status_code', 'response_time_ms', 'user', 'timestamp')
+    list_filter = ('method', 'status_code')
+    search_fields = ('endpoint',)
+    date_hierarchy = 'timestamp'
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+@admin.register(UsageRollup)
+class UsageRollupAdmin(admin.ModelAdmin):
+    list_display = ('granularity', 'bucket', 'user', 'endpoint', 'count', 'error_count', 'max_ms')
+    list_filter = ('granularity',)
+    date_hierarchy = 'bucket'
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
+
+    def ready(self):
+        from utils.timing import install_query_counter
+
+        connection_created.connect(install_query_counter, dispatch_uid='analytics.install_query_counter')
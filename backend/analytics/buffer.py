@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+
+from .models import ApiUsage, SystemMetrics
+from .rollups import update_rollups
+
+logger = logging.getLogger(__name__)
+
+EVENTS_KEY = 'analytics:events'
+DROPPED_KEY = 'analytics:events:dropped'
+# Event kind -> model the flush writes it to; event fields are model fields
+EVENT_MODELS = {
+    'usage': ApiUsage,
+    'metric': SystemMetrics,
+}
+# Seconds between warnings about a buffer that cannot accept events
+WARNING_INTERVAL = 60
+
+_event_buffer = None
+_event_buffer_pid = None
+_event_buffer_lock = threading.Lock()
+
+
+class RedisEventBuffer:
+    """
+    Bounded FIFO of analytics events in a Redis list shared by every process.
+
+    ``append`` is a single RPUSH. Once the list holds ``max_events`` the
+    buffer pushes back: the event just added is trimmed off again and
+    counted in a per-reason drop counter, so a stalled flush costs lost
+    events rather than unbounded Redis memory. Batches are taken from the
+    head of the list with LRANGE+LTRIM in one MULTI/EXEC, so concurrent
+    flushes never see the same event.
+    """
+
+    def __init__(self, client, max_events, key=EVENTS_KEY, dropped_key=DROPPED_KEY):
+        self.client = client
+        self.max_events = max_events
+        self.key = key
+        self.dropped_key = dropped_key
+        self._last_warning = 0.0
+
+    def append(self, event):
+        try:
+            length = self.client.rpush(self.key, json.dumps(event, separators=(',', ':'), default=str))
+            if length <= self.max_events:
+                return True
+            self.client.pipeline(transaction=False).ltrim(self.key, 0, self.max_events - 1).hincrby(
+                self.dropped_key, 'full', 1,
+            ).execute()
+        except Exception as e:
+            # Analytics must never fail a request; these drops are only visible in the log
+            now = time.monotonic()
+            if now - self._last_warning > WARNING_INTERVAL:
+                self._last_warning = now
+                logger.warning(f'Analytics event buffer unavailable, dropping events: {e}')
+        return False
+
+    def pop_batch(self, size):
+        pipe = self.client.pipeline()
+        pipe.lrange(self.key, 0, size - 1)
+        pipe.ltrim(self.key, size, -1)
+        payloads, _ = pipe.execute()
+        return [json.loads(payload) for payload in payloads]
+
+    def requeue(self, events):
+        """
+        Put a batch that could not be written back at the head of the list.
+        """
+        if events:
+            self.client.lpush(self.key, *[json.dumps(event, default=str) for event in reversed(events)])
+
+    def take_dropped(self):
+        """
+        Return and reset the drop counters.
+        """
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.dropped_key)
+        pipe.delete(self.dropped_key)
+        counts, _ = pipe.execute()
+        return {reason.decode(): int(count) for reason, count in counts.items()}
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+
+class LocalEventBuffer:
+    """
+    In-process bounded queue of analytics events, used when Redis is not
+    configured.
+
+    Each process flushes its own queue from a daemon thread every
+    ANALYTICS_FLUSH_INTERVAL_SECONDS. Events still queued when the process
+    exits are lost.
+    """
+
+    def __init__(self, max_events, flush_interval=None):
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self._events = deque()
+        self._dropped = Counter()
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def append(self, event):
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self._dropped['full'] += 1
+                return False
+            self._events.append(event)
+        if self._flusher is None and self.flush_interval:
+            self._start_flusher()
+        return True
+
+    def pop_batch(self, size):
+        with self._lock:
+            return [self._events.popleft() for _ in range(min(size, len(self._events)))]
+
+    def requeue(self, events):
+        with self._lock:
+            self._events.extendleft(reversed(events))
+
+    def take_dropped(self):
+        with self._lock:
+            dropped, self._dropped = dict(self._dropped), Counter()
+        return dropped
+
+    def __len__(self):
+        return len(self._events)
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever, name='analytics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                flush_events(self)
+            except Exception:
+                logger.exception('Could not flush analytics events')
+            finally:
+                close_old_connections()
+
+
+def get_event_buffer():
+    """
+    Return the analytics event buffer for this process.
+
+    ANALYTICS_BUFFER_BACKEND 'redis' uses the default django-redis cache
+    connection and falls back to the in-process queue when the cache is
+    not Redis; 'local' always uses the in-process queue.
+    """
+    global _event_buffer, _event_buffer_pid
+    # A buffer inherited from a parent process would share its Redis socket or lose its flush thread
+    if _event_buffer is None or _event_buffer_pid != os.getpid():
+        with _event_buffer_lock:
+            if _event_buffer is None or _event_buffer_pid != os.getpid():
+                _event_buffer = _create_event_buffer()
+                _event_buffer_pid = os.getpid()
+    return _event_buffer
+
+
+def _create_event_buffer():
+    max_events = settings.ANALYTICS_BUFFER_MAX_EVENTS
+    if settings.ANALYTICS_BUFFER_BACKEND == 'redis':
+        try:
+            from django_redis import get_redis_connection
+
+            return RedisEventBuffer(get_redis_connection('default'), max_events)
+        except (ImportError, NotImplementedError) as e:
+            logger.warning(f'Redis is not available for analytics events ({e}); buffering in process')
+    return LocalEventBuffer(max_events, flush_interval=settings.ANALYTICS_FLUSH_INTERVAL_SECONDS)
+
+
+def record_event(kind, **fields):
+    """
+    Queue an analytics event for the next flush, e.g.
+    ``record_event('usage', endpoint=..., method='GET', ...)``.
+
+    ``fields`` are the fields of the model registered for ``kind`` in
+    EVENT_MODELS and must be JSON serialisable. Costs one O(1) append and
+    never raises; returns False when the event was dropped.
+    """
+    return get_event_buffer().append({'kind': kind, 'ts': time.time(), **fields})
+
+
+def flush_events(buffer=None, batch_size=None, max_batches=None):
+    """
+    Move queued events into the database with one ``bulk_create`` per model
+    and batch, adding API usage to the rollups in the same transaction.
+
+    A batch that fails to insert is put back at the head of the buffer and
+    the flush stops. Drop counters are reset and stored as
+    ``analytics.events_dropped`` SystemMetrics rows. Returns the number of
+    rows written and the drops collected.
+    """
+    buffer = buffer if buffer is not None else get_event_buffer()
+    batch_size = batch_size or settings.ANALYTICS_FLUSH_BATCH_SIZE
+    max_batches = max_batches or settings.ANALYTICS_FLUSH_MAX_BATCHES
+    written = 0
+    for _ in range(max_batches):
+        events = buffer.pop_batch(batch_size)
+        if not events:
+            break
+        try:
+            written += _write_events(events)
+        except Exception:
+            buffer.requeue(events)
+            raise
+        if len(events) < batch_size:
+            break
+
+    dropped = buffer.take_dropped()
+    if dropped:
+        logger.warning(f'Analytics event buffer dropped events: {dropped}')
+        SystemMetrics.objects.bulk_create([
+            SystemMetrics(name='analytics.events_dropped', value=count, metadata={'reason': reason})
+            for reason, count in dropped.items()
+        ])
+    return {'written': written, 'dropped': dropped}
+
+
+def _write_events(events):
+    rows = {model: [] for model in EVENT_MODELS.values()}
+    user_ids = {event['user_id'] for event in events if event.get('user_id')}
+    if user_ids:
+        # Users deleted since the event was queued would fail the whole batch on the foreign key
+        existing = {str(pk) for pk in get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True)}
+    for event in events:
+        # Copied, as a failed batch is requeued as it came
+        event = dict(event)
+        kind = event.pop('kind', None)
+        timestamp = datetime.fromtimestamp(event.pop('ts'), tz=timezone.utc)
+        model = EVENT_MODELS.get(kind)
+        if model is None:
+            logger.warning(f'Skipping analytics event of unknown kind {kind!r}')
+            continue
+        if event.get('user_id') and event['user_id'] not in existing:
+            event['user_id'] = None
+        try:
+            rows[model].append(model(timestamp=timestamp, **event))
+        except TypeError as e:
+            logger.warning(f'Skipping malformed {kind} analytics event: {e}')
+
+    with transaction.atomic():
+        for model, objects in rows.items():
+            if objects:
+                model.objects.bulk_create(objects)
+        update_rollups(rows[ApiUsage])
+    return sum(len(objects) for objects in rows.values())
@@ -0,0 +1,104 @@
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+from utils.timing import RequestMetrics, activate, deactivate
+from .buffer import record_event
+
+
+class RequestMetricsMiddleware:
+    """
+    Collects stage timings, SQL query count/time and cache hit counts for
+    every request (see ``utils.timing``).
+
+    With REQUEST_METRICS_HEADERS (on in DEBUG) the summary is returned in
+    ``Server-Timing`` and ``X-SQL-Queries`` headers. A REQUEST_METRICS_SAMPLE_RATE
+    fraction of requests, plus every request slower than
+    REQUEST_METRICS_SLOW_MS, is stored as a SystemMetrics row, and with
+    ANALYTICS_USAGE_ENABLED every resolved API call as an ApiUsage row.
+    Both go through the analytics event buffer, so the request path pays
+    one buffer append rather than a database insert. Collection costs a
+    context variable and a few counters per request, so it is meant to
+    stay on in production. Streamed responses are measured up to the point
+    where streaming starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.REQUEST_METRICS_ENABLED
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = activate(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            deactivate(token)
+        self.finish(metrics, request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = activate(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            deactivate(token)
+        # A buffer append is one Redis RPUSH, cheap enough to make on the event loop
+        self.finish(metrics, request, response)
+        return response
+
+    def finish(self, metrics, request, response):
+        """
+        Close the measurement, add debug headers and queue the analytics events.
+        """
+        total_ms = metrics.finish()
+        if settings.REQUEST_METRICS_HEADERS:
+            response['Server-Timing'] = metrics.server_timing()
+            response['X-SQL-Queries'] = str(metrics.sql_count)
+
+        match = request.resolver_match
+        # The route pattern rather than the path, so ids do not split the series
+        route = match.route if match else None
+        if settings.ANALYTICS_USAGE_ENABLED and route and request.path.startswith('/api/'):
+            record_event(
+                'usage',
+                user_id=_user_id(request),
+                endpoint=route[:255],
+                method=request.method,
+                status_code=response.status_code,
+                response_time_ms=round(total_ms, 1),
+            )
+        if total_ms >= settings.REQUEST_METRICS_SLOW_MS or random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:
+            record_event(
+                'metric',
+                name='request',
+                value=round(total_ms, 1),
+                metadata={
+                    'route': route,
+                    'view': match.view_name if match else None,
+                    'method': request.method,
+                    'status': response.status_code,
+                    **metrics.as_dict(),
+                },
+            )
+
+
+def _user_id(request):
+    user = getattr(request, 'user', None)
+    # DRF replaces the lazy session user once it authenticates; do not force a session lookup here
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return str(user.pk) if user.is_authenticated else None
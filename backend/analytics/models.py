@@ -1,3 +1,96 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+class SystemMetrics(models.Model):
+    """
+    A sampled measurement, such as the timing breakdown of one API request.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, db_index=True)
+    value = models.FloatField()
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    metadata = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'system metrics'
+
+    def __str__(self):
+        return f'{self.name}={self.value}'
+
+
+class ApiUsage(models.Model):
+    """
+    One API call. Rows are written in batches by the analytics event buffer,
+    never from the request path.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_usage',
+    )
+    # The route pattern rather than the path, so ids do not split the series
+    endpoint = models.CharField(max_length=255)
+    method = models.CharField(max_length=10)
+    status_code = models.PositiveSmallIntegerField()
+    response_time_ms = models.FloatField()
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name_plural = 'API usage'
+
+    def __str__(self):
+        return f'{self.method} {self.endpoint} {self.status_code}'
+
+
+class UsageRollup(models.Model):
+    """
+    API usage pre-aggregated per time bucket, user and endpoint.
+
+    Maintained incrementally as ApiUsage events are flushed. Rows with no
+    user count every caller, including anonymous ones, and rows with an
+    empty endpoint count every endpoint, so totals are read directly rather
+    than summed.
+    """
+    GRANULARITY_MINUTE = 'minute'
+    GRANULARITY_HOUR = 'hour'
+    GRANULARITY_DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_MINUTE, 'Minute'),
+        (GRANULARITY_HOUR, 'Hour'),
+        (GRANULARITY_DAY, 'Day'),
+    ]
+    ALL_ENDPOINTS = ''
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='usage_rollups',
+    )
+    endpoint = models.CharField(max_length=255, blank=True, default=ALL_ENDPOINTS)
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'user', 'endpoint'],
+                condition=models.Q(user__isnull=False),
+                name='analytics_rollup_user_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'endpoint'],
+                condition=models.Q(user__isnull=True),
+                name='analytics_rollup_all_users_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'user', 'bucket'], name='analytics_rollup_user_idx'),
+            models.Index(fields=['granularity', 'bucket'], name='analytics_rollup_bucket_idx'),
+        ]
 
-# Create your models here.
+    def __str__(self):
+        return f'{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.endpoint or "*"}: {self.count}'
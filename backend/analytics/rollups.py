@@ -0,0 +1,132 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import ApiUsage, SystemMetrics, UsageRollup
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = (UsageRollup.GRANULARITY_MINUTE, UsageRollup.GRANULARITY_HOUR, UsageRollup.GRANULARITY_DAY)
+BUCKET_SIZES = {
+    UsageRollup.GRANULARITY_MINUTE: timedelta(minutes=1),
+    UsageRollup.GRANULARITY_HOUR: timedelta(hours=1),
+    UsageRollup.GRANULARITY_DAY: timedelta(days=1),
+}
+# Rows deleted per statement by ``compact_analytics``
+DELETE_BATCH_SIZE = 5000
+
+
+def bucket_start(moment, granularity):
+    """
+    Start of the bucket containing ``moment``; days follow TIME_ZONE.
+    """
+    local = timezone.localtime(moment)
+    if granularity == UsageRollup.GRANULARITY_MINUTE:
+        return local.replace(second=0, microsecond=0)
+    if granularity == UsageRollup.GRANULARITY_HOUR:
+        return local.replace(minute=0, second=0, microsecond=0)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def update_rollups(usages):
+    """
+    Add a batch of ApiUsage rows to the minute, hour and day rollups.
+
+    The batch is aggregated in memory first, so the database sees one
+    increment per rollup row touched rather than per call. Missing rows are
+    created with ``ignore_conflicts`` and all rows are then incremented
+    with F() expressions, which keeps concurrent flushes from losing counts.
+    Must run inside the transaction that stores the batch.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for usage in usages:
+        user_id = str(usage.user_id) if usage.user_id else None
+        error = usage.status_code >= 400
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(usage.timestamp, granularity)
+            users = (user_id, None) if user_id else (None,)
+            for user in users:
+                for endpoint in (usage.endpoint, UsageRollup.ALL_ENDPOINTS):
+                    delta = deltas[(granularity, bucket, user, endpoint)]
+                    delta[0] += 1
+                    delta[1] += error
+                    delta[2] += usage.response_time_ms
+                    delta[3] = max(delta[3], usage.response_time_ms)
+    if not deltas:
+        return 0
+
+    UsageRollup.objects.bulk_create(
+        [
+            UsageRollup(granularity=granularity, bucket=bucket, user_id=user, endpoint=endpoint)
+            for granularity, bucket, user, endpoint in deltas
+        ],
+        ignore_conflicts=True,
+    )
+    rows = UsageRollup.objects.filter(
+        Q(user__in={key[2] for key in deltas if key[2]}) | Q(user=None),
+        granularity__in={key[0] for key in deltas},
+        bucket__in={key[1] for key in deltas},
+        endpoint__in={key[3] for key in deltas},
+    ).only('id', 'granularity', 'bucket', 'user', 'endpoint')
+
+    updated = []
+    for row in rows:
+        delta = deltas.get((row.granularity, row.bucket, str(row.user_id) if row.user_id else None, row.endpoint))
+        if delta is None:
+            continue
+        row.count = F('count') + delta[0]
+        row.error_count = F('error_count') + delta[1]
+        row.total_ms = F('total_ms') + delta[2]
+        row.max_ms = Greatest(F('max_ms'), delta[3])
+        updated.append(row)
+    UsageRollup.objects.bulk_update(updated, ['count', 'error_count', 'total_ms', 'max_ms'], batch_size=500)
+    return len(updated)
+
+
+def compact_analytics(now=None):
+    """
+    Delete raw events and fine-grained rollups past their retention window.
+
+    Raw ApiUsage rows are already counted in the rollups when they are
+    stored, so removing them loses no usage totals. Returns the number of
+    rows deleted per kind.
+    """
+    now = now or timezone.now()
+    plan = (
+        ('api_usage', ApiUsage.objects.all(), settings.ANALYTICS_RAW_RETENTION_DAYS),
+        ('system_metrics', SystemMetrics.objects.all(), settings.ANALYTICS_METRICS_RETENTION_DAYS),
+        (
+            'minute_rollups',
+            UsageRollup.objects.filter(granularity=UsageRollup.GRANULARITY_MINUTE),
+            settings.ANALYTICS_MINUTE_ROLLUP_RETENTION_DAYS,
+        ),
+        (
+            'hour_rollups',
+            UsageRollup.objects.filter(granularity=UsageRollup.GRANULARITY_HOUR),
+            settings.ANALYTICS_HOUR_ROLLUP_RETENTION_DAYS,
+        ),
+    )
+    deleted = {}
+    for name, queryset, days in plan:
+        if not days:
+            continue
+        field = 'timestamp' if queryset.model is not UsageRollup else 'bucket'
+        expired = queryset.filter(**{f'{field}__lt': now - timedelta(days=days)})
+        deleted[name] = _delete_in_batches(expired)
+    logger.info(f'Compacted analytics: {deleted}')
+    return deleted
+
+
+def _delete_in_batches(queryset):
+    # Short deletes keep locks and WAL bursts small on large tables
+    total = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            return total
+        total += queryset.model.objects.filter(pk__in=ids).delete()[0]
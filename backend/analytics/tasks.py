@@ -0,0 +1,20 @@
+from celery import shared_task
+
+from .buffer import flush_events
+from .rollups import compact_analytics
+
+
+@shared_task
+def flush_analytics_events():
+    """
+    Write buffered analytics events to the database in batches.
+    """
+    return flush_events()
+
+
+@shared_task
+def compact_analytics_data():
+    """
+    Drop raw analytics events and fine-grained rollups past their retention.
+    """
+    return compact_analytics()
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .buffer import LocalEventBuffer, flush_events
+from .models import ApiUsage, SystemMetrics, UsageRollup
+from .rollups import bucket_start, compact_analytics, update_rollups
+
+
+def usage_event(user=None, endpoint='/api/documents/', status_code=200, response_time_ms=10.0, ts=None):
+    return {
+        'kind': 'usage', 'ts': ts or time.time(), 'user_id': str(user.pk) if user else None,
+        'endpoint': endpoint, 'method': 'GET', 'status_code': status_code, 'response_time_ms': response_time_ms,
+    }
+
+
+def rollup(granularity, user=None, endpoint=UsageRollup.ALL_ENDPOINTS):
+    return UsageRollup.objects.get(granularity=granularity, user=user, endpoint=endpoint)
+
+
+class FlushEventsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='usage@example.com', username='usage', password=None)
+        self.buffer = LocalEventBuffer(max_events=100)
+
+    def test_flush_writes_events_and_rollups(self):
+        self.buffer.append(usage_event(self.user, response_time_ms=10.0))
+        self.buffer.append(usage_event(self.user, status_code=500, response_time_ms=30.0))
+        self.buffer.append(usage_event(endpoint='/api/auth/login/', response_time_ms=5.0))
+        self.buffer.append({'kind': 'metric', 'ts': time.time(), 'name': 'queue.depth', 'value': 3.0})
+        self.buffer.append({'kind': 'unknown', 'ts': time.time()})
+
+        result = flush_events(self.buffer, batch_size=2)
+
+        self.assertEqual(result, {'written': 4, 'dropped': {}})
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(ApiUsage.objects.count(), 3)
+        self.assertTrue(SystemMetrics.objects.filter(name='queue.depth', value=3.0).exists())
+        for granularity in (UsageRollup.GRANULARITY_MINUTE, UsageRollup.GRANULARITY_HOUR, UsageRollup.GRANULARITY_DAY):
+            mine = rollup(granularity, self.user)
+            self.assertEqual((mine.count, mine.error_count, mine.total_ms, mine.max_ms), (2, 1, 40.0, 30.0))
+            self.assertEqual(rollup(granularity).count, 3)
+            self.assertEqual(rollup(granularity, endpoint='/api/auth/login/').count, 1)
+
+    def test_events_of_deleted_users_are_kept_anonymously(self):
+        ghost = get_user_model().objects.create_user(email='ghost@example.com', username='ghost', password=None)
+        self.buffer.append(usage_event(ghost))
+        ghost.delete()
+
+        flush_events(self.buffer)
+        self.assertIsNone(ApiUsage.objects.get().user_id)
+        self.assertEqual(rollup(UsageRollup.GRANULARITY_DAY).count, 1)
+
+    def test_drops_are_recorded(self):
+        buffer = LocalEventBuffer(max_events=1)
+        buffer.append(usage_event())
+        buffer.append(usage_event())
+
+        self.assertEqual(flush_events(buffer), {'written': 1, 'dropped': {'full': 1}})
+        self.assertEqual(SystemMetrics.objects.get(name='analytics.events_dropped').value, 1)
+
+    def test_failed_batch_is_requeued(self):
+        self.buffer.append(usage_event(self.user))
+        with mock.patch('analytics.buffer.update_rollups', side_effect=RuntimeError('database unavailable')):
+            with self.assertRaises(RuntimeError):
+                flush_events(self.buffer)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertFalse(ApiUsage.objects.exists())
+
+        flush_events(self.buffer)
+        self.assertEqual(rollup(UsageRollup.GRANULARITY_DAY, self.user).count, 1)
+
+
+class UpdateRollupsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='rollup@example.com', username='rollup', password=None)
+        self.now = timezone.now()
+
+    def usages(self, count, response_time_ms):
+        return [
+            ApiUsage(
+                user=self.user, endpoint='/api/chat/', method='POST', status_code=200,
+                response_time_ms=response_time_ms, timestamp=self.now,
+            )
+            for _ in range(count)
+        ]
+
+    def test_concurrent_flushes_add_to_the_same_rows(self):
+        bulk_create = UsageRollup.objects.bulk_create
+        interleaved = []
+
+        def create_then_interleave(*args, **kwargs):
+            created = bulk_create(*args, **kwargs)
+            if not interleaved:
+                # Another flush creates and increments the same rows before this one increments them
+                interleaved.append(True)
+                update_rollups(self.usages(3, 50.0))
+            return created
+
+        with mock.patch.object(UsageRollup.objects, 'bulk_create', side_effect=create_then_interleave):
+            update_rollups(self.usages(2, 20.0))
+
+        for user in (self.user, None):
+            row = rollup(UsageRollup.GRANULARITY_MINUTE, user, '/api/chat/')
+            self.assertEqual((row.count, row.total_ms, row.max_ms), (5, 190.0, 50.0))
+        self.assertEqual(UsageRollup.objects.filter(granularity=UsageRollup.GRANULARITY_MINUTE).count(), 4)
+
+    def test_later_batches_increment_existing_rows(self):
+        update_rollups(self.usages(2, 20.0))
+        update_rollups(self.usages(1, 5.0))
+        row = rollup(UsageRollup.GRANULARITY_DAY, self.user)
+        self.assertEqual((row.count, row.total_ms, row.max_ms), (3, 45.0, 20.0))
+
+
+@override_settings(
+    ANALYTICS_RAW_RETENTION_DAYS=7, ANALYTICS_MINUTE_ROLLUP_RETENTION_DAYS=2, ANALYTICS_HOUR_ROLLUP_RETENTION_DAYS=90,
+)
+class RetentionTests(TestCase):
+    def test_expired_events_and_fine_rollups_are_deleted(self):
+        now = timezone.now()
+        old, recent = now - timedelta(days=10), now - timedelta(days=1)
+        usages = [
+            ApiUsage.objects.create(
+                endpoint='/api/chat/', method='POST', status_code=200, response_time_ms=1.0, timestamp=moment,
+            )
+            for moment in (old, recent)
+        ]
+        update_rollups(usages)
+
+        with mock.patch('analytics.rollups.DELETE_BATCH_SIZE', 1):
+            deleted = compact_analytics(now)
+
+        self.assertEqual(deleted['api_usage'], 1)
+        self.assertEqual(deleted['minute_rollups'], 2)
+        self.assertEqual(deleted['hour_rollups'], 0)
+        self.assertEqual(list(ApiUsage.objects.values_list('timestamp', flat=True)), [recent])
+        minutes = UsageRollup.objects.filter(granularity=UsageRollup.GRANULARITY_MINUTE)
+        self.assertEqual(
+            set(minutes.values_list('bucket', flat=True)), {bucket_start(recent, UsageRollup.GRANULARITY_MINUTE)},
+        )
+        # Totals of the deleted events live on in the coarser rollups
+        days = UsageRollup.objects.filter(granularity=UsageRollup.GRANULARITY_DAY, endpoint=UsageRollup.ALL_ENDPOINTS)
+        self.assertEqual(sum(days.values_list('count', flat=True)), 2)
+
+
+class UsageViewTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(email='member@example.com', username='member', password=None)
+        self.admin = User.objects.create_user(email='admin@example.com', username='admin', password=None, role='admin')
+        update_rollups([
+            ApiUsage(user=self.user, endpoint='/api/chat/', method='POST', status_code=200, response_time_ms=12.0),
+        ])
+        self.client = APIClient()
+
+    def get(self, viewer, **params):
+        self.client.force_authenticate(viewer)
+        return self.client.get('/api/analytics/usage/', params)
+
+    def test_users_see_their_own_usage(self):
+        response = self.get(self.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], str(self.user.pk))
+        self.assertEqual(response.data['totals']['count'], 1)
+        self.assertEqual(self.get(self.user, user=str(self.admin.pk)).status_code, 403)
+
+    def test_admins_see_other_users_and_all(self):
+        response = self.get(self.admin, user=str(self.user.pk).upper())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], str(self.user.pk))
+        self.assertEqual(response.data['endpoints'][0]['endpoint'], '/api/chat/')
+        self.assertEqual(self.get(self.admin, user='all').data['totals']['count'], 1)
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.get(self.admin, user='not-a-uuid').status_code, 400)
+        self.assertEqual(self.get(self.user, user='42').status_code, 400)
+        self.assertEqual(self.get(self.user, period='year').status_code, 400)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import EventBufferView, UsageView
+
+urlpatterns = [
+    path('usage/', UsageView.as_view(), name='analytics-usage'),
+    path('buffer/', EventBufferView.as_view(), name='analytics-buffer'),
+]
@@ -1,3 +1,114 @@
-from django.shortcuts import render
+import uuid
 
-# Create your views here.
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+
+from users.permissions import IsAdmin
+from .buffer import RedisEventBuffer, get_event_buffer
+from .models import UsageRollup
+from .rollups import BUCKET_SIZES, bucket_start
+
+# period -> (rollup granularity, number of buckets)
+USAGE_PERIODS = {
+    'hour': (UsageRollup.GRANULARITY_MINUTE, 60),
+    'day': (UsageRollup.GRANULARITY_HOUR, 24),
+    'week': (UsageRollup.GRANULARITY_DAY, 7),
+    'month': (UsageRollup.GRANULARITY_DAY, 30),
+}
+
+
+def _summary(count, errors, total_ms, max_ms):
+    return {
+        'count': count,
+        'errors': errors,
+        'avg_ms': round(total_ms / count, 1) if count else None,
+        'max_ms': round(max_ms, 1),
+    }
+
+
+class UsageView(generics.GenericAPIView):
+    """
+    API usage over the last hour, day, week or month: totals, a time series
+    and a per-endpoint breakdown.
+
+    Reads only the pre-aggregated rollups at the granularity matching the
+    period, so the cost depends on the number of buckets and endpoints,
+    not on how much history is stored. Users see their own usage; admins
+    may pass ``user=<id>`` or ``user=all``. Buckets without calls are
+    omitted from the series.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        period = request.query_params.get('period', 'day')
+        if period not in USAGE_PERIODS:
+            return Response(
+                {'error': f'period must be one of {", ".join(USAGE_PERIODS)}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+        granularity, buckets = USAGE_PERIODS[period]
+
+        user = request.user
+        scope = str(user.pk)
+        requested = request.query_params.get('user')
+        if requested and requested != 'all':
+            try:
+                requested = str(uuid.UUID(requested))
+            except ValueError:
+                return Response({'error': "user must be a user id or 'all'"}, status=status.HTTP_400_BAD_REQUEST)
+        if requested and requested != scope:
+            if not IsAdmin().has_permission(request, self):
+                return Response({'error': 'Only admins can view other users'}, status=status.HTTP_403_FORBIDDEN)
+            scope = requested
+
+        since = bucket_start(timezone.now() - BUCKET_SIZES[granularity] * (buckets - 1), granularity)
+        rows = UsageRollup.objects.filter(granularity=granularity, bucket__gte=since)
+        rows = rows.filter(user=None) if scope == 'all' else rows.filter(user_id=scope)
+
+        series, endpoints = [], []
+        totals = [0, 0, 0.0, 0.0]
+        for row in rows.order_by('bucket').values_list('bucket', 'endpoint', 'count', 'error_count', 'total_ms', 'max_ms'):
+            bucket, endpoint, count, errors, total_ms, max_ms = row
+            if endpoint == UsageRollup.ALL_ENDPOINTS:
+                series.append({'bucket': bucket, **_summary(count, errors, total_ms, max_ms)})
+                totals = [totals[0] + count, totals[1] + errors, totals[2] + total_ms, max(totals[3], max_ms)]
+            else:
+                endpoints.append((endpoint, count, errors, total_ms, max_ms))
+
+        by_endpoint = {}
+        for endpoint, count, errors, total_ms, max_ms in endpoints:
+            entry = by_endpoint.setdefault(endpoint, [0, 0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += errors
+            entry[2] += total_ms
+            entry[3] = max(entry[3], max_ms)
+        return Response({
+            'period': period,
+            'granularity': granularity,
+            'since': since,
+            'user': scope,
+            'totals': _summary(*totals),
+            'series': series,
+            'endpoints': sorted(
+                ({'endpoint': endpoint, **_summary(*values)} for endpoint, values in by_endpoint.items()),
+                key=lambda entry: -entry['count'],
+            ),
+        })
+
+
+class EventBufferView(generics.GenericAPIView):
+    """
+    Backlog of the analytics event buffer, for spotting a stalled flush
+    before events start being dropped.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        buffer = get_event_buffer()
+        return Response({
+            'backend': 'redis' if isinstance(buffer, RedisEventBuffer) else 'local',
+            'queued': len(buffer),
+            'max_events': buffer.max_events,
+            'flush_interval_seconds': settings.ANALYTICS_FLUSH_INTERVAL_SECONDS,
+        })
@@ -1,3 +1,4 @@
+import logging
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analytics.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -68,7 +70,10 @@ TEMPLATES = [
     },
 ]
 
+# Serve through ASGI (e.g. uvicorn backend.asgi:application) so the SSE endpoints stream
+# from async generators; under WSGI they fall back to generators that hold a worker thread
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Database
 DATABASES = {
@@ -109,8 +114,14 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # File upload settings
+# Uploaded files are always streamed to a temporary file on disk in small
+# chunks instead of being buffered in memory, so large reports do not inflate
+# worker RSS. DATA_UPLOAD_MAX_MEMORY_SIZE only applies to non-file form data.
 DATA_UPLOAD_MAX_MEMORY_SIZE = 20971520  # 20MB for development
-FILE_UPLOAD_MAX_MEMORY_SIZE = 20971520  # 20MB for development
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', '1048576'))  # 1MB
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -118,7 +129,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings with more permissive settings for development
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',  # Added for dev convenience
     ],
@@ -127,9 +138,10 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Atomic Redis sliding-window counters; same rate strings as DRF's throttles
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'users.throttling.AnonRateThrottle',
+        'users.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '1000/day',  # More generous for development
@@ -149,8 +161,24 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
     'JTI_CLAIM': 'jti',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
 }
 
+# Users resolved from access tokens are cached (users.authentication): a short
+# process-local LRU in front of Redis. Changes reach other processes within the local TTL.
+USER_CACHE_LOCAL_TTL = float(os.environ.get('USER_CACHE_LOCAL_TTL', '5'))
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', '300'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))  # per process
+
+# Refresh tokens are checked against a Bloom filter of blacklisted JTIs (users.blacklist)
+# shared through Redis; only filter hits query the blacklist table
+TOKEN_BLACKLIST_BLOOM_ENABLED = os.environ.get('TOKEN_BLACKLIST_BLOOM_ENABLED', 'True') == 'True'
+TOKEN_BLACKLIST_BLOOM_CAPACITY = int(os.environ.get('TOKEN_BLACKLIST_BLOOM_CAPACITY', '1000000'))
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = float(os.environ.get('TOKEN_BLACKLIST_BLOOM_ERROR_RATE', '0.001'))
+TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS = float(os.environ.get('TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS', '1'))  # max staleness
+# Expired outstanding/blacklisted tokens deleted per statement by users.tasks.flush_expired_tokens
+TOKEN_CLEANUP_BATCH_SIZE = int(os.environ.get('TOKEN_CLEANUP_BATCH_SIZE', '5000'))
+
 # CORS settings - more permissive for development
 CORS_ALLOWED_ORIGINS = os.environ.get(
     'CORS_ALLOWED_ORIGINS', 
@@ -166,7 +194,38 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
-CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'True') == 'True'  # Run tasks synchronously in development
+# Set CELERY_TASK_ALWAYS_EAGER=True to run tasks inline without a worker (tests: CELERY_BROKER_URL=memory://,
+# CELERY_RESULT_BACKEND=cache+memory://). Chords need a result backend.
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+# Bulk ingestion and query-time work use separate queues so uploads never starve interactive tasks:
+#   celery -A backend worker -Q interactive -c 4
+#   celery -A backend worker -Q ingestion -c 8
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    'documents.tasks.*': {'queue': 'ingestion'},
+    'rag.tasks.*': {'queue': 'ingestion'},
+    'conversation.tasks.*': {'queue': 'interactive'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'reindex-dirty-documents': {
+        'task': 'documents.tasks.reindex_dirty_documents',
+        'schedule': float(os.environ.get('DOCUMENT_REINDEX_INTERVAL_SECONDS', '300')),
+    },
+    'flush-analytics-events': {
+        'task': 'analytics.tasks.flush_analytics_events',
+        'schedule': float(os.environ.get('ANALYTICS_FLUSH_INTERVAL_SECONDS', '10')),
+    },
+    'compact-analytics-data': {
+        'task': 'analytics.tasks.compact_analytics_data',
+        'schedule': 3600.0,
+    },
+    'flush-expired-tokens': {
+        'task': 'users.tasks.flush_expired_tokens',
+        'schedule': float(os.environ.get('TOKEN_CLEANUP_INTERVAL_SECONDS', '3600')),
+    },
+}
 
 # Redis settings for local development
 CACHES = {
@@ -182,23 +241,176 @@ SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
 # Vector database settings
-VECTOR_DB_TYPE = os.environ.get('VECTOR_DB_TYPE', 'pgvector')
+VECTOR_DB_TYPE = os.environ.get('VECTOR_DB_TYPE', 'pgvector')  # 'pgvector' or 'faiss'
+# FAISS and keyword indexes are files written by the Celery workers and read by the web processes:
+# RAG_INDEX_DIR must be one volume shared by all of them (see docs/architecture/backend_architecture.md)
+RAG_INDEX_DIR = os.environ.get('RAG_INDEX_DIR', os.path.join(BASE_DIR, 'var', 'rag'))
+RAG_TOP_K = int(os.environ.get('RAG_TOP_K', '5'))
+
+# Hybrid retrieval: BM25 keyword index fused with vector results (reciprocal rank fusion).
+# Off by default unless RAG_INDEX_DIR is configured, since a node-local index is invisible to other hosts
+RAG_HYBRID_SEARCH = os.environ.get('RAG_HYBRID_SEARCH', str('RAG_INDEX_DIR' in os.environ)) == 'True'
+RAG_CANDIDATES = int(os.environ.get('RAG_CANDIDATES', '20'))  # per-leg candidates before fusion
+RAG_RRF_K = int(os.environ.get('RAG_RRF_K', '60'))
+RAG_SEARCH_WORKERS = int(os.environ.get('RAG_SEARCH_WORKERS', '8'))
+# Per-stage time budgets (seconds) for the query orchestrator; late stages are skipped
+RAG_EMBED_TIMEOUT = float(os.environ.get('RAG_EMBED_TIMEOUT', '2.0'))
+RAG_SEARCH_TIMEOUT = float(os.environ.get('RAG_SEARCH_TIMEOUT', '1.5'))
+RAG_CACHE_LOOKUP_TIMEOUT = float(os.environ.get('RAG_CACHE_LOOKUP_TIMEOUT', '0.3'))
+RAG_DB_STAGE_TIMEOUT = float(os.environ.get('RAG_DB_STAGE_TIMEOUT', '1.0'))
+# Query orchestrator pool: up to six stages of a request run at once, so size it for the
+# concurrent requests a process serves x 6. Budgets start when a stage gets a thread; a stage
+# still queued after RAG_STAGE_QUEUE_TIMEOUT seconds is skipped
+RAG_STAGE_WORKERS = int(os.environ.get('RAG_STAGE_WORKERS', '48'))
+RAG_STAGE_QUEUE_TIMEOUT = float(os.environ.get('RAG_STAGE_QUEUE_TIMEOUT', '2.0'))
+# Optional cross-encoder rerank: RAG_RERANK_CANDIDATES retrieved chunks are scored in one CPU
+# batch and the best RAG_RERANK_TOP_N kept; past the budget the retrieval order (RAG_TOP_K) is used
+RAG_RERANK_ENABLED = os.environ.get('RAG_RERANK_ENABLED', 'False') == 'True'
+RAG_RERANK_MODEL = os.environ.get('RAG_RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RAG_RERANK_CANDIDATES = int(os.environ.get('RAG_RERANK_CANDIDATES', '20'))
+RAG_RERANK_TOP_N = int(os.environ.get('RAG_RERANK_TOP_N', '3'))
+RAG_RERANK_MAX_LENGTH = int(os.environ.get('RAG_RERANK_MAX_LENGTH', '256'))  # tokens per query + chunk pair
+RAG_RERANK_BUDGET_MS = float(os.environ.get('RAG_RERANK_BUDGET_MS', '250'))
+RAG_RERANK_WORKERS = int(os.environ.get('RAG_RERANK_WORKERS', '1'))
+# Searches are pre-filtered by the chunks the user may see (and the requested category), kept as
+# per-access-group and per-category chunk sets in each process (rag.chunk_filter); at most this many
+RAG_FILTER_MAX_SETS = int(os.environ.get('RAG_FILTER_MAX_SETS', '512'))
+# Filters allowing this many chunks or fewer are searched exhaustively instead of through the ANN index
+RAG_FILTER_EXACT_MAX_CHUNKS = int(os.environ.get('RAG_FILTER_EXACT_MAX_CHUNKS', '20000'))
+# Larger filters widen the ANN search (nprobe/efSearch, or over-fetch with pgvector) by the share of
+# the index they exclude, up to this factor; filters more selective than that are searched exhaustively
+RAG_FILTER_MAX_BOOST = int(os.environ.get('RAG_FILTER_MAX_BOOST', '16'))
+BM25_K1 = float(os.environ.get('BM25_K1', '1.2'))
+BM25_B = float(os.environ.get('BM25_B', '0.75'))
+KEYWORD_MAX_SEGMENTS = int(os.environ.get('KEYWORD_MAX_SEGMENTS', '32'))
+
+# FAISS backend (VECTOR_DB_TYPE=faiss)
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'hnsw')  # 'hnsw', 'ivf' or 'flat'
+FAISS_NLIST = int(os.environ.get('FAISS_NLIST', '4096'))
+FAISS_NPROBE = int(os.environ.get('FAISS_NPROBE', '16'))
+FAISS_IVF_MIN_VECTORS = int(os.environ.get('FAISS_IVF_MIN_VECTORS', '10000'))  # exact search below this
+FAISS_RETRAIN_FACTOR = float(os.environ.get('FAISS_RETRAIN_FACTOR', '4'))
+FAISS_HNSW_M = int(os.environ.get('FAISS_HNSW_M', '32'))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.environ.get('FAISS_HNSW_EF_CONSTRUCTION', '80'))
+FAISS_HNSW_EF_SEARCH = int(os.environ.get('FAISS_HNSW_EF_SEARCH', '64'))
+# Compressed codes in the main segment: 'none', 'int8' (4x smaller) or 'binary' (32x smaller).
+# Float32 vectors stay on disk and rescore FAISS_RESCORE_FACTOR * k candidates per search.
+FAISS_QUANTIZATION = os.environ.get('FAISS_QUANTIZATION', 'none')
+FAISS_RESCORE_FACTOR = int(os.environ.get('FAISS_RESCORE_FACTOR', '4'))
+# Compaction into the main segment is queued once either limit is reached
+FAISS_MAX_DELTA_SEGMENTS = int(os.environ.get('FAISS_MAX_DELTA_SEGMENTS', '32'))
+FAISS_MAX_DELTA_VECTORS = int(os.environ.get('FAISS_MAX_DELTA_VECTORS', '50000'))
 
 # Embedding model settings - smaller model for development
 EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
 EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '384'))
+# Micro-batching: concurrent encode requests are gathered until either limit is hit
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get('EMBEDDING_MAX_BATCH_SIZE', '32'))
+EMBEDDING_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_MAX_WAIT_MS', '5'))
+
+# Content-addressed embedding cache: Redis (CACHES['default']) first, then a
+# size-bounded local SQLite file. Vectors are stored as raw float16/float32 bytes.
+EMBEDDING_CACHE_ENABLED = os.environ.get('EMBEDDING_CACHE_ENABLED', 'True') == 'True'
+EMBEDDING_CACHE_DTYPE = os.environ.get('EMBEDDING_CACHE_DTYPE', 'float16')
+EMBEDDING_CACHE_TIMEOUT = int(os.environ.get('EMBEDDING_CACHE_TIMEOUT', str(30 * 24 * 3600)))  # 30 days
+EMBEDDING_CACHE_LOCAL_PATH = os.environ.get('EMBEDDING_CACHE_LOCAL_PATH', os.path.join(BASE_DIR, 'var', 'embedding_cache.sqlite3'))
+EMBEDDING_CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_LOCAL_MAX_ENTRIES', '500000'))
 
 # LLM API settings
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-pro')  # or 'gemini-1.0-pro' for faster responses in dev
+GEMINI_API_BASE_URL = os.environ.get('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+GEMINI_TIMEOUT_SECONDS = float(os.environ.get('GEMINI_TIMEOUT_SECONDS', '30'))
+
+# Conversation settings
+CONVERSATION_HISTORY_MESSAGES = int(os.environ.get('CONVERSATION_HISTORY_MESSAGES', '10'))  # verbatim window
+# Rolling summary: older messages are folded in by a background task once this many have left the window
+CONVERSATION_SUMMARY_THRESHOLD = int(os.environ.get('CONVERSATION_SUMMARY_THRESHOLD', '6'))
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.environ.get('CONVERSATION_SUMMARY_MAX_TOKENS', '400'))
+# Hard token budget for the prompt: summary, history window, excerpts and question
+RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get('RAG_CONTEXT_TOKEN_BUDGET', '6000'))
+
+# Semantic answer cache: reuse answers to near-identical questions within the same access scope
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'True') == 'True'
+ANSWER_CACHE_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', '0.92'))  # cosine similarity
+ANSWER_CACHE_TIMEOUT = int(os.environ.get('ANSWER_CACHE_TIMEOUT', '86400'))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '2000'))  # per access scope
+ANSWER_CACHE_LOCAL_SCOPES = int(os.environ.get('ANSWER_CACHE_LOCAL_SCOPES', '32'))  # scope matrices kept per process
+
 
-# Document processing settings - smaller chunks for faster processing in dev
-MAX_CHUNK_SIZE = int(os.environ.get('MAX_CHUNK_SIZE', '800'))
-CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', '100'))
+def _chunk_tokens(name, legacy_name, default):
+    # MAX_CHUNK_SIZE/CHUNK_OVERLAP counted characters; map them at about four characters per token
+    legacy = os.environ.get(legacy_name)
+    if legacy is None:
+        return int(os.environ.get(name, default))
+    if name in os.environ:
+        logging.getLogger(__name__).warning(f'{legacy_name} is no longer used and is ignored in favour of {name}')
+        return int(os.environ[name])
+    tokens = max(1, int(legacy) // 4)
+    logging.getLogger(__name__).warning(
+        f'{legacy_name}={legacy} (characters) is deprecated; using {name}={tokens}. Set {name} instead'
+    )
+    return tokens
+
+
+# Document processing settings. Chunks follow headings, paragraphs and tables and are sized in
+# tokens; keep CHUNK_MAX_TOKENS within the embedding model's sequence length (256 for MiniLM)
+CHUNK_MAX_TOKENS = _chunk_tokens('CHUNK_MAX_TOKENS', 'MAX_CHUNK_SIZE', '200')
+CHUNK_OVERLAP_TOKENS = _chunk_tokens('CHUNK_OVERLAP_TOKENS', 'CHUNK_OVERLAP', '30')  # between pieces of a split paragraph
+# Near-duplicate chunks across the corpus (MinHash/LSH over word trigrams) are embedded and indexed once;
+# chunks whose figures differ in any way are never treated as duplicates
+CHUNK_DEDUP_ENABLED = os.environ.get('CHUNK_DEDUP_ENABLED', 'True') == 'True'
+CHUNK_DEDUP_THRESHOLD = float(os.environ.get('CHUNK_DEDUP_THRESHOLD', '0.9'))  # estimated Jaccard similarity
+# Number of chunks embedded and written to the database per batch while a
+# document streams through the pipeline; bounds memory per document.
+DOCUMENT_EMBED_BATCH_SIZE = int(os.environ.get('DOCUMENT_EMBED_BATCH_SIZE', '64'))
+# PDFs longer than this are split into page ranges ingested in parallel
+DOCUMENT_PAGES_PER_TASK = int(os.environ.get('DOCUMENT_PAGES_PER_TASK', '25'))
+# Documents queued for incremental re-indexing per scheduled run
+DOCUMENT_REINDEX_BATCH_SIZE = int(os.environ.get('DOCUMENT_REINDEX_BATCH_SIZE', '20'))
+# Numeric tables are detected per page and stored column-wise for exact lookups and aggregates
+DOCUMENT_EXTRACT_TABLES = os.environ.get('DOCUMENT_EXTRACT_TABLES', 'True') == 'True'
+TABLE_MIN_ROWS = int(os.environ.get('TABLE_MIN_ROWS', '3'))
+TABLE_QUERY_ENABLED = os.environ.get('TABLE_QUERY_ENABLED', 'True') == 'True'
+# OCR (tesseract) of PDF pages without a text layer, in a pool of OCR_WORKERS processes per
+# ingestion worker (0 runs OCR in the worker itself). Output is cached by page-image hash.
+OCR_ENABLED = os.environ.get('OCR_ENABLED', 'True') == 'True'
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', '2'))
+OCR_LANGUAGE = os.environ.get('OCR_LANGUAGE', 'eng')
+OCR_MIN_TEXT_CHARS = int(os.environ.get('OCR_MIN_TEXT_CHARS', '20'))  # fewer extracted characters: image-only page
+OCR_MIN_IMAGE_PIXELS = int(os.environ.get('OCR_MIN_IMAGE_PIXELS', '250000'))  # smaller images are not OCRed
+OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', '300'))  # page images are resampled to this resolution
+OCR_MAX_PIXELS = int(os.environ.get('OCR_MAX_PIXELS', '12000000'))
+OCR_PAGE_TIMEOUT = float(os.environ.get('OCR_PAGE_TIMEOUT', '120'))
+OCR_CACHE_TIMEOUT = int(os.environ.get('OCR_CACHE_TIMEOUT', str(30 * 24 * 3600)))  # 30 days
+
+# Storage settings
+DOCUMENT_STORAGE_PATH = os.environ.get('DOCUMENT_STORAGE_PATH', os.path.join(MEDIA_ROOT, 'documents'))
+DOCUMENT_MAX_SIZE_MB = int(os.environ.get('DOCUMENT_MAX_SIZE_MB', '50'))
 
 # Email settings - Use console backend for development
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Per-request stage timings, SQL and cache counters (analytics.middleware)
+REQUEST_METRICS_ENABLED = os.environ.get('REQUEST_METRICS_ENABLED', 'True') == 'True'
+REQUEST_METRICS_HEADERS = os.environ.get('REQUEST_METRICS_HEADERS', str(DEBUG)) == 'True'  # Server-Timing headers
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '0.01'))  # stored as SystemMetrics
+REQUEST_METRICS_SLOW_MS = float(os.environ.get('REQUEST_METRICS_SLOW_MS', '3000'))  # always stored above this
+
+# Analytics events (API usage, sampled metrics) are appended to a bounded buffer
+# and written in batches by analytics.tasks.flush_analytics_events
+ANALYTICS_USAGE_ENABLED = os.environ.get('ANALYTICS_USAGE_ENABLED', 'True') == 'True'  # one ApiUsage row per API call
+ANALYTICS_BUFFER_BACKEND = os.environ.get('ANALYTICS_BUFFER_BACKEND', 'redis')  # or 'local' (per process)
+ANALYTICS_BUFFER_MAX_EVENTS = int(os.environ.get('ANALYTICS_BUFFER_MAX_EVENTS', '100000'))  # dropped beyond this
+ANALYTICS_FLUSH_INTERVAL_SECONDS = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL_SECONDS', '10'))
+ANALYTICS_FLUSH_BATCH_SIZE = int(os.environ.get('ANALYTICS_FLUSH_BATCH_SIZE', '1000'))
+ANALYTICS_FLUSH_MAX_BATCHES = int(os.environ.get('ANALYTICS_FLUSH_MAX_BATCHES', '50'))  # per flush run
+# Retention in days (0 keeps forever); usage totals live on in the coarser rollups
+ANALYTICS_RAW_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RAW_RETENTION_DAYS', '7'))  # ApiUsage rows
+ANALYTICS_METRICS_RETENTION_DAYS = int(os.environ.get('ANALYTICS_METRICS_RETENTION_DAYS', '30'))  # SystemMetrics rows
+ANALYTICS_MINUTE_ROLLUP_RETENTION_DAYS = int(os.environ.get('ANALYTICS_MINUTE_ROLLUP_RETENTION_DAYS', '2'))
+ANALYTICS_HOUR_ROLLUP_RETENTION_DAYS = int(os.environ.get('ANALYTICS_HOUR_ROLLUP_RETENTION_DAYS', '90'))
+
 # Logging - More verbose for development
 LOGGING = {
     'version': 1,
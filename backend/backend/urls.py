@@ -32,6 +32,7 @@ urlpatterns = [
     path('api/documents/', include('documents.urls')),
     path('api/conversations/', include('conversation.urls')),
     path('api/analytics/', include('analytics.urls')),
+    path('api/rag/', include('rag.urls')),
 ]
 
 # Serve media files in development
@@ -1,3 +1,17 @@
 from django.contrib import admin
+from .models import Conversation, Message
 
-# Register your models here.
+
+class MessageInline(admin.TabularInline):
+    model = Message
+    extra = 0
+    fields = ('is_user', 'content', 'created_at')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ('title', 'user', 'created_at', 'updated_at')
+    search_fields = ('title', 'user__email')
+    readonly_fields = ('summary', 'summarized_until')
+    inlines = (MessageInline,)
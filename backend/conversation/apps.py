@@ -1,6 +1,6 @@
 from django.apps import AppConfig
 
 
-class ConversatioConfig(AppConfig):
+class ConversationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'conversatio'
+    name = 'conversation'
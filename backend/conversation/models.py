@@ -1,3 +1,52 @@
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class Conversation(models.Model):
+    """
+    A message thread between a user and the RAG assistant.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations')
+    title = models.CharField(max_length=255, blank=True)
+    # Rolling summary of every message up to and including summarized_until;
+    # later messages are sent verbatim
+    summary = models.TextField(blank=True)
+    summarized_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+        indexes = [
+            # Keyset pagination of a user's conversations
+            models.Index(fields=['user', 'updated_at', 'id']),
+        ]
+
+    def __str__(self):
+        return self.title or str(self.id)
+
+
+class Message(models.Model):
+    """
+    A single user question or assistant answer within a conversation.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
+    content = models.TextField()
+    is_user = models.BooleanField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    doc_references = models.JSONField(default=list, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Keyset pagination of a conversation's messages
+            models.Index(fields=['conversation', 'created_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{"User" if self.is_user else "Assistant"}: {self.content[:50]}'
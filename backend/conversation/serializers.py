@@ -0,0 +1,24 @@
+from rest_framework import serializers
+
+from documents.models import Category
+from .models import Conversation, Message
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'conversation', 'content', 'is_user', 'created_at', 'doc_references', 'metadata']
+        read_only_fields = fields
+
+
+class MessageCreateSerializer(serializers.Serializer):
+    content = serializers.CharField(max_length=4000, trim_whitespace=True)
+    # Search only documents in this category and its subcategories
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False, allow_null=True)
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Conversation
+        fields = ['id', 'title', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
@@ -0,0 +1,250 @@
+import functools
+import logging
+import time
+from dataclasses import dataclass, field
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from rag.answer_cache import get_answer_cache
+from rag.context_builder import (
+    SUMMARY_INSTRUCTION, SYSTEM_INSTRUCTION, build_prompt, build_references, build_summary_prompt, pack_context,
+)
+from rag.llm_integration import get_llm_client
+from rag.orchestrator import QueryOrchestrator
+from utils.text_processors import iter_batches
+from utils.timing import stage
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AnswerPlan:
+    """
+    Everything needed to produce an answer, computed before the LLM call.
+
+    ``cached`` holds a semantic-cache entry when the question can be answered
+    without retrieval or generation; otherwise ``prompt`` is ready to send.
+    """
+    question: str
+    query_vector: object
+    scope: str = None
+    history: list = field(default_factory=list)
+    summary: str = ''
+    retrieved: list = field(default_factory=list)
+    references: list = field(default_factory=list)
+    prompt: str = ''
+    cached: dict = None
+    table_answer: object = None
+    rerank: dict = None
+    stages: dict = field(default_factory=dict)
+    degraded: list = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    def metadata(self, **values):
+        """
+        Message metadata with the elapsed time and per-stage breakdown.
+        """
+        values['latency_ms'] = round((time.perf_counter() - self.started) * 1000, 1)
+        values['stages'] = self.stages
+        if self.rerank is not None:
+            values['rerank'] = self.rerank
+        if self.degraded:
+            values['degraded'] = self.degraded
+        return values
+
+
+def recent_history(conversation, limit=None, exclude=None):
+    """
+    The verbatim history window: the latest messages not yet in the summary.
+    """
+    limit = limit or settings.CONVERSATION_HISTORY_MESSAGES
+    messages = conversation.messages.order_by('-created_at')
+    if conversation.summarized_until is not None:
+        messages = messages.filter(created_at__gt=conversation.summarized_until)
+    if exclude is not None:
+        messages = messages.exclude(pk=exclude)
+    return list(reversed(messages[:limit]))
+
+
+async def aplan_answer(conversation, question, user, history=None, exclude=None, category=None):
+    """
+    Prepare an answer: embedding, answer-cache lookup, retrieval and history
+    loading run concurrently through the query orchestrator, then the rolling
+    summary, history window and excerpts are packed into the token budget.
+    ``exclude`` keeps the just-saved user message out of history; with
+    ``category`` only documents in that category are searched. Follow-up
+    turns (with history or a summary) skip the answer cache, since a cached
+    standalone answer may be to a different question.
+    """
+    started = time.perf_counter()
+    load_history = None if history is not None else functools.partial(recent_history, conversation, exclude=exclude)
+    cacheable = not conversation.summary and not history
+    context = await QueryOrchestrator().run(
+        question, user, load_history=load_history, category=category, cacheable=cacheable,
+    )
+
+    plan = AnswerPlan(
+        question=question,
+        query_vector=context.query_vector,
+        scope=context.scope,
+        history=context.history if history is None else history,
+        retrieved=context.retrieved,
+        cached=context.cached,
+        table_answer=context.table_answer,
+        rerank=context.rerank,
+        stages=context.stages,
+        degraded=context.degraded,
+        started=started,
+    )
+    if plan.cached is not None:
+        plan.references = plan.cached['references']
+        return plan
+    if plan.table_answer is not None:
+        plan.references = plan.table_answer.references
+        return plan
+    with stage('prompt'):
+        packed = pack_context(question, plan.retrieved, plan.history, conversation.summary)
+        plan.retrieved, plan.history, plan.summary = packed.retrieved, packed.history, packed.summary
+        plan.stages['prompt_tokens'] = packed.tokens
+        plan.references = build_references(plan.retrieved)
+        plan.prompt = build_prompt(question, plan.retrieved, plan.history, plan.summary)
+    return plan
+
+
+def plan_answer(conversation, question, user, history=None, exclude=None, category=None):
+    return async_to_sync(aplan_answer)(conversation, question, user, history, exclude, category)
+
+
+def remember_answer(plan, answer, metadata):
+    """
+    Store a freshly generated answer in the semantic answer cache.
+    """
+    answer_cache = get_answer_cache()
+    if answer_cache is None or plan.cached is not None or plan.table_answer is not None or plan.scope is None or plan.query_vector is None:
+        return
+    # Answers that depend on earlier turns, or built from degraded retrieval, are not reusable
+    if not plan.history and not plan.summary and not plan.degraded and answer:
+        answer_cache.store(plan.scope, plan.question, plan.query_vector, answer, plan.references, metadata)
+
+
+def direct_answer(plan):
+    """
+    Return ``(answer, metadata)`` when the plan needs no LLM call, else ``None``.
+    """
+    if plan.cached is not None:
+        return plan.cached['answer'], plan.metadata(cache_hit=True, similarity=round(plan.cached['similarity'], 4))
+    if plan.table_answer is not None:
+        table = {'operation': plan.table_answer.operation, 'value': plan.table_answer.value}
+        return plan.table_answer.answer, plan.metadata(cache_hit=False, table_answer=table)
+    return None
+
+
+def generate_answer(conversation, question, user, history=None, exclude=None, category=None):
+    """
+    Answer a question with retrieval-augmented generation.
+
+    Lookup and aggregation questions over stored tables, and questions close
+    enough to one answered before within the same access scope (semantic
+    answer cache), are answered without retrieval or an LLM call. Returns
+    ``(answer, references, metadata)``.
+    """
+    plan = plan_answer(conversation, question, user, history, exclude, category)
+    direct = direct_answer(plan)
+    if direct is not None:
+        answer, metadata = direct
+        return answer, plan.references, metadata
+
+    with stage('llm') as timer:
+        answer, usage = get_llm_client().generate(plan.prompt, system_instruction=SYSTEM_INSTRUCTION)
+    plan.stages['generate'] = round(timer.ms, 1)
+    metadata = plan.metadata(cache_hit=False, tokens_used=usage.get('totalTokenCount', 0))
+    remember_answer(plan, answer, metadata)
+    return answer, plan.references, metadata
+
+
+def save_assistant_message(conversation, question, answer, references, metadata):
+    """
+    Persist the assistant reply and touch the conversation.
+    """
+    with transaction.atomic():
+        message = Message.objects.create(
+            conversation=conversation,
+            content=answer,
+            is_user=False,
+            doc_references=references,
+            metadata=metadata,
+        )
+        fields = {'updated_at': timezone.now()}
+        if not conversation.title:
+            fields['title'] = question[:100]
+        Conversation.objects.filter(pk=conversation.pk).update(**fields)
+        transaction.on_commit(lambda: schedule_summary_refresh(conversation))
+    return message
+
+
+def summary_refresh_key(conversation_id):
+    return f'conversation:summary:{conversation_id}'
+
+
+def schedule_summary_refresh(conversation):
+    """
+    Queue a summary refresh once enough messages have left the history window.
+    """
+    unsummarized = conversation.messages.all()
+    if conversation.summarized_until is not None:
+        unsummarized = unsummarized.filter(created_at__gt=conversation.summarized_until)
+    overflow = unsummarized.count() - settings.CONVERSATION_HISTORY_MESSAGES
+    if overflow < settings.CONVERSATION_SUMMARY_THRESHOLD:
+        return
+
+    from .tasks import refresh_conversation_summary
+
+    # Only one refresh per conversation in flight
+    if cache.add(summary_refresh_key(conversation.pk), True, timeout=600):
+        refresh_conversation_summary.delay(str(conversation.pk))
+
+
+def update_summary(conversation, batch_size=20):
+    """
+    Fold messages that have left the history window into the rolling summary.
+
+    Only messages newer than ``summarized_until`` are sent to the LLM, a
+    batch at a time, so the cost of a refresh does not grow with the thread.
+    """
+    messages = conversation.messages.order_by('created_at')
+    if conversation.summarized_until is not None:
+        messages = messages.filter(created_at__gt=conversation.summarized_until)
+    messages = list(messages)[:-settings.CONVERSATION_HISTORY_MESSAGES]
+    if not messages:
+        return conversation.summary
+
+    summary = conversation.summary
+    for batch in iter_batches(messages, batch_size):
+        text, _ = get_llm_client().generate(build_summary_prompt(summary, batch), system_instruction=SUMMARY_INSTRUCTION)
+        summary = text.strip()
+
+    # Conditional on summarized_until so a concurrent refresh cannot be overwritten by a stale one
+    updated = Conversation.objects.filter(
+        pk=conversation.pk, summarized_until=conversation.summarized_until,
+    ).update(summary=summary, summarized_until=messages[-1].created_at)
+    if updated:
+        conversation.summary, conversation.summarized_until = summary, messages[-1].created_at
+        logger.info(f'Summarized {len(messages)} messages of conversation {conversation.pk}')
+    return conversation.summary
+
+
+def send_message(conversation, content, user, category=None):
+    """
+    Store a user message, generate the assistant reply and store it.
+    """
+    user_message = Message.objects.create(conversation=conversation, content=content, is_user=True)
+    answer, references, metadata = generate_answer(
+        conversation, content, user, exclude=user_message.pk, category=category,
+    )
+    assistant_message = save_assistant_message(conversation, content, answer, references, metadata)
+    return user_message, assistant_message
@@ -0,0 +1,140 @@
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+
+from rag.context_builder import SYSTEM_INSTRUCTION
+from rag.llm_integration import LLMError, get_llm_client
+from .serializers import MessageSerializer
+from .services import aplan_answer, direct_answer, plan_answer, remember_answer, save_assistant_message
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event, data):
+    """
+    Encode one server-sent event.
+    """
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+PREPARE_FAILED = 'Failed to retrieve context for this question.'
+LLM_UNAVAILABLE = 'The answer service is temporarily unavailable. Please try again shortly.'
+
+
+def _sources_event(plan):
+    return sse_event('sources', {'references': plan.references, 'cache_hit': plan.cached is not None})
+
+
+def _streamed_metadata(plan, usage, ttft, started):
+    plan.stages['generate'] = round((time.perf_counter() - started) * 1000, 1)
+    return plan.metadata(
+        cache_hit=False,
+        streamed=True,
+        tokens_used=usage.get('totalTokenCount', 0),
+        ttft_ms=round((ttft if ttft is not None else time.perf_counter() - plan.started) * 1000, 1),
+    )
+
+
+def _first_token(plan, started):
+    plan.stages['first_token'] = round((time.perf_counter() - started) * 1000, 1)
+    return time.perf_counter() - plan.started
+
+
+def _done_event(conversation, message, metadata):
+    logger.info(f'Streamed answer for conversation {conversation.pk}: '
+                f'ttft {metadata["ttft_ms"]} ms, total {metadata["latency_ms"]} ms')
+    return sse_event('done', {'message': MessageSerializer(message).data})
+
+
+async def stream_answer(conversation, question, user, exclude=None, category=None):
+    """
+    Async generator producing the SSE stream for one answer, for ASGI.
+
+    Emits a ``sources`` event as soon as retrieval is done, one ``token``
+    event per LLM fragment, then ``done`` with the persisted message. The
+    assistant message is written once, after the last token. Time to first
+    token and total latency are recorded separately in the message metadata.
+    """
+    try:
+        plan = await aplan_answer(conversation, question, user, exclude=exclude, category=category)
+    except Exception:
+        logger.exception('Answer preparation failed')
+        yield sse_event('error', {'detail': PREPARE_FAILED})
+        return
+
+    yield _sources_event(plan)
+
+    direct = direct_answer(plan)
+    if direct is not None:
+        answer, metadata = direct
+        metadata['ttft_ms'] = metadata['latency_ms']
+        yield sse_event('token', {'text': answer})
+    else:
+        fragments = []
+        usage = {}
+        ttft = None
+        started = time.perf_counter()
+        try:
+            async for fragment in get_llm_client().astream(plan.prompt, SYSTEM_INSTRUCTION, usage=usage):
+                if ttft is None:
+                    ttft = _first_token(plan, started)
+                fragments.append(fragment)
+                yield sse_event('token', {'text': fragment})
+        except LLMError:
+            yield sse_event('error', {'detail': LLM_UNAVAILABLE})
+            return
+
+        answer = ''.join(fragments)
+        metadata = _streamed_metadata(plan, usage, ttft, started)
+        await sync_to_async(remember_answer)(plan, answer, metadata)
+
+    message = await sync_to_async(save_assistant_message)(conversation, question, answer, plan.references, metadata)
+    yield _done_event(conversation, message, metadata)
+
+
+def iter_answer(conversation, question, user, exclude=None, category=None):
+    """
+    ``stream_answer`` as a plain generator, for WSGI.
+
+    WSGI servers cannot send an async iterator as it is produced (Django
+    collects it into one response first), so this runs the same steps
+    with blocking calls on the worker thread, which is held for the whole
+    answer.
+    """
+    try:
+        plan = plan_answer(conversation, question, user, exclude=exclude, category=category)
+    except Exception:
+        logger.exception('Answer preparation failed')
+        yield sse_event('error', {'detail': PREPARE_FAILED})
+        return
+
+    yield _sources_event(plan)
+
+    direct = direct_answer(plan)
+    if direct is not None:
+        answer, metadata = direct
+        metadata['ttft_ms'] = metadata['latency_ms']
+        yield sse_event('token', {'text': answer})
+    else:
+        fragments = []
+        usage = {}
+        ttft = None
+        started = time.perf_counter()
+        try:
+            for fragment in get_llm_client().stream(plan.prompt, SYSTEM_INSTRUCTION, usage=usage):
+                if ttft is None:
+                    ttft = _first_token(plan, started)
+                fragments.append(fragment)
+                yield sse_event('token', {'text': fragment})
+        except LLMError:
+            yield sse_event('error', {'detail': LLM_UNAVAILABLE})
+            return
+
+        answer = ''.join(fragments)
+        metadata = _streamed_metadata(plan, usage, ttft, started)
+        remember_answer(plan, answer, metadata)
+
+    message = save_assistant_message(conversation, question, answer, plan.references, metadata)
+    yield _done_event(conversation, message, metadata)
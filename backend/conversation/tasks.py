@@ -0,0 +1,25 @@
+import logging
+
+from celery import shared_task
+from django.core.cache import cache
+
+from .models import Conversation
+from .services import summary_refresh_key, update_summary
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_conversation_summary(conversation_id):
+    """
+    Fold messages that have left the history window into the conversation summary.
+    """
+    try:
+        conversation = Conversation.objects.get(pk=conversation_id)
+    except Conversation.DoesNotExist:
+        logger.warning(f'Conversation {conversation_id} no longer exists, skipping summary refresh')
+        return None
+    try:
+        return update_summary(conversation)
+    finally:
+        cache.delete(summary_refresh_key(conversation_id))
@@ -1,3 +1,88 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+
+from .models import Conversation, Message
+from .services import generate_answer
+
+
+class StubVectorStore:
+    def search(self, query_vector, k, allowed=None):
+        return []
+
+
+class StubRetriever:
+    """
+    Retriever over an empty corpus, so answers come from the (mocked) LLM or the answer cache.
+    """
+    top_k = 3
+    hybrid = False
+    reranker = None
+    vector_store = StubVectorStore()
+
+    def rerank_candidates(self, top_k):
+        return top_k
+
+    def chunk_filter(self, user, category=None):
+        return None
+
+    def load_visible_chunks(self, hits, user, category=None):
+        return []
+
+
+@override_settings(ANSWER_CACHE_ENABLED=True, TABLE_QUERY_ENABLED=False)
+class FollowUpCacheTests(TransactionTestCase):
+    """
+    Stages run on pool threads with their own connections, hence TransactionTestCase.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email='cache@example.com', username='cache', password=None)
+        # Every question embeds to the same vector: the worst case for a follow-up
+        vector = np.ones(settings.EMBEDDING_DIMENSION, dtype=np.float32) / np.sqrt(settings.EMBEDDING_DIMENSION)
+        self.llm = mock.Mock()
+        self.llm.generate.side_effect = lambda prompt, **kwargs: (f'answer {self.llm.generate.call_count}', {})
+        for target, value in (
+            ('rag.orchestrator.Retriever', StubRetriever),
+            ('rag.orchestrator.embed_query', lambda question: vector),
+            ('conversation.services.get_llm_client', lambda: self.llm),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def ask(self, conversation, question):
+        message = Message.objects.create(conversation=conversation, content=question, is_user=True)
+        answer, references, metadata = generate_answer(conversation, question, self.user, exclude=message.pk)
+        Message.objects.create(conversation=conversation, content=answer, is_user=False, metadata=metadata)
+        return answer, metadata
+
+    def test_follow_up_turn_skips_the_answer_cache(self):
+        conversation = Conversation.objects.create(user=self.user)
+        first, metadata = self.ask(conversation, 'What was CPI inflation in 2021?')
+        self.assertEqual(first, 'answer 1')
+        self.assertFalse(metadata['cache_hit'])
+
+        follow_up, metadata = self.ask(conversation, 'What about 2022?')
+        self.assertEqual(follow_up, 'answer 2')
+        self.assertFalse(metadata['cache_hit'])
+        self.assertNotIn('scope', metadata['stages'])
+        self.assertNotIn('cache_lookup', metadata['stages'])
+
+        # A new conversation asking the standalone question is still served from the cache
+        repeated, metadata = self.ask(Conversation.objects.create(user=self.user), 'What was CPI inflation in 2021?')
+        self.assertEqual(repeated, 'answer 1')
+        self.assertTrue(metadata['cache_hit'])
+        self.assertEqual(self.llm.generate.call_count, 2)
+
+    def test_summarized_conversation_skips_the_answer_cache(self):
+        self.ask(Conversation.objects.create(user=self.user), 'What was CPI inflation in 2021?')
+        conversation = Conversation.objects.create(user=self.user, summary='The user asked about CPI inflation.')
+        answer, metadata = self.ask(conversation, 'What was CPI inflation in 2021?')
+        self.assertEqual(answer, 'answer 2')
+        self.assertFalse(metadata['cache_hit'])
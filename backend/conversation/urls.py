@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import ConversationListCreateView, ConversationDetailView, MessageListCreateView, MessageStreamView
+
+urlpatterns = [
+    path('', ConversationListCreateView.as_view(), name='conversation-list'),
+    path('<uuid:pk>/', ConversationDetailView.as_view(), name='conversation-detail'),
+    path('<uuid:pk>/messages/', MessageListCreateView.as_view(), name='conversation-messages'),
+    path('<uuid:pk>/messages/stream/', MessageStreamView.as_view(), name='conversation-messages-stream'),
+]
@@ -1,3 +1,114 @@
-from django.shortcuts import render
+from rest_framework import generics, permissions, status, views
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
 
-# Create your views here.
+from rag.llm_integration import LLMError
+from utils.pagination import KeysetPagination
+from utils.sse import event_stream
+from utils.timing import stage
+from .models import Conversation, Message
+from .serializers import ConversationSerializer, MessageCreateSerializer, MessageSerializer
+from .services import send_message
+from .streaming import iter_answer, stream_answer
+
+
+class LLMUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The answer service is temporarily unavailable. Please try again shortly.'
+    default_code = 'llm_unavailable'
+
+
+class ConversationPagination(KeysetPagination):
+    # Most recently active first, as conversations are listed in the sidebar
+    ordering = ('-updated_at', '-id')
+
+
+class MessagePagination(KeysetPagination):
+    # Chronological, like the conversation reads
+    ordering = ('created_at', 'id')
+
+
+class ConversationListCreateView(generics.ListCreateAPIView):
+    """
+    List the user's conversations or start a new one
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ConversationPagination
+
+    def get_queryset(self):
+        return Conversation.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class ConversationDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    Retrieve, rename or delete one of the user's conversations
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Conversation.objects.filter(user=self.request.user)
+
+
+class MessageListCreateView(generics.ListCreateAPIView):
+    """
+    List the messages of a conversation or send a new message and get the answer
+    """
+    serializer_class = MessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessagePagination
+
+    def get_conversation(self):
+        return generics.get_object_or_404(Conversation, pk=self.kwargs['pk'], user=self.request.user)
+
+    def get_queryset(self):
+        return self.get_conversation().messages.all()
+
+    def create(self, request, *args, **kwargs):
+        conversation = self.get_conversation()
+        serializer = MessageCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            user_message, assistant_message = send_message(
+                conversation, serializer.validated_data['content'], request.user,
+                category=serializer.validated_data.get('category'),
+            )
+        except LLMError:
+            raise LLMUnavailable()
+
+        with stage('serialize'):
+            data = {
+                'user_message': MessageSerializer(user_message).data,
+                'assistant_message': MessageSerializer(assistant_message).data,
+            }
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class MessageStreamView(views.APIView):
+    """
+    Send a message and stream the answer as server-sent events.
+
+    Authentication and validation run as a normal DRF request. Tokens are
+    flushed to the client as soon as the LLM produces them: served by ASGI
+    the body is an async generator, under WSGI a plain generator that holds
+    the worker thread until the answer is complete (see ``event_stream``).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        conversation = generics.get_object_or_404(Conversation, pk=pk, user=request.user)
+        serializer = MessageCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        content = serializer.validated_data['content']
+
+        user_message = Message.objects.create(conversation=conversation, content=content, is_user=True)
+
+        return event_stream(
+            request, stream_answer, iter_answer, conversation, content, request.user,
+            exclude=user_message.pk, category=serializer.validated_data.get('category'),
+        )
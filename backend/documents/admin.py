@@ -1,3 +1,25 @@
 from django.contrib import admin
+from .models import Category, Document, DocumentTable
 
-# Register your models here.
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'parent')
+    search_fields = ('name',)
+
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    list_display = ('title', 'file_type', 'user', 'category', 'status', 'page_count', 'created_at')
+    list_filter = ('status', 'file_type', 'category', 'needs_reindex')
+    search_fields = ('title', 'description')
+    filter_horizontal = ('groups',)
+    readonly_fields = ('file_size', 'page_count', 'processing_stats', 'error_message', 'index_version',
+                       'index_fingerprint')
+
+
+@admin.register(DocumentTable)
+class DocumentTableAdmin(admin.ModelAdmin):
+    list_display = ('title', 'document', 'page_number', 'table_index', 'created_at')
+    search_fields = ('title', 'document__title')
+    readonly_fields = ('columns', 'row_labels', 'data')
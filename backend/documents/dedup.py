@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import re
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from rag.chunk_filter import document_filter_keys, invalidate_chunk_filters
+from rag.indexing import index_chunks
+from .models import ChunkBand, Document, DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+# 16 bands of 8 rows: chunks with Jaccard similarity above about 0.7 share a band
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_permutations = np.random.RandomState(1)
+_A = _permutations.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _permutations.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r'\w+')
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+
+
+def shingles(text):
+    """
+    Lowercased word trigrams of ``text``; the whole text when it is shorter.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text):
+    """
+    MinHash signature of the text's shingles, a uint32 array of NUM_PERM values.
+    """
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+         for shingle in shingles(text)),
+        dtype=np.uint64,
+    )
+    # Universal hashing (a * x + b) mod p; the multiplication wraps at 64 bits, which is fine for hashing
+    with np.errstate(over='ignore'):
+        permuted = ((hashes[:, None] * _A + _B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def numbers(text):
+    """
+    The numeric tokens of ``text`` in order; near-duplicates must agree on all of them.
+    """
+    return _NUMBER_RE.findall(text)
+
+
+def band_keys(signature):
+    return [
+        int.from_bytes(
+            hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest(), 'little', signed=True,
+        )
+        for band, rows in enumerate(signature.reshape(BANDS, ROWS))
+    ]
+
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+def find_near_duplicates(document, texts, threshold=None):
+    """
+    Match a batch of new chunk texts against the corpus and each other.
+
+    Returns ``(signatures, matches)``. ``matches[i]`` is ``('chunk', id)``
+    when ``texts[i]`` nearly duplicates a stored chunk, ``('batch', j)``
+    when it nearly duplicates the earlier text ``j`` of this batch, and
+    None when it is new. Candidates come from the LSH bands and are kept
+    when their estimated Jaccard similarity reaches ``threshold``
+    (CHUNK_DEDUP_THRESHOLD) and their numbers are identical, so a table
+    or paragraph with one revised figure is never served as the older
+    release's text. Chunks of the document's previous index
+    version are not matched, as they may be about to be dropped.
+
+    Two documents ingested at the same time may both store the same new
+    text as a canonical chunk; later copies then match one of them.
+    """
+    threshold = settings.CHUNK_DEDUP_THRESHOLD if threshold is None else threshold
+    signatures = [minhash(text) for text in texts]
+    figures = [numbers(text) for text in texts]
+    keys = [band_keys(signature) for signature in signatures]
+
+    candidates = {}
+    rows = (
+        ChunkBand.objects
+        .filter(key__in={key for chunk_keys in keys for key in chunk_keys})
+        .exclude(chunk__document=document, chunk__index_version__lt=document.index_version)
+        .values_list('key', 'chunk_id')
+    )
+    for key, chunk_id in rows:
+        candidates.setdefault(key, set()).add(chunk_id)
+    stored = {}
+    if candidates:
+        chunk_ids = set().union(*candidates.values())
+        rows = DocumentChunk.objects.filter(id__in=chunk_ids).values_list('id', 'minhash', 'text_content')
+        for chunk_id, signature, text in rows:
+            if signature is not None:
+                stored[chunk_id] = (np.frombuffer(bytes(signature), dtype=np.uint32), numbers(text))
+
+    matches = []
+    batch_bands = {}
+    for position, (signature, chunk_keys) in enumerate(zip(signatures, keys)):
+        best, best_score = None, threshold
+        for chunk_id in sorted(set().union(*(candidates.get(key, ()) for key in chunk_keys))):
+            if chunk_id not in stored or stored[chunk_id][1] != figures[position]:
+                continue
+            score = similarity(signature, stored[chunk_id][0])
+            if score >= best_score:
+                best, best_score = ('chunk', chunk_id), score
+        if best is None:
+            for earlier in sorted(set().union(*(batch_bands.get(key, ()) for key in chunk_keys))):
+                if figures[earlier] != figures[position]:
+                    continue
+                score = similarity(signature, signatures[earlier])
+                if score >= best_score:
+                    best, best_score = ('batch', earlier), score
+        matches.append(best)
+        if best is None:
+            for key in chunk_keys:
+                batch_bands.setdefault(key, []).append(position)
+    return signatures, matches
+
+
+def save_bands(chunks, signatures):
+    ChunkBand.objects.bulk_create([
+        ChunkBand(chunk=chunk, key=key)
+        for chunk, signature in zip(chunks, signatures)
+        for key in band_keys(signature)
+    ])
+
+
+def promote_duplicates(chunk_ids):
+    """
+    Hand the role of canonical chunks that are about to be deleted to one
+    of their surviving duplicates each. ``chunk_ids`` must list every
+    chunk being deleted, so that none of them is chosen as an heir.
+
+    The heir takes over the embedding, signature and LSH bands, is added
+    to the search indexes and filters, and the other duplicates are
+    pointed at it.
+    Call before deleting the chunks and removing them from the indexes.
+    Returns the number of chunks promoted.
+    """
+    chunk_ids = set(chunk_ids)
+    if not chunk_ids:
+        return 0
+    heirs = {}
+    survivors = (
+        DocumentChunk.objects
+        .filter(duplicate_of__in=chunk_ids)
+        .exclude(id__in=chunk_ids)
+        .order_by('duplicate_of', 'id')
+        .values_list('id', 'duplicate_of')
+    )
+    for chunk_id, canonical_id in survivors:
+        heirs.setdefault(canonical_id, []).append(chunk_id)
+    if not heirs:
+        return 0
+
+    canonicals = DocumentChunk.objects.only('embedding', 'minhash').in_bulk(heirs)
+    promoted = []
+    with transaction.atomic():
+        for canonical_id, (heir, *others) in heirs.items():
+            canonical = canonicals[canonical_id]
+            # Near-duplicates share the canonical embedding rather than being embedded again
+            DocumentChunk.objects.filter(pk=heir).update(
+                duplicate_of=None, embedding=canonical.embedding, minhash=canonical.minhash,
+            )
+            if others:
+                DocumentChunk.objects.filter(pk__in=others).update(duplicate_of=heir)
+            ChunkBand.objects.filter(chunk_id=canonical_id).update(chunk_id=heir)
+            promoted.append(heir)
+
+    rows = DocumentChunk.objects.filter(pk__in=promoted).exclude(embedding=None).values_list(
+        'id', 'text_content', 'embedding',
+    )
+    ids, texts, vectors = [], [], []
+    for chunk_id, text, embedding in rows:
+        ids.append(chunk_id)
+        texts.append(text)
+        vectors.append(np.asarray(embedding, dtype=np.float32))
+    if ids:
+        index_chunks(ids, texts, np.vstack(vectors))
+    documents = Document.objects.filter(chunks__in=promoted).distinct().prefetch_related('groups')
+    invalidate_chunk_filters(key for document in documents for key in document_filter_keys(document))
+    logger.info(f'Promoted {len(promoted)} near-duplicate chunks to replace deleted ones')
+    return len(promoted)
@@ -1,3 +1,202 @@
+import os
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
+from django.db.models import Q
+from pgvector.django import HnswIndex, VectorField
+
+
+def document_storage():
+    return FileSystemStorage(location=settings.DOCUMENT_STORAGE_PATH)
+
+
+class Category(models.Model):
+    """
+    Hierarchical category used to organise documents (Economic, Social, ...).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children')
+
+    class Meta:
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.name
+
+    def with_descendants(self):
+        """
+        Ids of this category and every category below it.
+        """
+        ids, level = {self.pk}, [self.pk]
+        while level:
+            level = list(Category.objects.filter(parent__in=level).exclude(pk__in=ids).values_list('pk', flat=True))
+            ids.update(level)
+        return ids
+
+
+class DocumentQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Documents the given user is allowed to see: everything for admins,
+        otherwise public documents, the user's own uploads and documents
+        shared with one of the user's groups.
+        """
+        if user.role == 'admin' or user.is_staff:
+            return self
+        shared = Document.groups.through.objects.filter(group__user=user).values('document_id')
+        return self.filter(Q(is_public=True) | Q(user=user) | Q(pk__in=shared))
+
+
+class Document(models.Model):
+    """
+    An uploaded source document (PDF or text) and its processing state.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    file = models.FileField(upload_to='%Y/%m/', storage=document_storage, max_length=500)
+    file_type = models.CharField(max_length=50)
+    file_size = models.BigIntegerField(default=0)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='documents')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='documents')
+    is_public = models.BooleanField(default=True)
+    # Groups whose members can see the document when it is not public
+    groups = models.ManyToManyField('auth.Group', blank=True, related_name='documents')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    page_count = models.PositiveIntegerField(default=0)
+    processing_stats = models.JSONField(default=dict, blank=True)
+    error_message = models.TextField(blank=True)
+    # Incremented on every (re)index; chunks carry the version that last confirmed them
+    index_version = models.PositiveIntegerField(default=0)
+    # Embedding and chunking configuration the current chunks were built with
+    index_fingerprint = models.CharField(max_length=64, blank=True)
+    needs_reindex = models.BooleanField(default=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DocumentQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of document lists
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def file_path(self):
+        return self.file.path
+
+    def is_visible_to(self, user):
+        if self.is_public or self.user_id == user.id or user.role == 'admin' or user.is_staff:
+            return True
+        return self.groups.filter(user=user).exists()
+
+    @staticmethod
+    def detect_file_type(filename):
+        return os.path.splitext(filename)[1].lstrip('.').lower()
+
+
+class DocumentChunk(models.Model):
+    """
+    A chunk of extracted document text together with its embedding.
+    """
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    chunk_index = models.IntegerField()
+    page_number = models.PositiveIntegerField(default=0)
+    text_content = models.TextField()
+    # Always a pgvector column, whichever VECTOR_DB_TYPE searches it
+    embedding = VectorField(dimensions=settings.EMBEDDING_DIMENSION, null=True, blank=True)
+    # SHA-256 of the normalized text and the embedding configuration
+    content_hash = models.CharField(max_length=64, blank=True)
+    index_version = models.PositiveIntegerField(default=0)
+    metadata = models.JSONField(default=dict, blank=True)
+    # Near-duplicates point at the chunk that is embedded and indexed for them
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates',
+    )
+    # MinHash signature (uint32 array) of chunks that are not duplicates
+    minhash = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['document', 'chunk_index']
+        indexes = [
+            models.Index(fields=['document', 'chunk_index']),
+            models.Index(fields=['document', 'content_hash']),
+            # Approximate nearest-neighbour search for PgVectorStore (pgvector's default graph parameters)
+            HnswIndex(
+                name='documentchunk_embedding_hnsw', fields=['embedding'], m=16, ef_construction=64,
+                opclasses=['vector_cosine_ops'],
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.document_id} #{self.chunk_index}'
+
+
+class ChunkBand(models.Model):
+    """
+    One LSH band of a chunk's MinHash signature.
+
+    Chunks sharing a band key are candidate near-duplicates; only chunks
+    that are not themselves duplicates have bands.
+    """
+    chunk = models.ForeignKey(DocumentChunk, on_delete=models.CASCADE, related_name='bands')
+    key = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f'{self.chunk_id}:{self.key}'
+
+
+class DocumentTable(models.Model):
+    """
+    A numeric table detected in a document.
+
+    Column names and row labels live on the row; the values are stored
+    column-wise (one float64 array per column, NaN for missing cells) in a
+    compressed .npz file so a query only decompresses the columns it reads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='tables')
+    table_index = models.PositiveIntegerField()
+    page_number = models.PositiveIntegerField(default=0)
+    title = models.CharField(max_length=500, blank=True)
+    columns = models.JSONField(default=list)
+    row_labels = models.JSONField(default=list)
+    data = models.FileField(upload_to='tables/%Y/%m/', storage=document_storage, max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['document', 'table_index']
+        indexes = [
+            models.Index(fields=['document', 'table_index']),
+        ]
+
+    def __str__(self):
+        return self.title or f'{self.document_id} table {self.table_index}'
 
-# Create your models here.
+    def column_values(self, positions):
+        """
+        Load the requested columns as ``{position: ndarray}``.
+        """
+        with self.data.open('rb') as f, np.load(f) as arrays:
+            return {position: arrays[f'c{position}'] for position in positions}
@@ -0,0 +1,12 @@
+from rest_framework import permissions
+
+
+class IsDocumentOwnerOrAdmin(permissions.BasePermission):
+    """
+    Object-level permission allowing only the uploader or an admin to modify a document.
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+
+        return obj.user_id == request.user.id or request.user.role == 'admin' or request.user.is_staff
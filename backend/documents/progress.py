@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .models import Document
+
+PROGRESS_TIMEOUT = 24 * 3600
+# A WSGI progress stream holds a worker thread, so it ends after this long and the client reconnects
+WSGI_STREAM_SECONDS = 60
+RECONNECT_MS = 1000
+
+
+def _key(document_id):
+    return f'documents:progress:{document_id}'
+
+
+def _pages_key(document_id):
+    return f'documents:progress:{document_id}:pages'
+
+
+def _chunks_key(document_id):
+    return f'documents:progress:{document_id}:chunks'
+
+
+def start_progress(document_id, pages_total, ranges=1):
+    """
+    Reset the published progress of a document about to be ingested.
+    """
+    cache.set_many({
+        _key(document_id): {
+            'stage': 'extracting',
+            'pages_total': pages_total,
+            'ranges': ranges,
+            'started': time.time(),
+        },
+        _pages_key(document_id): 0,
+        _chunks_key(document_id): 0,
+    }, timeout=PROGRESS_TIMEOUT)
+
+
+def set_stage(document_id, stage, **fields):
+    state = cache.get(_key(document_id)) or {}
+    state.update(fields, stage=stage)
+    cache.set(_key(document_id), state, timeout=PROGRESS_TIMEOUT)
+
+
+def advance(document_id, pages=0, chunks=0):
+    """
+    Add processed pages/chunks. Counters are incremented atomically, so
+    parallel page-range tasks can report into the same document.
+    """
+    for key, amount in ((_pages_key(document_id), pages), (_chunks_key(document_id), chunks)):
+        if amount:
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.add(key, amount, timeout=PROGRESS_TIMEOUT)
+
+
+def get_progress(document):
+    """
+    Current progress of ``document`` as a JSON-serialisable dict.
+    """
+    values = cache.get_many([_key(document.pk), _pages_key(document.pk), _chunks_key(document.pk)])
+    state = values.get(_key(document.pk)) or {}
+    pages_total = state.get('pages_total') or document.page_count
+    pages_done = values.get(_pages_key(document.pk), 0)
+    if document.status == document.STATUS_COMPLETED:
+        pages_done, percent = pages_total, 100.0
+    else:
+        percent = round(100.0 * pages_done / pages_total, 1) if pages_total else 0.0
+    return {
+        'document_id': str(document.pk),
+        'status': document.status,
+        'stage': state.get('stage', document.status),
+        'pages_total': pages_total,
+        'pages_done': pages_done,
+        'chunks': values.get(_chunks_key(document.pk), document.processing_stats.get('chunks', 0)),
+        'percent': min(percent, 100.0),
+        'error_message': document.error_message,
+    }
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _progress_event(progress, last):
+    return sse_event('progress', progress) if progress != last else ': keep-alive\n\n'
+
+
+def _finished(document):
+    return document.status in (Document.STATUS_COMPLETED, Document.STATUS_FAILED)
+
+
+async def stream_progress(document_id, interval=1.0, max_seconds=3600):
+    """
+    Async generator of server-sent ``progress`` events for one document.
+
+    Polls the published progress every ``interval`` seconds, emits an
+    event whenever it changes and finishes once the document is completed
+    or failed.
+    """
+    deadline = time.monotonic() + max_seconds
+    last = None
+    while time.monotonic() < deadline:
+        document = await Document.objects.aget(pk=document_id)
+        progress = await sync_to_async(get_progress)(document)
+        yield _progress_event(progress, last)
+        last = progress
+        if _finished(document):
+            return
+        await asyncio.sleep(interval)
+
+
+def iter_progress(document_id, interval=1.0, max_seconds=WSGI_STREAM_SECONDS):
+    """
+    ``stream_progress`` as a plain generator, for WSGI.
+
+    Stops after ``max_seconds`` even while the document is still being
+    ingested; the ``retry`` field tells the client's EventSource to
+    reconnect, and the next connection starts from the current progress.
+    """
+    yield f'retry: {RECONNECT_MS}\n\n'
+    deadline = time.monotonic() + max_seconds
+    last = None
+    while time.monotonic() < deadline:
+        document = Document.objects.get(pk=document_id)
+        progress = get_progress(document)
+        yield _progress_event(progress, last)
+        last = progress
+        if _finished(document):
+            return
+        time.sleep(interval)
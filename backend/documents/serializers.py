@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from rest_framework import serializers
+
+from .models import Category, Document
+from .services import SUPPORTED_FILE_TYPES
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'parent']
+
+
+class DocumentSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True)
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    groups = serializers.PrimaryKeyRelatedField(many=True, queryset=Group.objects.all(), required=False)
+
+    class Meta:
+        model = Document
+        fields = ['id', 'title', 'description', 'file', 'file_type', 'file_size', 'user', 'category',
+                  'is_public', 'groups', 'status', 'page_count', 'processing_stats', 'error_message',
+                  'created_at', 'updated_at']
+        read_only_fields = ['id', 'file_type', 'file_size', 'status', 'page_count', 'processing_stats',
+                            'error_message', 'created_at', 'updated_at']
+
+    def validate_file(self, value):
+        max_size = settings.DOCUMENT_MAX_SIZE_MB * 1024 * 1024
+        if value.size > max_size:
+            raise serializers.ValidationError(f'File exceeds the {settings.DOCUMENT_MAX_SIZE_MB} MB limit.')
+        if Document.detect_file_type(value.name) not in SUPPORTED_FILE_TYPES:
+            raise serializers.ValidationError(
+                f'Unsupported file type. Allowed types: {", ".join(SUPPORTED_FILE_TYPES)}.'
+            )
+        return value
+
+    def validate_groups(self, value):
+        user = self.context['request'].user
+        if user.role == 'admin' or user.is_staff:
+            return value
+        member_of = set(user.groups.values_list('pk', flat=True))
+        if any(group.pk not in member_of for group in value):
+            raise serializers.ValidationError('Documents can only be shared with groups you belong to.')
+        return value
+
+
+class DocumentUpdateSerializer(DocumentSerializer):
+    file = serializers.FileField(write_only=True, required=False)
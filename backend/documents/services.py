@@ -0,0 +1,395 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from rag.embeddings import embed_texts
+from rag.answer_cache import get_answer_cache
+from rag.chunk_filter import document_filter_keys, invalidate_chunk_filters
+from rag.indexing import index_chunks, remove_chunks
+from utils.ocr import OcrStats, PageOcr, merge_ocr_stats, ocr_available
+from utils.pdf_extraction import count_pdf_pages, iter_pdf_pages, iter_text_pages
+from utils.resources import current_rss_bytes
+from utils.text_processors import CHUNKER_VERSION, iter_batches, iter_text_chunks, normalize_text
+from .dedup import find_near_duplicates, promote_duplicates, save_bands
+from .models import Document, DocumentChunk
+from .progress import advance, set_stage, start_progress
+from .tables import TableCollector, remove_document_tables, save_tables
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FILE_TYPES = ('pdf', 'txt')
+# Chunk/table index offset between page ranges ingested in parallel
+RANGE_INDEX_STRIDE = 1_000_000
+
+
+class IngestionCancelled(Exception):
+    """
+    The run a page range belongs to has failed or been superseded.
+    """
+
+
+class IngestionStats:
+    """
+    Throughput and memory statistics collected while a document is ingested.
+
+    RSS is sampled after every page, so ``peak_rss_bytes`` reflects the high
+    water mark reached while this document was being processed rather than
+    the lifetime peak of the worker process. ``ocr`` collects the OCR time
+    of every scanned page.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.duplicates = 0
+        self.tables = 0
+        self.ocr = OcrStats()
+        self.start_rss_bytes = current_rss_bytes()
+        self.peak_rss_bytes = self.start_rss_bytes
+
+    def track_pages(self, pages, document_id=None):
+        for page in pages:
+            self.pages += 1
+            self.sample_memory()
+            if document_id is not None:
+                advance(document_id, pages=1)
+            yield page
+
+    def sample_memory(self):
+        self.peak_rss_bytes = max(self.peak_rss_bytes, current_rss_bytes())
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed
+        return {
+            'pages': self.pages,
+            'chunks': self.chunks,
+            'embedded': self.embedded,
+            'duplicates': self.duplicates,
+            'dedup_ratio': round(self.duplicates / self.chunks, 4) if self.chunks else 0.0,
+            'tables': self.tables,
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(self.pages / elapsed, 2) if elapsed else 0.0,
+            'peak_rss_bytes': self.peak_rss_bytes,
+            'rss_growth_bytes': self.peak_rss_bytes - self.start_rss_bytes,
+            'ocr': self.ocr.as_dict(),
+        }
+
+
+def embedding_fingerprint():
+    return f'{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSION}'
+
+
+def index_fingerprint():
+    """
+    Fingerprint of every setting that changes a document's chunks or vectors.
+    """
+    config = (
+        f'{embedding_fingerprint()}:{settings.CHUNK_MAX_TOKENS}:{settings.CHUNK_OVERLAP_TOKENS}:{CHUNKER_VERSION}'
+    )
+    return hashlib.sha256(config.encode('utf-8')).hexdigest()
+
+
+def chunk_hash(text):
+    """
+    Content hash of a chunk; changes with the text or the embedding configuration.
+    """
+    return hashlib.sha256(f'{embedding_fingerprint()}\x00{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def iter_document_pages(document, start_page=0, end_page=None, ocr_stats=None):
+    """
+    Return a lazy ``(page_number, text)`` iterator for the document's file.
+
+    ``start_page``/``end_page`` (0-based, end-exclusive) select a page range
+    of a PDF; text files are always read whole. With OCR_ENABLED, PDF pages
+    without a text layer are OCRed and timed in ``ocr_stats``.
+    """
+    if document.file_type == 'pdf':
+        ocr = PageOcr(ocr_stats) if settings.OCR_ENABLED and ocr_available() else None
+        return iter_pdf_pages(document.file_path, start_page, end_page, ocr=ocr)
+    if document.file_type == 'txt':
+        return iter_text_pages(document.file_path)
+    raise ValueError(f'Unsupported file type: {document.file_type}')
+
+
+def plan_page_ranges(document, pages_per_task=None):
+    """
+    Split a document into ``(start_page, end_page)`` ranges for parallel ingestion.
+
+    Returns the page count and the ranges; text files and short PDFs get a
+    single range.
+    """
+    pages_per_task = pages_per_task or settings.DOCUMENT_PAGES_PER_TASK
+    if document.file_type != 'pdf':
+        return 0, [(0, None)]
+    page_count = count_pdf_pages(document.file_path)
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    return page_count, ranges or [(0, 0)]
+
+
+def prepare_document(document, page_count=0, ranges=1):
+    """
+    Mark a document as processing and start a new index version.
+
+    Existing chunks are kept: the run re-confirms those whose content hash
+    is unchanged and ``complete_document`` drops the rest. Tables are cheap
+    to rebuild and are replaced outright.
+    """
+    Document.objects.filter(pk=document.pk).update(
+        status=Document.STATUS_PROCESSING,
+        error_message='',
+        index_version=F('index_version') + 1,
+    )
+    document.refresh_from_db(fields=['status', 'index_version'])
+    start_progress(document.pk, page_count, ranges)
+    remove_document_tables(document)
+
+
+def ingest_pages(document, start_page=0, end_page=None, range_index=0, stats=None):
+    """
+    Extract, chunk, embed and store one page range as a streaming pipeline.
+
+    Pages are pulled from the file one at a time and flow straight into the
+    chunker; chunks are embedded and written in batches of
+    DOCUMENT_EMBED_BATCH_SIZE. At no point is the whole range held in
+    memory. With DOCUMENT_EXTRACT_TABLES, numeric tables are detected from
+    the same page stream and stored column-wise once the text is indexed.
+
+    Chunks whose content hash matches an existing chunk of the document
+    are re-confirmed in place. With CHUNK_DEDUP_ENABLED, new chunks that
+    nearly duplicate a chunk anywhere in the corpus (boilerplate notes,
+    footnotes, running headers) are stored pointing at it instead of being
+    embedded and indexed again. Chunk and table indexes are offset by ``range_index`` so
+    ranges ingested in parallel keep document order. Chunks do not overlap
+    across range boundaries.
+
+    Before each batch and before the tables are saved, the document must
+    still be processing under the same index version; otherwise
+    IngestionCancelled is raised so a range does not keep writing after a
+    sibling range has failed the document.
+    """
+    stats = stats or IngestionStats()
+    pages = stats.track_pages(iter_document_pages(document, start_page, end_page, stats.ocr), document.pk)
+    collector = TableCollector() if settings.DOCUMENT_EXTRACT_TABLES else None
+    if collector is not None:
+        pages = collector.track_pages(pages)
+    chunks = iter_text_chunks(pages)
+
+    for batch in iter_batches(chunks, settings.DOCUMENT_EMBED_BATCH_SIZE):
+        _ensure_current(document)
+        embedded, duplicates = _store_chunks(document, batch, range_index * RANGE_INDEX_STRIDE)
+        stats.embedded += embedded
+        stats.duplicates += duplicates
+        stats.chunks += len(batch)
+        stats.sample_memory()
+        advance(document.pk, chunks=len(batch))
+
+    if collector is not None:
+        _ensure_current(document)
+        stats.tables = len(save_tables(document, collector.tables, range_index * RANGE_INDEX_STRIDE))
+    return stats
+
+
+def _ensure_current(document):
+    current = Document.objects.filter(
+        pk=document.pk, status=Document.STATUS_PROCESSING, index_version=document.index_version,
+    ).exists()
+    if not current:
+        raise IngestionCancelled(f'Document {document.pk} is no longer processing index version {document.index_version}')
+
+
+def complete_document(document, result):
+    """
+    Drop chunks the latest run did not re-confirm, mark the document as
+    processed and publish the final statistics.
+    """
+    stale_ids = list(
+        DocumentChunk.objects
+        .filter(document=document, index_version__lt=document.index_version)
+        .values_list('id', flat=True)
+    )
+    if stale_ids:
+        promote_duplicates(stale_ids)
+        remove_chunks(
+            DocumentChunk.objects.filter(id__in=stale_ids, duplicate_of=None).values_list('id', flat=True)
+        )
+        DocumentChunk.objects.filter(id__in=stale_ids).delete()
+    result['removed'] = len(stale_ids)
+
+    Document.objects.filter(pk=document.pk).update(
+        status=Document.STATUS_COMPLETED,
+        page_count=result['pages'],
+        processing_stats=result,
+        index_fingerprint=index_fingerprint(),
+        needs_reindex=False,
+    )
+    set_stage(document.pk, 'completed')
+    invalidate_chunk_filters(document_filter_keys(document))
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate_document(str(document.pk))
+    logger.info(
+        f'Processed document {document.pk}: {result["pages"]} pages, {result["chunks"]} chunks '
+        f'({result["embedded"]} embedded, {result["duplicates"]} near-duplicates, {result["removed"]} removed), '
+        f'{result["tables"]} tables, {result["ocr"]["pages"]} pages OCRed ({result["ocr"]["cached"]} cached) '
+        f'in {result["seconds"]}s ({result["pages_per_second"]} pages/s, '
+        f'peak RSS {result["peak_rss_bytes"] / 1048576:.1f} MB)'
+    )
+    return result
+
+
+def fail_document(document, error, stats=None):
+    logger.error(f'Processing failed for document {document.pk}: {error}')
+    Document.objects.filter(pk=document.pk).update(
+        status=Document.STATUS_FAILED,
+        error_message=str(error),
+        processing_stats=stats or {},
+    )
+    set_stage(document.pk, 'failed')
+
+
+def merge_stats(results, seconds):
+    """
+    Combine the statistics of page ranges ingested in parallel.
+    """
+    pages = sum(result['pages'] for result in results)
+    chunks = sum(result['chunks'] for result in results)
+    duplicates = sum(result['duplicates'] for result in results)
+    return {
+        'pages': pages,
+        'chunks': chunks,
+        'embedded': sum(result['embedded'] for result in results),
+        'duplicates': duplicates,
+        'dedup_ratio': round(duplicates / chunks, 4) if chunks else 0.0,
+        'tables': sum(result['tables'] for result in results),
+        'ranges': len(results),
+        'seconds': round(seconds, 3),
+        'pages_per_second': round(pages / seconds, 2) if seconds else 0.0,
+        'peak_rss_bytes': max(result['peak_rss_bytes'] for result in results),
+        'rss_growth_bytes': max(result['rss_growth_bytes'] for result in results),
+        'ocr': merge_ocr_stats(result['ocr'] for result in results),
+    }
+
+
+def process_document(document):
+    """
+    Ingest a whole document in the current process as a single page range.
+
+    Used for small documents and text files; larger PDFs are split into
+    page ranges and processed in parallel by ``documents.tasks``.
+    """
+    page_count = count_pdf_pages(document.file_path) if document.file_type == 'pdf' else 0
+    prepare_document(document, page_count)
+    stats = IngestionStats()
+    try:
+        ingest_pages(document, stats=stats)
+    except Exception as e:
+        logger.exception(f'Processing failed for document {document.pk}')
+        fail_document(document, e, stats.as_dict())
+        raise
+    return complete_document(document, stats.as_dict())
+
+
+def _store_chunks(document, batch, index_offset=0):
+    """
+    Store a batch of chunks for the document's current index version.
+
+    Returns the number of chunks that had to be embedded and the number
+    stored as near-duplicates of another chunk.
+    """
+    hashes = [chunk_hash(chunk['text']) for chunk in batch]
+    reused = _reconfirm_chunks(document, batch, hashes, index_offset)
+    fresh = [(chunk, content_hash) for position, (chunk, content_hash) in enumerate(zip(batch, hashes))
+             if position not in reused]
+    if not fresh:
+        return 0, 0
+
+    def make_chunk(chunk, content_hash, **fields):
+        return DocumentChunk(
+            document=document,
+            chunk_index=index_offset + chunk['chunk_index'],
+            page_number=chunk['page_number'],
+            text_content=chunk['text'],
+            content_hash=content_hash,
+            index_version=document.index_version,
+            metadata={'end_page': chunk['end_page'], 'section': chunk['section']},
+            **fields,
+        )
+
+    if settings.CHUNK_DEDUP_ENABLED:
+        signatures, matches = find_near_duplicates(document, [chunk['text'] for chunk, _ in fresh])
+    else:
+        signatures, matches = [None] * len(fresh), [None] * len(fresh)
+    new = [position for position, match in enumerate(matches) if match is None]
+
+    vectors = embed_texts([fresh[position][0]['text'] for position in new])
+    with transaction.atomic():
+        created = DocumentChunk.objects.bulk_create([
+            make_chunk(
+                *fresh[position], embedding=vector,
+                minhash=signatures[position].tobytes() if signatures[position] is not None else None,
+            )
+            for position, vector in zip(new, vectors)
+        ])
+        if settings.CHUNK_DEDUP_ENABLED:
+            save_bands(created, [signatures[position] for position in new])
+        created_at = dict(zip(new, created))
+        duplicates = []
+        for position, match in enumerate(matches):
+            if match is not None:
+                kind, value = match
+                canonical_id = value if kind == 'chunk' else created_at[value].id
+                duplicates.append(make_chunk(*fresh[position], duplicate_of_id=canonical_id))
+        DocumentChunk.objects.bulk_create(duplicates)
+    if created:
+        index_chunks([chunk.id for chunk in created], [chunk.text_content for chunk in created], vectors)
+    return len(created), len(duplicates)
+
+
+def _reconfirm_chunks(document, batch, hashes, index_offset):
+    """
+    Carry unchanged chunks from the previous index version over to this one.
+
+    Each old chunk is claimed with a conditional update, so parallel page
+    ranges containing the same text cannot both claim it. Claimed rows keep
+    their embedding and search index entries; only their position is
+    updated. Returns the positions in ``batch`` that were reused.
+    """
+    candidates = {}
+    rows = (
+        DocumentChunk.objects
+        .filter(document=document, content_hash__in=set(hashes), index_version__lt=document.index_version)
+        .values_list('id', 'content_hash')
+    )
+    for chunk_id, content_hash in rows:
+        candidates.setdefault(content_hash, []).append(chunk_id)
+    if not candidates:
+        return set()
+
+    reused = set()
+    with transaction.atomic():
+        for position, (chunk, content_hash) in enumerate(zip(batch, hashes)):
+            ids = candidates.get(content_hash)
+            while ids:
+                claimed = DocumentChunk.objects.filter(
+                    pk=ids.pop(), index_version__lt=document.index_version,
+                ).update(
+                    index_version=document.index_version,
+                    chunk_index=index_offset + chunk['chunk_index'],
+                    page_number=chunk['page_number'],
+                    metadata={'end_page': chunk['end_page'], 'section': chunk['section']},
+                )
+                if claimed:
+                    reused.add(position)
+                    break
+    return reused
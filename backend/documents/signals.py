@@ -0,0 +1,74 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from rag.answer_cache import get_answer_cache
+from rag.chunk_filter import document_filter_keys, invalidate_chunk_filters
+from rag.indexing import remove_chunks
+from .dedup import promote_duplicates
+from .models import Document, DocumentTable
+
+
+@receiver(pre_delete, sender=Document)
+def remove_document_from_index(sender, instance, **kwargs):
+    """
+    Drop a document's chunks from the search indexes before the rows are
+    deleted, promoting near-duplicates in other documents to replace them
+    """
+    chunks = list(instance.chunks.values_list('id', 'duplicate_of'))
+    promote_duplicates([chunk_id for chunk_id, _ in chunks])
+    remove_chunks([chunk_id for chunk_id, duplicate_of in chunks if duplicate_of is None])
+    invalidate_chunk_filters(document_filter_keys(instance))
+
+
+@receiver(pre_save, sender=Document)
+def remember_filter_keys(sender, instance, **kwargs):
+    """
+    Note the search filter keys of a document about to be updated
+    """
+    previous = Document.objects.filter(pk=instance.pk).first() if not instance._state.adding else None
+    instance._previous_filter_keys = set(document_filter_keys(previous)) if previous is not None else None
+
+
+@receiver(post_save, sender=Document)
+def invalidate_changed_filters(sender, instance, created, **kwargs):
+    """
+    Rebuild the search filters a document joined or left by a change of
+    owner, visibility or category; new documents join theirs once indexed
+    """
+    previous = getattr(instance, '_previous_filter_keys', None)
+    if not created and previous is not None:
+        invalidate_chunk_filters(previous ^ set(document_filter_keys(instance)))
+
+
+@receiver(m2m_changed, sender=Document.groups.through)
+def invalidate_group_filters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Rebuild the search filters of groups a document was shared with or unshared from
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_chunk_filters([f'group:{instance.pk}'])
+    elif action == 'pre_clear':
+        invalidate_chunk_filters(f'group:{pk}' for pk in instance.groups.values_list('pk', flat=True))
+    else:
+        invalidate_chunk_filters(f'group:{pk}' for pk in pk_set)
+
+
+@receiver(post_delete, sender=DocumentTable)
+def delete_table_file(sender, instance, **kwargs):
+    """
+    Remove the column file of a deleted table
+    """
+    instance.data.delete(save=False)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_cached_answers(sender, instance, **kwargs):
+    """
+    Invalidate cached answers citing a document that was updated or deleted
+    """
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate_document(str(instance.pk))
@@ -0,0 +1,169 @@
+import io
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .models import DocumentTable
+
+logger = logging.getLogger(__name__)
+
+# 1234, 1,234, 1,23,456 (Indian grouping), -12.5, 7.3%
+NUMBER_RE = re.compile(r'^[-+]?(?:\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d+)?%?$')
+MISSING_TOKENS = frozenset({'-', '–', '—', 'na', 'n.a.', 'n.a', '..', '...', '*', '@', '#'})
+SERIAL_RE = re.compile(r'^\(?\d{1,3}[.)]?$|^\(?[ivxlc]+[.)]$', re.IGNORECASE)
+MAX_TITLE_LENGTH = 500
+MAX_LABEL_HEADER_WORDS = 4
+
+
+@dataclass
+class ExtractedTable:
+    page_number: int
+    title: str
+    columns: list
+    row_labels: list = field(default_factory=list)
+    rows: list = field(default_factory=list)
+
+    @property
+    def values(self):
+        return np.array(self.rows, dtype=np.float64)
+
+
+def parse_number(token):
+    token = token.strip()
+    if token.lower() in MISSING_TOKENS:
+        return math.nan
+    if NUMBER_RE.match(token):
+        return float(token.replace(',', '').rstrip('%'))
+    return None
+
+
+def parse_row(line):
+    """
+    Split a text line into ``(label, values)`` if it ends in two or more
+    numeric cells, otherwise return ``None``.
+    """
+    tokens = line.split()
+    values = []
+    while tokens:
+        value = parse_number(tokens[-1])
+        if value is None:
+            break
+        values.append(value)
+        tokens.pop()
+    values.reverse()
+
+    # Leading serial numbers ("1.", "(ii)") are not part of the label
+    while tokens and SERIAL_RE.match(tokens[0]):
+        tokens.pop(0)
+    if not tokens or len(values) < 2 or all(math.isnan(v) for v in values):
+        return None
+    return ' '.join(tokens), values
+
+
+def _is_year_header(values):
+    return all(not math.isnan(v) and v.is_integer() and 1900 <= v <= 2100 for v in values) and values == sorted(values)
+
+
+def detect_tables(page_number, text, min_rows=None):
+    """
+    Find numeric tables in the extracted text of one page.
+
+    A table is a run of at least ``min_rows`` consecutive lines that each end
+    in the same number (two or more) of numeric cells. Column names come from
+    the line above the run when it has enough tokens (or from a first row of
+    years), and the line above that is used as the title. Tables that
+    continue on the next page are detected as separate tables.
+    """
+    min_rows = min_rows or settings.TABLE_MIN_ROWS
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    parsed = [parse_row(line) for line in lines]
+
+    tables = []
+    i = 0
+    while i < len(lines):
+        if parsed[i] is None:
+            i += 1
+            continue
+        width = len(parsed[i][1])
+        end = i
+        while end < len(lines) and parsed[end] is not None and len(parsed[end][1]) == width:
+            end += 1
+
+        start, above = i, i - 1
+        columns = None
+        if _is_year_header(parsed[i][1]):
+            columns = [str(int(v)) for v in parsed[i][1]]
+            start = i + 1
+        elif above >= 0 and parsed[above] is None:
+            header_tokens = lines[above].split()
+            # A header has one name per column plus a few words for the label column
+            if width <= len(header_tokens) <= width + MAX_LABEL_HEADER_WORDS:
+                columns = header_tokens[-width:]
+                above -= 1
+
+        if end - start >= min_rows:
+            title = lines[above] if above >= 0 and parsed[above] is None else ''
+            tables.append(ExtractedTable(
+                page_number=page_number,
+                title=title[:MAX_TITLE_LENGTH],
+                columns=columns or [f'Column {n}' for n in range(1, width + 1)],
+                row_labels=[parsed[row][0] for row in range(start, end)],
+                rows=[parsed[row][1] for row in range(start, end)],
+            ))
+        i = end
+    return tables
+
+
+class TableCollector:
+    """
+    Pass-through page iterator that detects tables as pages stream by.
+
+    Wrapping the page iterator lets table extraction share the single pass
+    over the file that feeds the chunker.
+    """
+
+    def __init__(self):
+        self.tables = []
+
+    def track_pages(self, pages):
+        for page_number, text in pages:
+            try:
+                self.tables.extend(detect_tables(page_number, text))
+            except Exception:
+                logger.exception(f'Table detection failed on page {page_number}')
+            yield page_number, text
+
+
+def save_tables(document, tables, index_offset=0):
+    """
+    Store extracted tables column-wise and create their DocumentTable rows.
+    """
+    created = []
+    for table_index, table in enumerate(tables, start=index_offset):
+        values = table.values
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **{f'c{position}': values[:, position] for position in range(values.shape[1])})
+        record = DocumentTable(
+            document=document,
+            table_index=table_index,
+            page_number=table.page_number,
+            title=table.title,
+            columns=table.columns,
+            row_labels=table.row_labels,
+        )
+        record.data.save(f'{document.pk}-{table_index}.npz', ContentFile(buffer.getvalue()), save=False)
+        record.save()
+        created.append(record)
+    return created
+
+
+def remove_document_tables(document):
+    """
+    Delete a document's tables; their column files are removed by a post_delete signal.
+    """
+    DocumentTable.objects.filter(document=document).delete()
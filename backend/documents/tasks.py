@@ -0,0 +1,137 @@
+import logging
+import time
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Document
+from .progress import set_stage
+from .services import (
+    IngestionCancelled, complete_document, fail_document, index_fingerprint, ingest_pages, merge_stats, plan_page_ranges,
+    prepare_document, process_document,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _get_document(document_id):
+    try:
+        return Document.objects.get(pk=document_id)
+    except Document.DoesNotExist:
+        logger.warning(f'Document {document_id} no longer exists, skipping processing')
+        return None
+
+
+@shared_task
+def process_document_task(document_id):
+    """
+    Ingest an uploaded document.
+
+    Short documents are processed in this task. Longer PDFs are split into
+    DOCUMENT_PAGES_PER_TASK page ranges that are extracted and embedded in
+    parallel by ``ingest_page_range`` tasks, with ``finalize_document`` as
+    the chord callback.
+    """
+    document = _get_document(document_id)
+    if document is None:
+        return None
+    try:
+        page_count, ranges = plan_page_ranges(document)
+    except Exception as e:
+        fail_document(document, e)
+        raise
+    if len(ranges) == 1:
+        return process_document(document)
+
+    prepare_document(document, page_count, len(ranges))
+    workflow = chord(
+        (ingest_page_range.s(document_id, start, end, index) for index, (start, end) in enumerate(ranges)),
+        finalize_document.s(document_id, time.time()),
+    )
+    workflow.apply_async()
+    logger.info(f'Queued {len(ranges)} page ranges for document {document_id} ({page_count} pages)')
+    return {'pages': page_count, 'ranges': len(ranges)}
+
+
+@shared_task
+def ingest_page_range(document_id, start_page, end_page, range_index):
+    """
+    Extract, chunk, embed and index one page range of a document.
+
+    A range that finds the document already failed (by a sibling range) or
+    re-queued stops without writing and without failing it again.
+    """
+    document = _get_document(document_id)
+    if document is None:
+        return None
+    try:
+        stats = ingest_pages(document, start_page, end_page, range_index)
+    except IngestionCancelled as e:
+        logger.info(f'Skipping pages {start_page + 1}-{end_page}: {e}')
+        return None
+    except Exception as e:
+        logger.exception(f'Processing failed for pages {start_page + 1}-{end_page} of document {document_id}')
+        fail_document(document, e)
+        raise
+    return stats.as_dict()
+
+
+@shared_task
+def finalize_document(results, document_id, started):
+    """
+    Chord callback: merge the page-range statistics and mark the document processed.
+
+    Nothing is completed when a range was skipped, since its pages are missing.
+    """
+    document = _get_document(document_id)
+    if document is None:
+        return None
+    if not all(results):
+        logger.warning(f'Not completing document {document_id}: {results.count(None)} page ranges were skipped')
+        return None
+    set_stage(document_id, 'finalizing')
+    return complete_document(document, merge_stats(results, time.time() - started))
+
+
+@shared_task
+def reindex_dirty_documents(batch_size=None):
+    """
+    Periodic job: queue a bounded batch of dirty documents for re-indexing.
+
+    Documents are dirty when flagged with ``needs_reindex`` or when they were
+    indexed under a different embedding/chunking configuration. The
+    configuration sweep is a single UPDATE that only runs when the
+    fingerprint differs from the one seen on the previous run. Re-indexing
+    is incremental, so only chunks whose content hash changed are embedded.
+    """
+    batch_size = batch_size or settings.DOCUMENT_REINDEX_BATCH_SIZE
+    fingerprint = index_fingerprint()
+    if cache.get('documents:index_fingerprint') != fingerprint:
+        flagged = (
+            Document.objects
+            .filter(status=Document.STATUS_COMPLETED, needs_reindex=False)
+            .exclude(index_fingerprint=fingerprint)
+            .update(needs_reindex=True)
+        )
+        cache.set('documents:index_fingerprint', fingerprint, timeout=None)
+        if flagged:
+            logger.info(f'Indexing configuration changed, {flagged} documents flagged for re-indexing')
+
+    document_ids = list(
+        Document.objects
+        .filter(needs_reindex=True, status=Document.STATUS_COMPLETED)
+        .order_by('updated_at')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not document_ids:
+        return 0
+
+    # Claim the batch so the next run does not queue the same documents again
+    claimed = Document.objects.filter(id__in=document_ids, status=Document.STATUS_COMPLETED).update(
+        status=Document.STATUS_PENDING,
+    )
+    for document_id in document_ids:
+        process_document_task.delay(str(document_id))
+    logger.info(f'Queued {claimed} documents for incremental re-indexing')
+    return claimed
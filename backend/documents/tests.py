@@ -1,3 +1,197 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from backend.celery import app
+from utils.text_processors import count_tokens, iter_text_chunks
+from .dedup import find_near_duplicates, minhash, save_bands, similarity
+from .models import Document, DocumentChunk
+from .tasks import process_document_task
+
+
+def make_pdf(pages):
+    """
+    Build a minimal PDF with one line of text per page.
+    """
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{" ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))}] /Count {len(pages)} >>',
+    ]
+    font = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        content = f'BT /F1 10 Tf 50 780 Td ({text}) Tj ET'
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 {font} 0 R >> >> /Contents {4 + 2 * i} 0 R >>'
+        )
+        objects.append(f'<< /Length {len(content)} >>\nstream\n{content}\nendstream')
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f'{number} 0 obj\n{body}\nendobj\n'.encode()
+    xref = len(data)
+    data += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    data += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    data += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return data
+
+
+def fake_embeddings(texts):
+    return [np.full(settings.EMBEDDING_DIMENSION, len(text), dtype=np.float32) for text in texts]
+
+
+@override_settings(
+    CELERY_BROKER_URL='memory://', CELERY_RESULT_BACKEND='cache+memory://', CELERY_TASK_ALWAYS_EAGER=True,
+    DOCUMENT_PAGES_PER_TASK=2, DOCUMENT_EXTRACT_TABLES=False, CHUNK_DEDUP_ENABLED=False,
+)
+class PageRangeChordTests(TestCase):
+    """
+    Runs the page-range chord end to end with eager tasks and the in-memory broker.
+    """
+    pages = [f'Page {number} reports survey round {number} of the labour force estimates.' for number in range(1, 7)]
+
+    def setUp(self):
+        storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage, ignore_errors=True)
+        storage_settings = override_settings(DOCUMENT_STORAGE_PATH=storage)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        # The Celery app read its configuration when first used; point it at the test settings
+        celery_settings = {
+            'broker_url': settings.CELERY_BROKER_URL,
+            'result_backend': settings.CELERY_RESULT_BACKEND,
+            'task_always_eager': settings.CELERY_TASK_ALWAYS_EAGER,
+        }
+        previous = {name: app.conf[name] for name in celery_settings}
+        app.conf.update(celery_settings)
+        self.addCleanup(app.conf.update, previous)
+
+        for target in ('documents.services.index_chunks', 'documents.services.remove_chunks'):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.document = Document(title='Labour force survey', file_type='pdf')
+        self.document.file.save('survey.pdf', ContentFile(make_pdf(self.pages)), save=False)
+        self.document.save()
+
+    def test_ranges_are_ingested_and_finalized(self):
+        with mock.patch('documents.services.embed_texts', side_effect=fake_embeddings):
+            process_document_task.delay(str(self.document.pk))
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, Document.STATUS_COMPLETED)
+        self.assertEqual(self.document.processing_stats['ranges'], 3)
+        self.assertEqual(self.document.processing_stats['pages'], 6)
+        # Short pages are chunked together, but never across a range boundary
+        self.assertEqual(
+            sorted(DocumentChunk.objects.filter(document=self.document).values_list('page_number', flat=True)),
+            [1, 3, 5],
+        )
+
+    def test_failed_range_stops_its_siblings(self):
+        def embed(texts):
+            if any('Page 1 ' in text for text in texts):
+                raise RuntimeError('embedding service unavailable')
+            return fake_embeddings(texts)
+
+        with mock.patch('documents.services.embed_texts', side_effect=embed):
+            process_document_task.delay(str(self.document.pk))
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, Document.STATUS_FAILED)
+        self.assertIn('embedding service unavailable', self.document.error_message)
+        self.assertFalse(DocumentChunk.objects.filter(document=self.document).exists())
+
+
+STATE_ROWS = [f'State {number} {1000 + number} {1100 + number} {1200 + number}' for number in range(1, 41)]
+STATE_TABLE = 'Table 4: Gross value added by state\nState 2020 2021 2022\n' + '\n'.join(STATE_ROWS)
+
+
+class ChunkerTests(SimpleTestCase):
+    page = (
+        '1. Introduction\nThe survey covers all states. It was conducted in 2022.\n\n'
+        f'{STATE_TABLE}\n\n'
+        '2. Methodology\n' + ' '.join(f'Sentence {number} describes the sampling design.' for number in range(30))
+    )
+
+    def chunks(self, max_tokens=60, overlap=10):
+        return list(iter_text_chunks([(1, self.page)], max_tokens=max_tokens, overlap=overlap))
+
+    def test_chunks_stay_within_the_token_limit(self):
+        chunks = self.chunks()
+        self.assertEqual([chunk['chunk_index'] for chunk in chunks], list(range(len(chunks))))
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk['text']), 60)
+
+    def test_headings_start_chunks_and_are_repeated(self):
+        chunks = self.chunks()
+        self.assertEqual(chunks[0]['section'], '1. Introduction')
+        self.assertNotIn('Table 4', chunks[0]['text'])
+        methodology = [chunk for chunk in chunks if chunk['section'] == '2. Methodology']
+        self.assertGreater(len(methodology), 1)
+        for chunk in methodology:
+            self.assertTrue(chunk['text'].startswith('2. Methodology\n'))
+
+    def test_tables_split_between_rows_with_the_header_repeated(self):
+        tables = [chunk for chunk in self.chunks() if chunk['section'].startswith('Table 4')]
+        self.assertGreater(len(tables), 1)
+        rows = []
+        for chunk in tables:
+            caption, header, *body = chunk['text'].split('\n')
+            self.assertEqual(header, 'State 2020 2021 2022')
+            rows.extend(body)
+        self.assertEqual(rows, STATE_ROWS)
+
+    def test_tables_that_fit_are_kept_whole(self):
+        tables = [chunk for chunk in self.chunks(max_tokens=400) if STATE_ROWS[0] in chunk['text']]
+        self.assertEqual(len(tables), 1)
+        self.assertIn(STATE_ROWS[-1], tables[0]['text'])
+
+    def test_split_paragraphs_overlap(self):
+        methodology = [chunk['text'] for chunk in self.chunks() if chunk['section'] == '2. Methodology']
+        for previous, current in zip(methodology, methodology[1:]):
+            last_sentence = previous.rsplit('. ', 1)[-1]
+            self.assertIn(last_sentence.rstrip('.'), current)
+
+
+@override_settings(CHUNK_DEDUP_THRESHOLD=0.9)
+class NearDuplicateTests(TestCase):
+    # The 2023 release revised a single figure of the 2022 one
+    revised = STATE_TABLE.replace('1117', '1119')
+
+    @classmethod
+    def setUpTestData(cls):
+        release = Document.objects.create(title='GVA release 2022', file_type='pdf', status=Document.STATUS_COMPLETED)
+        cls.canonical = DocumentChunk.objects.create(
+            document=release, chunk_index=0, text_content=STATE_TABLE, minhash=minhash(STATE_TABLE).tobytes(),
+        )
+        save_bands([cls.canonical], [minhash(STATE_TABLE)])
+        cls.document = Document.objects.create(title='GVA release 2023', file_type='pdf')
+
+    def test_revised_figure_is_similar_enough_to_match_on_text_alone(self):
+        self.assertGreaterEqual(similarity(minhash(STATE_TABLE), minhash(self.revised)), 0.9)
+
+    def test_identical_text_is_a_duplicate(self):
+        _, matches = find_near_duplicates(self.document, [STATE_TABLE])
+        self.assertEqual(matches, [('chunk', self.canonical.pk)])
+
+    def test_revised_figures_are_not_duplicates(self):
+        _, matches = find_near_duplicates(self.document, [self.revised])
+        self.assertEqual(matches, [None])
+
+    def test_batch_matches_require_identical_figures(self):
+        boilerplate = 'Note: figures are provisional and subject to revision by the source ministries. ' * 4
+        _, matches = find_near_duplicates(self.document, [
+            boilerplate, boilerplate.strip(), self.revised, self.revised.replace('1119', '1121'),
+        ])
+        self.assertEqual(matches, [None, ('batch', 0), None, None])
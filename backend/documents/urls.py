@@ -0,0 +1,9 @@
+from django.urls import path
+from .views import DocumentListCreateView, DocumentDetailView, DocumentProgressView, DocumentProgressStreamView
+
+urlpatterns = [
+    path('', DocumentListCreateView.as_view(), name='document-list'),
+    path('<uuid:pk>/', DocumentDetailView.as_view(), name='document-detail'),
+    path('<uuid:pk>/progress/', DocumentProgressView.as_view(), name='document-progress'),
+    path('<uuid:pk>/progress/stream/', DocumentProgressStreamView.as_view(), name='document-progress-stream'),
+]
@@ -1,3 +1,93 @@
-from django.shortcuts import render
+from django.db import transaction
+from rest_framework import generics, permissions
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.response import Response
 
-# Create your views here.
+from utils.pagination import KeysetPagination
+from utils.sse import event_stream
+from .models import Document
+from .permissions import IsDocumentOwnerOrAdmin
+from .progress import get_progress, iter_progress, stream_progress
+from .serializers import DocumentSerializer, DocumentUpdateSerializer
+from .tasks import process_document_task
+
+
+class DocumentListCreateView(generics.ListCreateAPIView):
+    """
+    List the documents visible to the user or upload a new document.
+
+    Uploads are streamed to disk by the upload handler and moved into
+    document storage without being read into memory; processing is queued
+    once the document row is committed.
+    """
+    serializer_class = DocumentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Document.objects.visible_to(self.request.user).select_related('category').prefetch_related('groups')
+
+    def perform_create(self, serializer):
+        uploaded = serializer.validated_data['file']
+        document = serializer.save(
+            user=self.request.user,
+            file_type=Document.detect_file_type(uploaded.name),
+            file_size=uploaded.size,
+        )
+        transaction.on_commit(lambda: process_document_task.delay(str(document.pk)))
+
+
+class DocumentDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    Retrieve, update or delete a document
+    """
+    serializer_class = DocumentUpdateSerializer
+    permission_classes = [permissions.IsAuthenticated, IsDocumentOwnerOrAdmin]
+    parser_classes = [JSONParser, MultiPartParser, FormParser]
+
+    def get_queryset(self):
+        return Document.objects.visible_to(self.request.user).select_related('category').prefetch_related('groups')
+
+    def perform_update(self, serializer):
+        uploaded = serializer.validated_data.get('file')
+        if uploaded is None:
+            serializer.save()
+            return
+
+        document = serializer.save(
+            file_type=Document.detect_file_type(uploaded.name),
+            file_size=uploaded.size,
+            status=Document.STATUS_PENDING,
+        )
+        transaction.on_commit(lambda: process_document_task.delay(str(document.pk)))
+
+    def perform_destroy(self, instance):
+        instance.file.delete(save=False)
+        instance.delete()
+
+
+class DocumentProgressView(generics.RetrieveAPIView):
+    """
+    Current ingestion progress of a document, for polling clients.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Document.objects.visible_to(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_progress(self.get_object()))
+
+
+class DocumentProgressStreamView(DocumentProgressView):
+    """
+    Ingestion progress of a document as server-sent events until it
+    finishes. Under WSGI each connection ends after a minute and
+    the client's EventSource reconnects, so a worker thread is never held
+    for a whole long ingest.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        document = self.get_object()
+        return event_stream(request, stream_progress, iter_progress, document.pk)
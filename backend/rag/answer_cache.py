@@ -0,0 +1,305 @@
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from utils.timing import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Entry ids are uuid4 hex strings; a scope item is the id followed by the float16 query vector
+ENTRY_ID_BYTES = 32
+
+
+def access_scope(user, category=None):
+    """
+    Return a key identifying the set of documents ``user`` can see, within
+    ``category`` when given.
+
+    Admins see everything; everyone else sees the public documents plus
+    the private ones they uploaded or that were shared with their groups,
+    so users with no private documents share one scope.
+    """
+    from documents.models import Document
+
+    if user.role == 'admin' or user.is_staff:
+        scope = 'all'
+    else:
+        private_ids = sorted(
+            str(pk) for pk in Document.objects.visible_to(user).filter(is_public=False).values_list('id', flat=True)
+        )
+        scope = 'public'
+        if private_ids:
+            scope += '+' + hashlib.sha256(','.join(private_ids).encode()).hexdigest()[:16]
+    if category is not None:
+        scope += f':category:{category.pk}'
+    return scope
+
+
+def _item(entry_id, vector):
+    return entry_id.encode('ascii') + np.asarray(vector, dtype=np.float16).tobytes()
+
+
+class RedisScopeIndex:
+    """
+    The entry ids and query vectors of each access scope, as a Redis list
+    of items plus a version token that changes with every write.
+
+    Appending (RPUSH, then LTRIM to the newest ``max_entries``) and
+    removing (LREM) each run in one MULTI/EXEC together with the new
+    version, so concurrent stores never lose each other's entries.
+    """
+
+    def __init__(self, client, max_entries, timeout):
+        self.client = client
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+    @staticmethod
+    def _keys(scope):
+        return f'answer_cache:scope:{scope}:items', f'answer_cache:scope:{scope}:version'
+
+    def version(self, scope):
+        version = self.client.get(self._keys(scope)[1])
+        return version.decode() if version is not None else None
+
+    def snapshot(self, scope):
+        """
+        Return ``(version, items)`` read together.
+        """
+        items_key, version_key = self._keys(scope)
+        pipe = self.client.pipeline()
+        pipe.get(version_key)
+        pipe.lrange(items_key, 0, -1)
+        version, items = pipe.execute()
+        return (version.decode() if version is not None else None), items
+
+    def append(self, scope, item):
+        items_key, version_key = self._keys(scope)
+        pipe = self.client.pipeline()
+        pipe.rpush(items_key, item)
+        pipe.ltrim(items_key, -self.max_entries, -1)
+        pipe.expire(items_key, self.timeout)
+        pipe.set(version_key, uuid.uuid4().hex, ex=self.timeout)
+        pipe.execute()
+
+    def remove(self, scope, item):
+        items_key, version_key = self._keys(scope)
+        pipe = self.client.pipeline()
+        pipe.lrem(items_key, 0, item)
+        pipe.set(version_key, uuid.uuid4().hex, ex=self.timeout)
+        pipe.execute()
+
+
+class LocalScopeIndex:
+    """
+    ``RedisScopeIndex`` over a Django cache that is not Redis. Writes are
+    read-modify-write under a process lock, which is atomic for the
+    per-process caches (locmem) this is meant for.
+    """
+
+    def __init__(self, cache, max_entries, timeout):
+        self.cache = cache
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(scope):
+        return f'answer_cache:scope:{scope}'
+
+    def version(self, scope):
+        return self.snapshot(scope)[0]
+
+    def snapshot(self, scope):
+        return self.cache.get(self._key(scope)) or (None, [])
+
+    def append(self, scope, item):
+        with self._lock:
+            _, items = self.snapshot(scope)
+            items = (items + [item])[-self.max_entries:]
+            self.cache.set(self._key(scope), (uuid.uuid4().hex, items), timeout=self.timeout)
+
+    def remove(self, scope, item):
+        with self._lock:
+            _, items = self.snapshot(scope)
+            items = [existing for existing in items if existing != item]
+            self.cache.set(self._key(scope), (uuid.uuid4().hex, items), timeout=self.timeout)
+
+
+class SemanticAnswerCache:
+    """
+    Cache of generated answers looked up by query-embedding similarity.
+
+    Each access scope keeps a bounded list of entry ids together with their
+    float16 query vectors (see RedisScopeIndex). Every process keeps the
+    decoded matrix of the ANSWER_CACHE_LOCAL_SCOPES most recently used
+    scopes and reloads it only when the scope's version changes, so a
+    lookup costs one small GET and one matrix-vector product; the best
+    match at or above ANSWER_CACHE_THRESHOLD is returned.
+
+    Entries remember a version token for every document they cite. Updating
+    or deleting a document replaces its token (see ``invalidate_document``),
+    so any entry citing it stops matching and is dropped on its next lookup.
+    """
+
+    def __init__(self, cache_alias='default', threshold=None, timeout=None, max_entries=None, scope_index=None,
+                 local_scopes=None):
+        self.cache_alias = cache_alias
+        self.threshold = settings.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.timeout = settings.ANSWER_CACHE_TIMEOUT if timeout is None else timeout
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.scope_index = scope_index or self._default_scope_index()
+        self.local_scopes = local_scopes or settings.ANSWER_CACHE_LOCAL_SCOPES
+        self._matrices = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _default_scope_index(self):
+        try:
+            from django_redis import get_redis_connection
+
+            return RedisScopeIndex(get_redis_connection(self.cache_alias), self.max_entries, self.timeout)
+        except (ImportError, NotImplementedError) as e:
+            logger.warning(f'Redis is not available for the answer cache index ({e}); using the cache backend')
+            return LocalScopeIndex(self.cache, self.max_entries, self.timeout)
+
+    @staticmethod
+    def _entry_key(entry_id):
+        return f'answer_cache:entry:{entry_id}'
+
+    @staticmethod
+    def _version_key(document_id):
+        return f'answer_cache:docver:{document_id}'
+
+    def document_versions(self, document_ids):
+        """
+        Return the current version token for each document id.
+
+        Missing tokens are created, so a token evicted from Redis reads as a
+        new version and invalidates entries instead of silently matching.
+        """
+        keys = {self._version_key(document_id): document_id for document_id in document_ids}
+        found = self.cache.get_many(list(keys))
+        for key in keys:
+            if key not in found:
+                self.cache.add(key, uuid.uuid4().hex, timeout=None)
+                found[key] = self.cache.get(key)
+        return {keys[key]: token for key, token in found.items()}
+
+    def lookup(self, scope, query_vector):
+        """
+        Return the cached entry dict for the closest query in ``scope``, or None.
+        """
+        entry = self._lookup(scope, query_vector)
+        record_cache('answer', entry is not None)
+        return entry
+
+    def _matrix(self, scope):
+        """
+        Return ``(entry ids, float16 vectors)`` of ``scope``, or None when it is empty.
+        """
+        version = self.scope_index.version(scope)
+        if version is None:
+            return None
+        with self._lock:
+            cached = self._matrices.get(scope)
+            if cached is not None and cached[0] == version:
+                self._matrices.move_to_end(scope)
+                return cached[1]
+
+        version, items = self.scope_index.snapshot(scope)
+        matrix = None
+        if items:
+            ids = [item[:ENTRY_ID_BYTES].decode('ascii') for item in items]
+            vectors = np.frombuffer(b''.join(item[ENTRY_ID_BYTES:] for item in items), dtype=np.float16)
+            matrix = ids, vectors.reshape(len(ids), -1)
+        with self._lock:
+            self._matrices[scope] = (version, matrix)
+            self._matrices.move_to_end(scope)
+            while len(self._matrices) > self.local_scopes:
+                self._matrices.popitem(last=False)
+        return matrix
+
+    def _lookup(self, scope, query_vector):
+        matrix = self._matrix(scope)
+        if matrix is None:
+            self._count('misses')
+            return None
+
+        ids, vectors = matrix
+        similarities = vectors.astype(np.float32) @ np.asarray(query_vector, dtype=np.float32)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self._count('misses')
+            return None
+
+        entry_id = ids[best]
+        entry = self.cache.get(self._entry_key(entry_id))
+        if entry is None or self.document_versions(entry['doc_versions']) != entry['doc_versions']:
+            self._count('stale')
+            self._count('misses')
+            self.cache.delete(self._entry_key(entry_id))
+            self.scope_index.remove(scope, _item(entry_id, vectors[best]))
+            return None
+
+        self._count('hits')
+        entry['similarity'] = float(similarities[best])
+        return entry
+
+    def store(self, scope, query, query_vector, answer, references, metadata=None):
+        document_ids = sorted({reference['document_id'] for reference in references})
+        entry_id = uuid.uuid4().hex
+        self.cache.set(self._entry_key(entry_id), {
+            'query': query,
+            'answer': answer,
+            'references': references,
+            'metadata': metadata or {},
+            'doc_versions': self.document_versions(document_ids),
+        }, timeout=self.timeout)
+
+        self.scope_index.append(scope, _item(entry_id, query_vector))
+
+    def invalidate_document(self, document_id):
+        """
+        Invalidate every cached answer citing the given document.
+        """
+        self.cache.set(self._version_key(document_id), uuid.uuid4().hex, timeout=None)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+        return counters
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    Return the per-process SemanticAnswerCache, or None when it is disabled.
+    """
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache()
+    return _answer_cache
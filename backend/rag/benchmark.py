@@ -0,0 +1,178 @@
+import random
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+
+STATES = (
+    'Andhra Pradesh', 'Assam', 'Bihar', 'Gujarat', 'Haryana', 'Karnataka', 'Kerala', 'Madhya Pradesh',
+    'Maharashtra', 'Odisha', 'Punjab', 'Rajasthan', 'Tamil Nadu', 'Telangana', 'Uttar Pradesh', 'West Bengal',
+)
+INDICATORS = (
+    ('Gross State Value Added', 'Rs crore'),
+    ('Per Capita Income', 'Rs'),
+    ('Labour Force Participation Rate', 'per cent'),
+    ('Unemployment Rate', 'per cent'),
+    ('Index of Industrial Production', 'index'),
+    ('Consumer Price Index', 'index'),
+    ('Monthly Per Capita Expenditure', 'Rs'),
+    ('Literacy Rate', 'per cent'),
+)
+SURVEYS = (
+    'Periodic Labour Force Survey', 'Annual Survey of Industries', 'Household Consumption Expenditure Survey',
+    'National Sample Survey', 'Annual Survey of Unincorporated Sector Enterprises',
+)
+SECTORS = ('agriculture', 'manufacturing', 'construction', 'trade', 'transport', 'financial services')
+PHRASES = (
+    'Estimates are based on a stratified multi-stage sample design.',
+    'Figures for the latest year are provisional and subject to revision.',
+    'The reference period for the survey was July to June.',
+    'Rural and urban estimates have been combined using population weights.',
+    'Totals may not add up due to rounding of individual figures.',
+    'Detailed unit level data is available through the microdata portal.',
+)
+LINES_PER_PAGE = 48
+
+
+@dataclass
+class SyntheticDocument:
+    """
+    A generated statistical report: its pages of text and the facts it states.
+    """
+    title: str
+    pages: list
+    facts: list = field(default_factory=list)
+
+
+def synthetic_document(seed, pages):
+    """
+    Generate a report shaped like a MoSPI publication: narrative paragraphs
+    citing indicators for states and years, and state-wise tables.
+
+    ``facts`` holds ``(indicator, state, year)`` triples mentioned in the
+    text, which make realistic benchmark questions.
+    """
+    rng = random.Random(seed)
+    survey = rng.choice(SURVEYS)
+    first_year = rng.randint(2011, 2018)
+    title = f'{survey} Report {first_year}-{first_year + 5} (No. {seed})'
+    document = SyntheticDocument(title=title, pages=[])
+
+    for page_number in range(pages):
+        lines = [f'{title} - page {page_number + 1}']
+        if page_number % 3 == 2:
+            indicator, unit = rng.choice(INDICATORS)
+            years = list(range(first_year, first_year + 4))
+            lines.append(f'Table {page_number + 1}.1: State-wise {indicator} ({unit})')
+            lines.append('State ' + ' '.join(str(year) for year in years))
+            for state in rng.sample(STATES, 12):
+                base = rng.uniform(10, 5000)
+                lines.append(f'{state} ' + ' '.join(f'{base * (1 + 0.05 * n):,.1f}' for n in range(len(years))))
+            lines.append('Source: ' + survey)
+        while len(lines) < LINES_PER_PAGE:
+            indicator, unit = rng.choice(INDICATORS)
+            state = rng.choice(STATES)
+            year = rng.randint(first_year, first_year + 5)
+            value = rng.uniform(1, 1000)
+            change = rng.uniform(-5, 12)
+            sentence = (
+                f'The {indicator} of {state} was {value:,.1f} {unit} in {year}, a change of {change:.1f} per cent '
+                f'over {year - 1}, driven mainly by {rng.choice(SECTORS)}. {rng.choice(PHRASES)}'
+            )
+            lines.extend(_wrap(sentence, 95))
+            document.facts.append((indicator, state, year))
+        document.pages.append(lines[:LINES_PER_PAGE])
+    return document
+
+
+def synthetic_questions(documents, count, seed=0):
+    rng = random.Random(seed)
+    facts = [fact for document in documents for fact in document.facts]
+    templates = (
+        'What was the {indicator} of {state} in {year}?',
+        'How did the {indicator} change in {state} during {year}?',
+        'Which sectors drove the {indicator} of {state} in {year}?',
+    )
+    questions = []
+    for _ in range(count):
+        indicator, state, year = rng.choice(facts)
+        questions.append(rng.choice(templates).format(indicator=indicator, state=state, year=year))
+    return questions
+
+
+def _wrap(text, width):
+    lines, line = [], ''
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def _pdf_string(text):
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def render_pdf(pages):
+    """
+    Render pages of text lines as a minimal PDF with compressed content streams.
+    """
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None]
+    font = 3 + 2 * len(pages)
+    kids = []
+    streams = {}
+    for lines in pages:
+        page_id = len(objects) + 1
+        kids.append(f'{page_id} 0 R')
+        content = 'BT /F1 9 Tf 40 800 Td 15 TL ' + ' '.join(f'({_pdf_string(line)}) Tj T*' for line in lines) + ' ET'
+        objects.append(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] '
+            f'/Resources << /Font << /F1 {font} 0 R >> >> /Contents {page_id + 1} 0 R >>'
+        )
+        streams[page_id + 1] = zlib.compress(content.encode('latin-1'))
+        objects.append(None)
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(pages)} >>'
+    objects.append('<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode()
+        if number in streams:
+            data = streams[number]
+            out += f'<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n'.encode() + data + b'\nendstream'
+        else:
+            out += body.encode('latin-1')
+        out += b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(out)
+
+
+def render_text(pages):
+    return '\n\n'.join('\n'.join(lines) for lines in pages).encode('utf-8')
+
+
+def summarize(samples):
+    """
+    Latency summary in milliseconds for a list of durations in seconds.
+    """
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(values.mean()), 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
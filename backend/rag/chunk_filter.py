@@ -0,0 +1,342 @@
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_KEY = 'public'
+
+# Set bits per byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+_index = None
+_index_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def user_filter_keys(user):
+    """
+    Keys of the chunk sets ``user`` may search, or None for admins, who see
+    every document.
+    """
+    if user.role == 'admin' or user.is_staff:
+        return None
+    groups = user.groups.values_list('pk', flat=True)
+    return [PUBLIC_KEY, f'owner:{user.pk}'] + [f'group:{pk}' for pk in groups]
+
+
+def document_filter_keys(document):
+    """
+    Keys of the chunk sets a document's chunks belong to.
+    """
+    keys = [f'group:{group.pk}' for group in document.groups.all()]
+    if document.is_public:
+        keys.append(PUBLIC_KEY)
+    if document.user_id:
+        keys.append(f'owner:{document.user_id}')
+    if document.category_id:
+        keys.append(f'category:{document.category_id}')
+    return keys
+
+
+def invalidate_chunk_filters(keys):
+    """
+    Mark the chunk sets of ``keys`` as changed once the current transaction
+    commits; every process rebuilds its copy on next use.
+    """
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({_token_key(key): uuid.uuid4().hex for key in keys}, timeout=None))
+
+
+def _token_key(key):
+    return f'rag:filter:{key}'
+
+
+def _chunk_ids(key):
+    """
+    Ids of the indexed chunks behind the chunks of documents with ``key``.
+
+    Near-duplicates are only indexed through their canonical chunk, so a
+    duplicate in one of the documents admits its canonical chunk;
+    ``Retriever.load_visible_chunks`` then serves the duplicate instead.
+    """
+    from documents.models import DocumentChunk
+
+    kind, _, value = key.partition(':')
+    chunks = DocumentChunk.objects.all()
+    if kind == 'public':
+        chunks = chunks.filter(document__is_public=True)
+    elif kind == 'owner':
+        chunks = chunks.filter(document__user_id=value)
+    elif kind == 'group':
+        chunks = chunks.filter(document__groups=value)
+    elif kind == 'category':
+        chunks = chunks.filter(document__category_id=value)
+    else:
+        raise ValueError(f'Unknown chunk filter key: {key}')
+    ids = chunks.annotate(indexed_id=Coalesce('duplicate_of_id', 'id')).values_list('indexed_id', flat=True)
+    return np.fromiter(ids.iterator(chunk_size=10000), dtype=np.int64)
+
+
+def _pack(ids, size):
+    """
+    Bitmap of ``size`` bytes with the bits of ``ids`` set, least significant bit first.
+    """
+    bits = np.zeros(size * 8, dtype=bool)
+    bits[ids] = True
+    return np.packbits(bits, bitorder='little')
+
+
+class ChunkSet:
+    """
+    The indexed chunk ids of one filter key at the version ``token``.
+
+    Kept as a sorted id array while that is smaller than a bitmap covering
+    ids up to the largest one, and as a bitmap otherwise, so a user's own
+    handful of chunks costs a few bytes and the public corpus one bit per
+    chunk id.
+    """
+    __slots__ = ('token', 'count', 'ids', 'bitmap')
+
+    def __init__(self, token, ids):
+        ids = np.unique(ids)
+        self.token = token
+        self.count = int(ids.size)
+        size = int(ids[-1]) // 8 + 1 if ids.size else 0
+        if ids.size * 8 > size:
+            self.ids, self.bitmap = None, _pack(ids, size)
+        else:
+            self.ids, self.bitmap = ids, None
+
+    @property
+    def size(self):
+        """
+        Bytes of bitmap needed to hold this set.
+        """
+        if self.bitmap is not None:
+            return self.bitmap.size
+        return int(self.ids[-1]) // 8 + 1 if self.ids.size else 0
+
+    def add_to(self, bitmap):
+        if self.bitmap is not None:
+            bitmap[:self.bitmap.size] |= self.bitmap
+        elif self.ids.size:
+            np.bitwise_or.at(bitmap, self.ids >> 3, (1 << (self.ids & 7)).astype(np.uint8))
+
+
+def _union(chunk_sets):
+    bitmap = np.zeros(max((chunk_set.size for chunk_set in chunk_sets), default=0), dtype=np.uint8)
+    for chunk_set in chunk_sets:
+        chunk_set.add_to(bitmap)
+    return bitmap
+
+
+class ChunkFilter:
+    """
+    The chunk ids a search may return, as a bitmap: bit ``i`` of the array,
+    least significant bit first, is set for chunk id ``i``. This is the
+    layout FAISS's IDSelectorBitmap reads, so vector stores pass it to the
+    index as is. Chunks newer than the bitmap are not members.
+    """
+
+    def __init__(self, bitmap):
+        self.bitmap = np.ascontiguousarray(bitmap, dtype=np.uint8)
+        self.count = int(_POPCOUNT[self.bitmap].sum(dtype=np.int64))
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return cls(_pack(ids, int(ids.max()) // 8 + 1 if ids.size else 0))
+
+    def contains(self, ids):
+        """
+        Boolean mask of which ``ids`` are members.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        inside = (ids >= 0) & (ids < self.bitmap.size * 8)
+        members = np.zeros(ids.shape, dtype=bool)
+        selected = ids[inside]
+        members[inside] = (self.bitmap[selected >> 3] >> (selected & 7).astype(np.uint8)) & 1
+        return members
+
+    def ids(self):
+        return np.flatnonzero(np.unpackbits(self.bitmap, bitorder='little'))
+
+
+class ChunkFilterIndex:
+    """
+    Per-process chunk sets behind search pre-filters.
+
+    Every document puts its chunks in the sets of its access keys (public,
+    owner, each group it is shared with) and of its category; a user's
+    filter is the union of the access sets they hold, intersected with the
+    requested category and its subcategories. Sets are built from the
+    database on first use and then kept, at most RAG_FILTER_MAX_SETS of them,
+    least recently used first out, together with the filters combined from
+    them.
+
+    Each key has a version token in the cache, replaced by
+    ``invalidate_chunk_filters`` whenever the key's documents or chunks
+    change. A set whose token changed keeps being used while one background
+    thread rebuilds it, so queries never wait on a rebuild of a large set;
+    until it finishes, newly indexed chunks are missing from the filter and
+    chunks that left it are still admitted, which the visibility check in
+    ``Retriever.load_visible_chunks`` catches.
+    """
+
+    def __init__(self, max_sets=None):
+        self.max_sets = max_sets or settings.RAG_FILTER_MAX_SETS
+        self._sets = OrderedDict()
+        self._filters = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def tokens(self, keys):
+        names = {_token_key(key): key for key in keys}
+        found = cache.get_many(list(names))
+        for name in names:
+            if name not in found:
+                cache.add(name, uuid.uuid4().hex, timeout=None)
+                found[name] = cache.get(name)
+        return {names[name]: token for name, token in found.items()}
+
+    def filter_for(self, keys, category_keys=None):
+        """
+        Return the ChunkFilter for the union of ``keys`` (every key when
+        None) intersected with the union of ``category_keys`` (no category
+        restriction when None).
+        """
+        tokens = self.tokens(list(keys or ()) + list(category_keys or ()))
+        access = None if keys is None else [self.chunk_set(key, tokens[key]) for key in keys]
+        categories = None if category_keys is None else [self.chunk_set(key, tokens[key]) for key in category_keys]
+        signature = (
+            None if access is None else tuple((key, s.token) for key, s in zip(keys, access)),
+            None if categories is None else tuple((key, s.token) for key, s in zip(category_keys, categories)),
+        )
+        with self._lock:
+            chunk_filter = self._filters.get(signature)
+            if chunk_filter is not None:
+                self._filters.move_to_end(signature)
+                return chunk_filter
+
+        if access is None:
+            bitmap = _union(categories)
+        elif categories is None:
+            bitmap = _union(access)
+        else:
+            bitmap, allowed = _union(access), _union(categories)
+            size = min(bitmap.size, allowed.size)
+            bitmap = bitmap[:size] & allowed[:size]
+        chunk_filter = ChunkFilter(bitmap)
+        with self._lock:
+            self._filters[signature] = chunk_filter
+            while len(self._filters) > self.max_sets:
+                self._filters.popitem(last=False)
+        return chunk_filter
+
+    def chunk_set(self, key, token):
+        with self._lock:
+            current = self._sets.get(key)
+            if current is not None:
+                self._sets.move_to_end(key)
+        if current is None:
+            return self._build(key, token)
+        if current.token != token:
+            self._refresh_later(key, token)
+        return current
+
+    def _build(self, key, token):
+        chunk_set = ChunkSet(token, _chunk_ids(key))
+        with self._lock:
+            self._sets[key] = chunk_set
+            self._sets.move_to_end(key)
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+        return chunk_set
+
+    def _refresh_later(self, key, token):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        get_filter_executor().submit(self._refresh, key, token)
+
+    def _refresh(self, key, token):
+        try:
+            self._build(key, token)
+        except Exception:
+            logger.exception(f'Could not rebuild the chunk filter set {key}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            close_old_connections()
+
+    def stats(self):
+        with self._lock:
+            sets = list(self._sets.values())
+            filters = len(self._filters)
+        return {
+            'sets': len(sets),
+            'filters': filters,
+            'chunks': sum(chunk_set.count for chunk_set in sets),
+            'bytes': sum(chunk_set.ids.nbytes if chunk_set.bitmap is None else chunk_set.bitmap.nbytes for chunk_set in sets),
+        }
+
+
+def get_filter_executor():
+    """
+    Single background thread rebuilding stale chunk sets.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rag-filter')
+    return _executor
+
+
+def _reset_after_fork():
+    # Pool threads do not survive fork()
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_filter_index():
+    """
+    Return the per-process ChunkFilterIndex.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ChunkFilterIndex()
+    return _index
+
+
+def build_chunk_filter(user, category=None):
+    """
+    Return the ChunkFilter of the chunks ``user`` may search, limited to
+    ``category`` and its subcategories when given, or None when nothing
+    needs filtering (an admin searching every category).
+    """
+    keys = user_filter_keys(user)
+    category_keys = [f'category:{pk}' for pk in sorted(map(str, category.with_descendants()))] if category else None
+    if keys is None and category_keys is None:
+        return None
+    return get_filter_index().filter_for(keys, category_keys)
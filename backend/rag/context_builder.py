@@ -0,0 +1,135 @@
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+# Share of the budget left after the summary that the verbatim history window may use
+HISTORY_SHARE = 0.3
+
+SYSTEM_INSTRUCTION = (
+    'You are an assistant for the Ministry of Statistics and Programme Implementation (MoSPI). '
+    'Answer questions using only the provided document excerpts. Cite sources as [n] using the '
+    'excerpt numbers. If the excerpts do not contain the answer, say so.'
+)
+
+SUMMARY_INSTRUCTION = (
+    'You maintain a running summary of a conversation between a user and a statistics assistant. '
+    'Update the summary with the new messages. Keep facts, figures, documents and open questions the '
+    'user may refer back to; drop pleasantries. Reply with the updated summary only.'
+)
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (about four characters per token for English text).
+    """
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, tokens):
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(' ', 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + ' ...'
+
+
+@dataclass
+class PackedContext:
+    retrieved: list = field(default_factory=list)
+    history: list = field(default_factory=list)
+    summary: str = ''
+    tokens: int = 0
+
+
+def pack_context(question, retrieved, history=(), summary='', budget=None):
+    """
+    Choose what goes into the prompt so it stays within ``budget`` tokens.
+
+    The question and instructions always go in. The rolling summary comes
+    next, capped at CONVERSATION_SUMMARY_MAX_TOKENS; the history window then
+    gets up to HISTORY_SHARE of what is left, newest messages first. Excerpts
+    fill the remainder in rank order, and the first one is truncated rather
+    than dropped if it does not fit on its own.
+    """
+    budget = budget or settings.RAG_CONTEXT_TOKEN_BUDGET
+    remaining = budget - estimate_tokens(SYSTEM_INSTRUCTION) - estimate_tokens(question) - 32
+    packed = PackedContext()
+
+    if summary and remaining > 0:
+        packed.summary = truncate_to_tokens(summary, min(settings.CONVERSATION_SUMMARY_MAX_TOKENS, remaining))
+        remaining -= estimate_tokens(packed.summary)
+
+    allowance = int(max(remaining, 0) * HISTORY_SHARE)
+    for message in reversed(list(history)):
+        cost = estimate_tokens(message.content) + 4
+        if cost > allowance:
+            break
+        packed.history.insert(0, message)
+        allowance -= cost
+        remaining -= cost
+
+    for item in retrieved:
+        cost = estimate_tokens(item.chunk.text_content) + 16
+        if cost > remaining:
+            if not packed.retrieved and remaining > 64:
+                item.chunk.text_content = truncate_to_tokens(item.chunk.text_content, remaining - 16)
+                packed.retrieved.append(item)
+                remaining = 0
+            break
+        packed.retrieved.append(item)
+        remaining -= cost
+
+    packed.tokens = budget - max(remaining, 0)
+    return packed
+
+
+def format_sources(retrieved):
+    lines = []
+    for number, item in enumerate(retrieved, start=1):
+        chunk = item.chunk
+        lines.append(f'[{number}] {chunk.document.title} (page {chunk.page_number}):\n{chunk.text_content}')
+    return '\n\n'.join(lines)
+
+
+def format_history(messages):
+    return '\n'.join(f'{"User" if message.is_user else "Assistant"}: {message.content}' for message in messages)
+
+
+def build_prompt(question, retrieved, history=(), summary=''):
+    """
+    Assemble the prompt sent to the LLM from summary, history, excerpts and the question.
+    """
+    sections = []
+    if summary:
+        sections.append(f'Summary of the earlier conversation:\n{summary}')
+    if history:
+        sections.append(f'Conversation so far:\n{format_history(history)}')
+    sections.append(f'Document excerpts:\n{format_sources(retrieved) or "(none found)"}')
+    sections.append(f'Question: {question}')
+    return '\n\n'.join(sections)
+
+
+def build_summary_prompt(summary, messages):
+    """
+    Prompt that folds ``messages`` into the existing rolling ``summary``.
+    """
+    return (
+        f'Current summary:\n{summary or "(empty)"}\n\n'
+        f'New messages:\n{format_history(messages)}'
+    )
+
+
+def build_references(retrieved):
+    """
+    Source attribution stored on the assistant message.
+    """
+    return [
+        {
+            'document_id': str(item.chunk.document_id),
+            'title': item.chunk.document.title,
+            'chunk_id': item.chunk.id,
+            'page_number': item.chunk.page_number,
+            'score': round(float(item.score), 4),
+        }
+        for item in retrieved
+    ]
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from utils.text_processors import normalize_text
+from utils.timing import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEmbeddingStore:
+    """
+    On-disk key/blob store backed by SQLite with least-recently-used eviction.
+
+    Used as the fallback tier when Redis is unavailable and as a second-level
+    cache behind it. The number of rows is checked every ``check_interval``
+    writes; once it exceeds ``max_entries`` the least recently read rows are
+    deleted until the store is back at 90% of the limit.
+    """
+
+    def __init__(self, path, max_entries, check_interval=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connection(self):
+        # SQLite connections must not be shared across threads or forked processes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings(accessed)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        conn = self._connection()
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ','.join('?' * len(part))
+            rows = conn.execute(f'SELECT key, value FROM embeddings WHERE key IN ({placeholders})', part)
+            found.update(rows.fetchall())
+        if found:
+            hit_keys = list(found)
+            for start in range(0, len(hit_keys), 500):
+                part = hit_keys[start:start + 500]
+                placeholders = ','.join('?' * len(part))
+                conn.execute(f'UPDATE embeddings SET accessed = ? WHERE key IN ({placeholders})', [time.time()] + part)
+        return found
+
+    def set_many(self, mapping):
+        if not mapping:
+            return
+        now = time.time()
+        conn = self._connection()
+        conn.executemany(
+            'INSERT OR REPLACE INTO embeddings (key, value, accessed) VALUES (?, ?, ?)',
+            [(key, value, now) for key, value in mapping.items()],
+        )
+        with self._writes_lock:
+            self._writes += len(mapping)
+            due = self._writes >= self.check_interval
+            if due:
+                self._writes = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        conn = self._connection()
+        count = conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        if count <= self.max_entries:
+            return 0
+        excess = count - int(self.max_entries * 0.9)
+        conn.execute(
+            'DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)',
+            (excess,),
+        )
+        logger.debug(f'Evicted {excess} entries from local embedding cache')
+        return excess
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, two-tier cache of embedding vectors.
+
+    Keys are a SHA-256 of the normalized text together with EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION and the storage dtype, so changing any of them never
+    serves stale vectors. Values are raw float16/float32 byte blobs. The first
+    tier is the ``default`` Django cache (Redis), bounded by
+    EMBEDDING_CACHE_TIMEOUT and the server's maxmemory policy; the second is a
+    size-bounded local SQLite file that also serves reads while Redis is down.
+    Callers on the request path pass ``local=False`` to skip the SQLite tier,
+    so a chat query never waits on a disk write.
+    """
+
+    def __init__(self, cache_alias='default', local_store=None, dtype=None, timeout=None):
+        self.cache_alias = cache_alias
+        self.local_store = local_store
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_CACHE_DTYPE)
+        self.timeout = settings.EMBEDDING_CACHE_TIMEOUT if timeout is None else timeout
+        self.dimension = settings.EMBEDDING_DIMENSION
+        self._prefix = f'emb:{settings.EMBEDDING_MODEL}:{self.dimension}:{self.dtype.name}'
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'local_hits': 0, 'misses': 0, 'errors': 0}
+
+    def key_for(self, text):
+        normalized = unicodedata.normalize('NFC', normalize_text(text))
+        digest = hashlib.sha256(f'{self._prefix}\x00{normalized}'.encode('utf-8')).hexdigest()
+        return f'emb:{digest}'
+
+    def encode_vector(self, vector):
+        return np.asarray(vector, dtype=self.dtype).tobytes()
+
+    def decode_vector(self, blob):
+        vector = np.frombuffer(blob, dtype=self.dtype)
+        if vector.size != self.dimension:
+            return None
+        return vector.astype(np.float32)
+
+    def get_many(self, texts, local=True):
+        """
+        Return ``{index: vector}`` for every text in ``texts`` found in the
+        cache, looking in the local tier too when ``local`` is set.
+        """
+        keys = [self.key_for(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        blobs = {}
+
+        try:
+            blobs.update(caches[self.cache_alias].get_many(unique_keys))
+        except Exception as e:
+            self._count('errors')
+            logger.debug(f'Embedding cache primary tier unavailable: {e}')
+        primary_found = len(blobs)
+
+        local_blobs = {}
+        if local and self.local_store is not None and len(blobs) < len(unique_keys):
+            missing = [key for key in unique_keys if key not in blobs]
+            try:
+                local_blobs = self.local_store.get_many(missing)
+            except sqlite3.Error as e:
+                self._count('errors')
+                logger.warning(f'Local embedding cache read failed: {e}')
+            blobs.update(local_blobs)
+            if local_blobs:
+                self._set_primary(local_blobs)
+
+        found = {}
+        for index, key in enumerate(keys):
+            blob = blobs.get(key)
+            vector = self.decode_vector(blob) if blob is not None else None
+            if vector is not None:
+                found[index] = vector
+
+        with self._lock:
+            self.counters['hits'] += primary_found
+            self.counters['local_hits'] += len(local_blobs)
+            self.counters['misses'] += len(unique_keys) - len(blobs)
+        record_cache('embedding', len(blobs), len(unique_keys))
+        return found
+
+    def set_many(self, texts, vectors, local=True):
+        mapping = {self.key_for(text): self.encode_vector(vector) for text, vector in zip(texts, vectors)}
+        self._set_primary(mapping)
+        if local and self.local_store is not None:
+            try:
+                self.local_store.set_many(mapping)
+            except sqlite3.Error as e:
+                self._count('errors')
+                logger.warning(f'Local embedding cache write failed: {e}')
+
+    def _set_primary(self, mapping):
+        try:
+            caches[self.cache_alias].set_many(mapping, timeout=self.timeout)
+        except Exception as e:
+            self._count('errors')
+            logger.debug(f'Embedding cache primary tier unavailable: {e}')
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['local_hits'] + counters['misses']
+        counters['hit_ratio'] = round((counters['hits'] + counters['local_hits']) / lookups, 4) if lookups else 0.0
+        counters['dtype'] = self.dtype.name
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Return the per-process EmbeddingCache, or None when caching is disabled.
+    """
+    global _cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                local_store = None
+                if settings.EMBEDDING_CACHE_LOCAL_PATH:
+                    local_store = LocalEmbeddingStore(
+                        settings.EMBEDDING_CACHE_LOCAL_PATH,
+                        settings.EMBEDDING_CACHE_LOCAL_MAX_ENTRIES,
+                    )
+                _cache = EmbeddingCache(local_store=local_store)
+    return _cache
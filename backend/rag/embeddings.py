@@ -0,0 +1,261 @@
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+from .embedding_cache import get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def get_embedding_model():
+    """
+    Load the sentence-transformers model named by EMBEDDING_MODEL once per process.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    logger.info(f'Loading embedding model {settings.EMBEDDING_MODEL}')
+    return SentenceTransformer(settings.EMBEDDING_MODEL, device='cpu')
+
+
+class _EncodeRequest:
+    __slots__ = ('texts', 'future', 'enqueued_at')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingMetrics:
+    """
+    Thread-safe counters for encode throughput and query-embedding latency.
+    """
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.batches = 0
+        self.encode_seconds = 0.0
+        self._batch_sizes = deque(maxlen=window)
+        self._query_latencies = deque(maxlen=window)
+
+    def record_batch(self, size, seconds):
+        with self._lock:
+            self.texts += size
+            self.batches += 1
+            self.encode_seconds += seconds
+            self._batch_sizes.append(size)
+
+    def record_query_latency(self, seconds):
+        with self._lock:
+            self._query_latencies.append(seconds)
+
+    def as_dict(self):
+        with self._lock:
+            latencies = np.array(self._query_latencies) * 1000
+            batch_sizes = list(self._batch_sizes)
+            return {
+                'texts': self.texts,
+                'batches': self.batches,
+                'encode_seconds': round(self.encode_seconds, 3),
+                'texts_per_second': round(self.texts / self.encode_seconds, 1) if self.encode_seconds else 0.0,
+                'mean_batch_size': round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0.0,
+                'query_latency_ms': {
+                    'count': int(latencies.size),
+                    'p50': round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+                    'p95': round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+                },
+            }
+
+
+class EmbeddingService:
+    """
+    Process-wide embedding service that coalesces concurrent encode requests.
+
+    Callers (query handlers, ingestion tasks) block on a future while a single
+    background thread drains the request queue: it takes the first waiting
+    request, then keeps collecting requests until either
+    EMBEDDING_MAX_BATCH_SIZE texts are gathered or EMBEDDING_MAX_WAIT_MS has
+    passed, and encodes them in one model call. On CPU this keeps the matrix
+    multiplications large enough to use the available throughput.
+    """
+
+    def __init__(self, max_batch_size=None, max_wait_ms=None):
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+        max_wait_ms = settings.EMBEDDING_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_wait = max_wait_ms / 1000.0
+        self.metrics = EmbeddingMetrics()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def encode(self, texts, timeout=None, use_cache=True, local_cache=True):
+        """
+        Encode a list of texts, returning an ``(n, EMBEDDING_DIMENSION)`` float32 array.
+
+        Texts already present in the embedding cache are served from it and
+        only the remaining unique texts are sent to the model. ``local_cache``
+        False leaves out the cache's SQLite tier.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, settings.EMBEDDING_DIMENSION), dtype=np.float32)
+
+        cache = get_embedding_cache() if use_cache else None
+        if cache is None:
+            return self._encode_uncached(texts, timeout)
+
+        vectors = np.empty((len(texts), settings.EMBEDDING_DIMENSION), dtype=np.float32)
+        cached = cache.get_many(texts, local=local_cache)
+        for index, vector in cached.items():
+            vectors[index] = vector
+
+        # Texts that normalize to the same cache key are encoded only once
+        missing = {}
+        for index, text in enumerate(texts):
+            if index not in cached:
+                missing.setdefault(cache.key_for(text), (text, []))[1].append(index)
+        if missing:
+            unique_texts = [text for text, _ in missing.values()]
+            encoded = self._encode_uncached(unique_texts, timeout)
+            for (_, indexes), vector in zip(missing.values(), encoded):
+                vectors[indexes] = vector
+            cache.set_many(unique_texts, encoded, local=local_cache)
+        return vectors
+
+    def _encode_uncached(self, texts, timeout=None):
+        self._ensure_worker()
+        request = _EncodeRequest(texts)
+        self._queue.put(request)
+        return request.future.result(timeout)
+
+    def encode_query(self, text, timeout=None):
+        """
+        Encode a single query string and record its end-to-end latency.
+
+        Queries skip the SQLite cache tier: they are rarely repeated once
+        Redis has expired them, and a synchronous SQLite write would sit on
+        every chat request.
+        """
+        started = time.perf_counter()
+        vector = self.encode([text], timeout=timeout, local_cache=False)[0]
+        self.metrics.record_query_latency(time.perf_counter() - started)
+        return vector
+
+    def stats(self):
+        result = self.metrics.as_dict()
+        cache = get_embedding_cache()
+        result['cache'] = cache.stats() if cache is not None else None
+        result.update({
+            'model': settings.EMBEDDING_MODEL,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+        })
+        return result
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self._encode_batch(batch)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _encode_batch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+        try:
+            vectors = get_embedding_model().encode(
+                texts,
+                batch_size=max(self.max_batch_size, 1),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            ).astype(np.float32, copy=False)
+        except Exception as e:
+            logger.exception('Embedding batch failed')
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        self.metrics.record_batch(len(texts), time.perf_counter() - started)
+        offset = 0
+        for request in batch:
+            count = len(request.texts)
+            request.future.set_result(vectors[offset:offset + count])
+            offset += count
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    """
+    Return the per-process EmbeddingService, creating it on first use.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+
+def _reset_after_fork():
+    # The batching thread does not survive fork(); prefork Celery and Gunicorn
+    # workers get a fresh service (and queue) of their own.
+    global _service, _service_lock
+    _service = None
+    _service_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def embed_texts(texts):
+    """
+    Encode a list of texts into L2-normalized float32 vectors.
+    """
+    return get_embedding_service().encode(texts)
+
+
+def embed_query(text):
+    """
+    Encode a single query string into an L2-normalized float32 vector.
+    """
+    return get_embedding_service().encode_query(text)
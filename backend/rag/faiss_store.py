@@ -0,0 +1,663 @@
+import logging
+import math
+import os
+import threading
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+from .segments import SegmentDirectory
+from .vector_store import BaseVectorStore
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ('none', 'int8', 'binary')
+# Rows copied per step when rewriting a full-precision vector file
+COPY_BATCH_ROWS = 65536
+
+
+def _as_matrix(vectors, dimension):
+    matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, dimension))
+    faiss.normalize_L2(matrix)
+    return matrix
+
+
+def _binarize(vectors):
+    """
+    Sign-bit codes: one bit per dimension, packed into d/8 bytes.
+    """
+    return np.packbits(vectors > 0, axis=1)
+
+
+class _Segment:
+    __slots__ = ('index', 'kind', 'seq', 'excluded', 'selector', 'vector_ids', 'vector_rows', 'vectors')
+
+    def __init__(self, index, kind, seq, excluded, full=None):
+        self.index = index
+        self.kind = kind
+        self.seq = seq
+        # Keep the id array alive for as long as the selector that points at it
+        self.excluded = excluded
+        self.selector = None
+        if excluded.size:
+            self.selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(excluded))
+        # Full-precision vectors of a quantized segment, memory-mapped from disk
+        self.vector_ids = self.vector_rows = self.vectors = None
+        if full is not None:
+            ids, self.vectors = full
+            self.vector_rows = np.argsort(ids, kind='stable')
+            self.vector_ids = ids[self.vector_rows]
+
+
+class _VectorFile:
+    """
+    Append-only full-precision copy of a quantized main segment.
+
+    Vectors are written as a raw float32 matrix, so readers can memory-map
+    it and only touch the rows they rescore; the chunk id of every row is
+    kept in memory and saved separately by ``FaissVectorStore``.
+    """
+
+    def __init__(self, path, dimension):
+        self.path = path
+        self.dimension = dimension
+        self.ids = []
+        self._fh = open(path, 'wb')
+
+    def append(self, ids, vectors):
+        if len(ids):
+            self._fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            self.ids.append(np.asarray(ids, dtype=np.int64))
+
+    def copy_from(self, ids, vectors, exclude):
+        for start in range(0, ids.size, COPY_BATCH_ROWS):
+            batch_ids = ids[start:start + COPY_BATCH_ROWS]
+            keep = ~np.isin(batch_ids, exclude)
+            self.append(batch_ids[keep], vectors[start:start + COPY_BATCH_ROWS][keep])
+
+    def all_ids(self):
+        return np.concatenate(self.ids) if self.ids else np.empty(0, dtype=np.int64)
+
+    def load(self):
+        """
+        Read everything written so far into memory, for rebuilding an index.
+        """
+        self._fh.flush()
+        return self.all_ids(), np.fromfile(self.path, dtype=np.float32).reshape(-1, self.dimension)
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class FaissVectorStore(BaseVectorStore):
+    """
+    FAISS vector store persisted on disk and shared by every worker process.
+
+    The index directory holds a large *main* segment (IVF or HNSW, chosen by
+    FAISS_INDEX_TYPE), a few small flat *delta* segments written by ingestion,
+    and *tombstone* files listing deleted chunk ids, all described by
+    ``manifest.json``. Readers memory-map the main segment, so web and Celery
+    workers on a node share the same page-cache pages instead of each holding
+    a private copy, and reload whenever the manifest changes.
+
+    The directory layout, locking and tombstone rules are those of
+    SegmentDirectory: an add writes a new delta segment, a delete writes a
+    tombstone, and an upsert is a tombstone followed by a delta. Compaction folds deltas and tombstones into a new main segment in the
+    background once FAISS_MAX_DELTA_SEGMENTS or FAISS_MAX_DELTA_VECTORS is
+    exceeded.
+
+    With FAISS_QUANTIZATION the main segment stores compressed codes
+    instead of float32 vectors: ``int8`` keeps one byte per dimension (4x
+    smaller) and ``binary`` one sign bit per dimension (32x smaller,
+    searched exhaustively by Hamming distance). The float32 vectors are
+    kept next to it in a memory-mapped sidecar file; a search fetches
+    FAISS_RESCORE_FACTOR times as many candidates from the codes and
+    rescores them exactly, so only those rows are read from disk.
+
+    A search restricted to a ChunkFilter hands its bitmap to FAISS as an
+    ID selector, so excluded chunks are skipped inside the index rather
+    than filtered out of the results. nprobe/efSearch grow with the share
+    of the index the filter excludes, up to RAG_FILTER_MAX_BOOST times;
+    filters more selective than that, or admitting at most
+    RAG_FILTER_EXACT_MAX_CHUNKS chunks, are searched exhaustively, which
+    only computes distances for their members.
+    """
+
+    def __init__(self, path=None, index_type=None, dimension=None, quantization=None, rescore_factor=None):
+        self.path = path or os.path.join(settings.RAG_INDEX_DIR, 'faiss')
+        self.index_type = index_type or settings.FAISS_INDEX_TYPE
+        self.dimension = dimension or settings.EMBEDDING_DIMENSION
+        self.quantization = quantization or settings.FAISS_QUANTIZATION
+        self.rescore_factor = rescore_factor or settings.FAISS_RESCORE_FACTOR
+        if self.index_type not in ('flat', 'ivf', 'hnsw'):
+            raise ValueError(f'Unsupported FAISS_INDEX_TYPE: {self.index_type}')
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f'Unsupported FAISS_QUANTIZATION: {self.quantization}')
+        if self.quantization == 'binary' and self.dimension % 8:
+            raise ValueError('Binary quantization needs an embedding dimension divisible by 8')
+        self.directory = SegmentDirectory(self.path)
+        self._load_lock = threading.Lock()
+        self._segments = []
+        self._manifest_stamp = None
+
+    def _write_index(self, index, name):
+        with self.directory.atomic_path(name) as tmp:
+            self._save_index(index, tmp)
+
+    @staticmethod
+    def _save_index(index, path):
+        if isinstance(index, faiss.IndexBinary):
+            faiss.write_index_binary(index, path)
+        else:
+            faiss.write_index(index, path)
+
+    def _read_index(self, entry, mmap=False):
+        path = self.directory.file(entry['file'])
+        read = faiss.read_index_binary if entry['kind'] == 'binary' else faiss.read_index
+        if not mmap:
+            return read(path)
+        # IO_FLAG_MMAP alone only maps IVF inverted lists; flat, HNSW and
+        # scalar-quantized codes are copied into private memory unless the
+        # codes themselves are mapped (IO_FLAG_MMAP_IFC, FAISS 1.10+)
+        flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', None)
+        if flags is None:
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            if entry['kind'] != 'ivf':
+                logger.warning(
+                    f'This FAISS build cannot memory-map {entry["kind"]} indexes; every process loads a private '
+                    f'copy of {path}. Upgrade faiss-cpu or use FAISS_INDEX_TYPE=ivf to share it.'
+                )
+        try:
+            return read(path, flags)
+        except RuntimeError:
+            logger.warning(f'Index {path} cannot be memory-mapped, loading it into memory')
+            return read(path)
+
+    def _open_vectors(self, entry):
+        """
+        Return ``(ids, vectors)`` of a quantized main segment, with the vectors memory-mapped.
+        """
+        sidecars = entry['sidecars']
+        ids = np.load(self.directory.file(sidecars['ids']))
+        if not ids.size:
+            return ids, np.empty((0, self.dimension), dtype=np.float32)
+        vectors = np.memmap(
+            self.directory.file(sidecars['vectors']), dtype=np.float32, mode='r', shape=(ids.size, self.dimension),
+        )
+        return ids, vectors
+
+    def _vector_file(self, prefix):
+        return _VectorFile(self.directory.file(f'{prefix}.vectors.f32.{os.getpid()}.tmp'), self.dimension)
+
+    def _commit_vectors(self, full, prefix):
+        """
+        Move a finished vector file into place and save its ids; returns the sidecars entry.
+        """
+        sidecars = {'vectors': f'{prefix}.vectors.f32', 'ids': f'{prefix}.ids.npy'}
+        with self.directory.atomic_path(sidecars['ids']) as tmp:
+            with open(tmp, 'wb') as fh:
+                np.save(fh, full.all_ids())
+        full.close()
+        os.replace(full.path, self.directory.file(sidecars['vectors']))
+        return sidecars
+
+    def _add(self, index, kind, ids, vectors):
+        if not index.is_trained:
+            # A scalar quantizer built from no vectors learns its ranges from the first batch
+            index.train(vectors)
+        index.add_with_ids(_binarize(vectors) if kind == 'binary' else vectors, ids)
+
+    # Writes
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        if not ids.size:
+            return
+        vectors = _as_matrix(vectors, self.dimension)
+
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            # Chunk ids only grow, so only ids at or below the highest indexed
+            # id can already be in the index and need hiding first.
+            existing = ids[ids <= manifest['max_id']]
+            if existing.size:
+                self.directory.append_tombstone(manifest, existing)
+
+            seq = manifest['seq'] + 1
+            delta = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+            delta.add_with_ids(vectors, ids)
+            name = f'delta-{seq}.index'
+            self._write_index(delta, name)
+            manifest['segments'].append({'file': name, 'seq': seq, 'kind': 'flat', 'count': int(ids.size)})
+            manifest['seq'] = seq
+            manifest['max_id'] = max(manifest['max_id'], int(ids.max()))
+            self.directory.write_manifest(manifest)
+
+        self._maybe_schedule_compaction(manifest)
+
+    def delete(self, ids):
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if not ids.size:
+            return
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            self.directory.append_tombstone(manifest, ids)
+            self.directory.write_manifest(manifest)
+        self._maybe_schedule_compaction(manifest)
+
+    def _maybe_schedule_compaction(self, manifest):
+        entries, pending = SegmentDirectory.pending_work(manifest)
+        if entries < settings.FAISS_MAX_DELTA_SEGMENTS and pending < settings.FAISS_MAX_DELTA_VECTORS:
+            return
+
+        from django.core.cache import cache
+        from .tasks import compact_vector_index
+
+        # Only queue one compaction at a time per index directory
+        if cache.add(f'rag:faiss:compaction:{self.path}', True, timeout=600):
+            compact_vector_index.delay()
+
+    # Reads
+
+    def _load(self):
+        stamp = self.directory.manifest_stamp()
+        if stamp is None:
+            return []
+        if stamp == self._manifest_stamp:
+            return self._segments
+
+        with self._load_lock:
+            if stamp != self._manifest_stamp:
+                # Compaction may remove files between reading the manifest and
+                # opening them; retry against the newer manifest.
+                for attempt in range(3):
+                    try:
+                        self._segments = self._open_segments(self.directory.read_manifest())
+                        break
+                    except (FileNotFoundError, RuntimeError):
+                        if attempt == 2:
+                            raise
+                self._manifest_stamp = stamp
+        return self._segments
+
+    def _open_segments(self, manifest):
+        tombstones = self.directory.load_tombstones(manifest)
+        entries = ([manifest['main']] if manifest['main'] else []) + manifest['segments']
+
+        segments = []
+        for entry in entries:
+            full = None
+            if entry is manifest['main']:
+                index = self._read_index(entry, mmap=True)
+                if entry.get('quantization', 'none') != 'none':
+                    full = self._open_vectors(entry)
+            else:
+                index = self._read_index(entry)
+            excluded = self.directory.deleted_after(tombstones, entry['seq'])
+            segments.append(_Segment(index, entry['kind'], entry['seq'], excluded, full))
+        return segments
+
+    def _search_params(self, segment, selector, boost=1.0, exhaustive=False):
+        if segment.kind == 'ivf':
+            nlist = faiss.extract_index_ivf(segment.index).nlist
+            nprobe = nlist if exhaustive else min(nlist, math.ceil(settings.FAISS_NPROBE * boost))
+            return faiss.SearchParametersIVF(nprobe=nprobe, sel=selector)
+        if segment.kind == 'hnsw':
+            return faiss.SearchParametersHNSW(efSearch=math.ceil(settings.FAISS_HNSW_EF_SEARCH * boost), sel=selector)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    def search(self, vector, k, allowed=None):
+        query = _as_matrix(vector, self.dimension)
+        segments = [segment for segment in self._load() if segment.index.ntotal]
+        boost, exhaustive, allowed_selector = 1.0, False, None
+        if allowed is not None:
+            if not allowed.count:
+                return []
+            excluded_factor = sum(segment.index.ntotal for segment in segments) / allowed.count
+            boost = min(max(1.0, excluded_factor), settings.RAG_FILTER_MAX_BOOST)
+            exhaustive = (
+                allowed.count <= settings.RAG_FILTER_EXACT_MAX_CHUNKS or excluded_factor > settings.RAG_FILTER_MAX_BOOST
+            )
+            # Reads ``allowed.bitmap`` in place, which outlives the search
+            allowed_selector = faiss.IDSelectorBitmap(allowed.bitmap.size, faiss.swig_ptr(allowed.bitmap))
+
+        best = {}
+        for segment in segments:
+            selector = segment.selector
+            if allowed_selector is not None:
+                selector = allowed_selector if selector is None else faiss.IDSelectorAnd(allowed_selector, selector)
+            for chunk_id, score in self._search_segment(segment, query, k, selector, boost, exhaustive):
+                if score > best.get(chunk_id, -np.inf):
+                    best[chunk_id] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def _search_segment(self, segment, query, k, selector, boost=1.0, exhaustive=False):
+        codes = _binarize(query) if segment.kind == 'binary' else query
+        # Quantized segment: over-fetch candidates from the codes, then rescore
+        # them exactly against the full-precision vectors on disk
+        fetch = k if segment.vectors is None else k * self.rescore_factor
+        if exhaustive and segment.kind == 'hnsw':
+            scores, ids = self._scan_hnsw(segment, codes, fetch, selector)
+        else:
+            params = self._search_params(segment, selector, boost, exhaustive)
+            scores, ids = segment.index.search(codes, fetch, params=params)
+        if segment.vectors is None:
+            return [(int(chunk_id), float(score)) for score, chunk_id in zip(scores[0], ids[0]) if chunk_id != -1]
+
+        ids = ids[0][ids[0] != -1]
+        if not ids.size:
+            return []
+        positions = np.minimum(np.searchsorted(segment.vector_ids, ids), segment.vector_ids.size - 1)
+        found = segment.vector_ids[positions] == ids
+        ids, rows = ids[found], segment.vector_rows[positions[found]]
+        scores = np.asarray(segment.vectors[rows]) @ query[0]
+        return list(zip(ids.tolist(), scores.tolist()))
+
+    @staticmethod
+    def _scan_hnsw(segment, codes, k, selector):
+        """
+        Exact search of an HNSW segment restricted to ``selector``: a flat
+        scan of the vectors stored under the graph, which a selective
+        filter would otherwise cut off from the entry points.
+        """
+        storage = faiss.downcast_index(segment.index.index).storage
+        translated = faiss.IDSelectorTranslated(segment.index.id_map, selector)
+        scores, positions = storage.search(codes, k, params=faiss.SearchParameters(sel=translated))
+        ids = np.array([[segment.index.id_map.at(int(position)) if position != -1 else -1 for position in positions[0]]])
+        return scores, ids
+
+    # Compaction
+
+    def compact(self):
+        """
+        Merge all delta segments and tombstones into a new main segment.
+
+        The new main segment is built from a snapshot of the manifest without
+        holding the directory lock, so ingestion keeps adding and deleting
+        while an HNSW graph is rebuilt; the lock is only taken to swap it in.
+        Deltas and tombstones written in the meantime are kept and apply on
+        top of it.
+        """
+        manifest = self.directory.read_manifest()
+        if not manifest['segments'] and not manifest['tombstones']:
+            return manifest
+
+        main_entry = manifest['main']
+        kind = main_entry['kind'] if main_entry else None
+        trained_on = main_entry.get('trained_on', 0) if main_entry else 0
+        quantization = main_entry.get('quantization', 'none') if main_entry else self.quantization
+        seq = manifest['seq']
+        name = f'main-{seq}.index'
+        staged = self.directory.file(f'{name}.{os.getpid()}.tmp')
+        # The full-precision copy is rewritten alongside a quantized main
+        full = self._vector_file(f'main-{seq}') if quantization != 'none' else None
+        # Set when the main index cannot be updated in place and is rebuilt below,
+        # from the full-precision copy or from the vectors gathered in ``remaining``
+        stale = False
+        remaining = []
+
+        try:
+            try:
+                tombstones = self.directory.load_tombstones(manifest)
+                main = self._read_index(main_entry) if main_entry else None
+                if main is not None:
+                    deleted = self.directory.deleted_after(tombstones, main_entry['seq'])
+                    if full is not None:
+                        full.copy_from(*self._open_vectors(main_entry), exclude=deleted)
+                    if deleted.size:
+                        if kind != 'hnsw':
+                            main.remove_ids(faiss.IDSelectorBatch(deleted))
+                        else:
+                            # HNSW graphs do not support removal; rebuild from what is left
+                            stale = True
+                            if full is None:
+                                ids, vectors = _extract(main, kind)
+                                keep = ~np.isin(ids, deleted)
+                                remaining.append((ids[keep], vectors[keep]))
+
+                for entry in manifest['segments']:
+                    delta = faiss.read_index(self.directory.file(entry['file']))
+                    ids, vectors = _extract(delta, 'flat')
+                    deleted = self.directory.deleted_after(tombstones, entry['seq'])
+                    if deleted.size:
+                        keep = ~np.isin(ids, deleted)
+                        ids, vectors = ids[keep], vectors[keep]
+                    if main is None:
+                        main, kind, trained_on = self._build(ids, vectors)
+                    elif not stale:
+                        self._add(main, kind, ids, vectors)
+                    if full is not None:
+                        full.append(ids, vectors)
+                    elif stale:
+                        remaining.append((ids, vectors))
+            except (FileNotFoundError, RuntimeError):
+                if self.directory.read_manifest()['main'] == main_entry:
+                    raise
+                # Another compaction or a rebuild replaced the snapshot's files first
+                logger.info(f'FAISS index at {self.path} was compacted concurrently, skipping')
+                return self.directory.read_manifest()
+
+            if main is not None and (stale or self._needs_rebuild(main, kind, trained_on, quantization)):
+                if full is not None:
+                    ids, vectors = full.load()
+                elif stale:
+                    ids, vectors = (np.concatenate(parts) for parts in zip(*remaining))
+                else:
+                    ids, vectors = _extract(main, kind)
+                main, kind, trained_on = self._build(ids, vectors)
+                if self.quantization == 'none' and full is not None:
+                    full.discard()
+                    full = None
+                elif self.quantization != 'none' and full is None:
+                    full = self._vector_file(f'main-{seq}')
+                    full.append(ids, vectors)
+                quantization = self.quantization
+            if main is not None:
+                self._save_index(main, staged)
+
+            with self.directory.lock():
+                current = self.directory.read_manifest()
+                if current['main'] != main_entry:
+                    logger.info(f'FAISS index at {self.path} was compacted concurrently, skipping')
+                    return current
+                new_manifest = {
+                    'seq': current['seq'],
+                    'max_id': current['max_id'],
+                    'main': None,
+                    'segments': [entry for entry in current['segments'] if entry['seq'] > seq],
+                    'tombstones': [entry for entry in current['tombstones'] if entry['seq'] > seq],
+                }
+                if main is not None:
+                    os.replace(staged, self.directory.file(name))
+                    new_manifest['main'] = {
+                        'file': name, 'seq': seq, 'kind': kind, 'count': int(main.ntotal), 'trained_on': trained_on,
+                        'quantization': quantization,
+                    }
+                    if full is not None:
+                        new_manifest['main']['sidecars'] = self._commit_vectors(full, f'main-{seq}')
+                self.directory.write_manifest(new_manifest)
+                self.directory.remove_unreferenced(new_manifest)
+        finally:
+            if full is not None:
+                full.discard()
+            if os.path.exists(staged):
+                os.remove(staged)
+
+        logger.info(f'Compacted FAISS index at {self.path}: {new_manifest["main"]}')
+        return new_manifest
+
+    def rebuild(self, batches):
+        """
+        Replace the index with one built from ``(ids, vectors)`` batches.
+
+        Used when switching to FAISS or changing FAISS_INDEX_TYPE or
+        FAISS_QUANTIZATION; batches are typically streamed from
+        ``DocumentChunk.embedding``. Deltas and tombstones written by other
+        workers while the rebuild runs are kept.
+        """
+        start_seq = self.directory.read_manifest()['seq']
+        main, kind, trained_on = None, None, 0
+        pending_ids, pending_vectors = [], []
+        pending = 0
+        max_id = -1
+        full = self._vector_file(f'main-{start_seq}-rebuild') if self.quantization != 'none' else None
+        try:
+            for ids, vectors in batches:
+                ids = np.asarray(ids, dtype=np.int64)
+                if not ids.size:
+                    continue
+                vectors = _as_matrix(vectors, self.dimension)
+                max_id = max(max_id, int(ids.max()))
+                if full is not None:
+                    full.append(ids, vectors)
+                if main is None:
+                    # Gather enough vectors to train an IVF quantizer before building
+                    pending_ids.append(ids)
+                    pending_vectors.append(vectors)
+                    pending += ids.size
+                    if pending < settings.FAISS_IVF_MIN_VECTORS:
+                        continue
+                    main, kind, trained_on = self._build(np.concatenate(pending_ids), np.concatenate(pending_vectors))
+                    pending_ids, pending_vectors = [], []
+                else:
+                    self._add(main, kind, ids, vectors)
+            if main is None and pending:
+                main, kind, trained_on = self._build(np.concatenate(pending_ids), np.concatenate(pending_vectors))
+
+            with self.directory.lock():
+                manifest = self.directory.read_manifest()
+                new_manifest = {
+                    'seq': manifest['seq'],
+                    'max_id': max(max_id, manifest['max_id']),
+                    'main': None,
+                    'segments': [entry for entry in manifest['segments'] if entry['seq'] > start_seq],
+                    'tombstones': [entry for entry in manifest['tombstones'] if entry['seq'] > start_seq],
+                }
+                if main is not None:
+                    name = f'main-{manifest["seq"]}-rebuild.index'
+                    self._write_index(main, name)
+                    new_manifest['main'] = {
+                        'file': name, 'seq': start_seq, 'kind': kind, 'count': int(main.ntotal),
+                        'trained_on': trained_on, 'quantization': self.quantization,
+                    }
+                    if full is not None:
+                        new_manifest['main']['sidecars'] = self._commit_vectors(full, f'main-{manifest["seq"]}-rebuild')
+                self.directory.write_manifest(new_manifest)
+                self.directory.remove_unreferenced(new_manifest)
+        finally:
+            if full is not None:
+                full.discard()
+        return new_manifest
+
+    def _build(self, ids, vectors):
+        """
+        Build a new main index of the configured type; returns (index, kind, trained_on).
+        """
+        count = ids.size
+        int8 = self.quantization == 'int8'
+        sample = vectors
+        if self.quantization == 'binary':
+            # Hamming scans over d/8-byte codes are fast enough to stay exhaustive
+            index, kind = faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(self.dimension)), 'binary'
+        elif self.index_type == 'hnsw':
+            if int8:
+                inner = faiss.IndexHNSWSQ(
+                    self.dimension, faiss.ScalarQuantizer.QT_8bit, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                inner = faiss.IndexHNSWFlat(self.dimension, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            inner.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+            index, kind = faiss.IndexIDMap2(inner), 'hnsw'
+        elif self.index_type == 'ivf' and count >= settings.FAISS_IVF_MIN_VECTORS:
+            # Roughly sqrt(n) lists, with at least 39 training points per list
+            nlist = max(1, min(settings.FAISS_NLIST, int(np.sqrt(count) * 4), count // 39))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            if int8:
+                index = faiss.IndexIVFScalarQuantizer(
+                    quantizer, self.dimension, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            if count > nlist * 256:
+                sample = vectors[np.random.default_rng(0).choice(count, nlist * 256, replace=False)]
+            kind = 'ivf'
+        else:
+            # Too few vectors to train IVF: exact search is fast enough here
+            if int8:
+                inner = faiss.IndexScalarQuantizer(
+                    self.dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT,
+                )
+            else:
+                inner = faiss.IndexFlatIP(self.dimension)
+            index, kind = faiss.IndexIDMap2(inner), 'flat'
+
+        if count:
+            if not index.is_trained:
+                index.train(sample)
+            self._add(index, kind, ids, vectors)
+        return index, kind, int(count)
+
+    def _needs_rebuild(self, index, kind, trained_on, quantization='none'):
+        if quantization != self.quantization:
+            return True
+        expected = 'binary' if self.quantization == 'binary' else self.index_type
+        if expected == 'ivf' and index.ntotal < settings.FAISS_IVF_MIN_VECTORS:
+            expected = 'flat'
+        if kind != expected:
+            return True
+        # IVF lists trained on a small corpus become unbalanced as it grows, and int8
+        # ranges trained on one may clip the vectors that come after it
+        retrains = kind == 'ivf' or quantization == 'int8'
+        return retrains and index.ntotal > trained_on * settings.FAISS_RETRAIN_FACTOR
+
+    def stats(self):
+        manifest = self.directory.read_manifest()
+        main = manifest['main']
+        stats = {
+            'backend': 'faiss',
+            'index_type': self.index_type,
+            'quantization': self.quantization,
+            'main': main,
+            'delta_segments': len(manifest['segments']),
+            'delta_vectors': sum(segment['count'] for segment in manifest['segments']),
+            'tombstones': sum(tombstone['count'] for tombstone in manifest['tombstones']),
+        }
+        if main:
+            # What has to stay in RAM for fast search vs. what is only read to rescore
+            stats['main_index_bytes'] = os.path.getsize(self.directory.file(main['file']))
+            if main.get('sidecars'):
+                stats['full_precision_bytes'] = os.path.getsize(self.directory.file(main['sidecars']['vectors']))
+        return stats
+
+
+def _extract(index, kind):
+    """
+    Return ``(ids, vectors)`` for every vector stored in ``index``.
+    """
+    if kind == 'ivf':
+        ivf = faiss.extract_index_ivf(index)
+        invlists = ivf.invlists
+        ids, vectors = [], []
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if not size:
+                continue
+            ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+            codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size)
+            vectors.append(np.frombuffer(codes.copy(), dtype=np.float32).reshape(size, -1))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty((0, ivf.d), dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(vectors)
+
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    vectors = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), np.float32)
+    return ids, vectors
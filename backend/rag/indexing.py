@@ -0,0 +1,20 @@
+from .keyword_index import get_keyword_index
+from .vector_store import get_vector_store
+
+
+def index_chunks(ids, texts, vectors):
+    """
+    Make newly stored chunks searchable in the vector and keyword indexes.
+    """
+    get_vector_store().add(ids, vectors)
+    get_keyword_index().add(ids, texts)
+
+
+def remove_chunks(ids):
+    """
+    Remove chunks from every search index.
+    """
+    ids = list(ids)
+    if ids:
+        get_vector_store().delete(ids)
+        get_keyword_index().delete(ids)
@@ -0,0 +1,421 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .segments import SegmentDirectory
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[-./][a-z0-9]+)*')
+_PART_RE = re.compile(r'[-./]')
+MAX_TOKEN_LENGTH = 40
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or that the this to was were which with'.split()
+)
+
+SEGMENT_ARRAYS = ('terms', 'offsets', 'postings', 'tfs', 'doc_ids', 'doc_lens')
+
+
+def tokenize(text):
+    """
+    Lowercase and split text into index terms.
+
+    Codes such as ``CPI-AL``, ``2022-23`` or ``3.1.2`` are kept as a single
+    term and also indexed by their parts, so both exact codes and their
+    components match.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        if token not in STOPWORDS:
+            tokens.append(token)
+        if _PART_RE.search(token):
+            tokens.extend(part for part in _PART_RE.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _hash_terms(terms):
+    return np.fromiter((term_hash(term) for term in terms), dtype=np.int64, count=len(terms))
+
+
+class _Segment:
+    """
+    One immutable segment of the inverted index, in CSR layout.
+
+    ``terms`` is a sorted array of 64-bit term hashes; the postings of
+    ``terms[i]`` are ``postings[offsets[i]:offsets[i + 1]]``, which index into
+    the segment's ``doc_ids``/``doc_lens`` arrays, with matching term
+    frequencies in ``tfs``. The live document count and total length are
+    computed once when the segment is opened, so queries only touch the
+    postings of their terms.
+    """
+    __slots__ = SEGMENT_ARRAYS + ('seq', 'live', 'doc_count', 'total_length')
+
+    def __init__(self, arrays, seq, deleted):
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.seq = seq
+        self.live = ~np.isin(self.doc_ids, deleted) if deleted.size else None
+        if self.live is None:
+            self.doc_count = int(self.doc_ids.size)
+            self.total_length = int(self.doc_lens.sum(dtype=np.int64))
+        else:
+            self.doc_count = int(self.live.sum())
+            self.total_length = int(self.doc_lens[self.live].sum(dtype=np.int64))
+
+    def postings_for(self, hashed):
+        position = np.searchsorted(self.terms, hashed)
+        if position >= self.terms.size or self.terms[position] != hashed:
+            return None
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.postings[start:end], self.tfs[start:end]
+
+
+def build_segment_arrays(doc_ids, doc_terms):
+    """
+    Build CSR segment arrays from chunk ids and their token lists.
+    """
+    term_column, doc_column = [], []
+    doc_lens = np.zeros(len(doc_ids), dtype=np.uint32)
+    for position, terms in enumerate(doc_terms):
+        doc_lens[position] = len(terms)
+        term_column.extend(terms)
+        doc_column.extend([position] * len(terms))
+    return _arrays_from_columns(
+        np.asarray(doc_ids, dtype=np.int64),
+        doc_lens,
+        _hash_terms(term_column),
+        np.asarray(doc_column, dtype=np.uint32),
+    )
+
+
+def merge_segments(segments):
+    """
+    Merge the live documents of ``segments`` into the arrays of one segment.
+    """
+    doc_ids, doc_lens, hashes, doc_positions, tfs = [], [], [], [], []
+    doc_offset = 0
+    for segment in segments:
+        live = np.ones(segment.doc_ids.size, dtype=bool) if segment.live is None else segment.live
+        # Renumber the surviving documents of this segment
+        new_positions = np.cumsum(live) - 1 + doc_offset
+        posting_live = live[segment.postings]
+        counts = np.diff(segment.offsets)
+        hashes.append(np.repeat(segment.terms, counts)[posting_live])
+        doc_positions.append(new_positions[segment.postings[posting_live]])
+        tfs.append(segment.tfs[posting_live].astype(np.uint32))
+        doc_ids.append(segment.doc_ids[live])
+        doc_lens.append(segment.doc_lens[live])
+        doc_offset += int(live.sum())
+    return _arrays_from_columns(
+        np.concatenate(doc_ids),
+        np.concatenate(doc_lens),
+        np.concatenate(hashes),
+        np.concatenate(doc_positions).astype(np.uint32),
+        np.concatenate(tfs),
+    )
+
+
+def _arrays_from_columns(doc_ids, doc_lens, hashes, doc_positions, tfs=None):
+    """
+    Group (term hash, doc position[, tf]) rows into CSR arrays, summing tfs.
+    """
+    if tfs is None:
+        tfs = np.ones(hashes.size, dtype=np.uint32)
+    order = np.lexsort((doc_positions, hashes))
+    hashes, doc_positions, tfs = hashes[order], doc_positions[order], tfs[order]
+
+    # Collapse repeated (term, doc) rows into a single posting with its tf
+    if hashes.size:
+        boundary = np.ones(hashes.size, dtype=bool)
+        boundary[1:] = (hashes[1:] != hashes[:-1]) | (doc_positions[1:] != doc_positions[:-1])
+        starts = np.flatnonzero(boundary)
+        tfs = np.add.reduceat(tfs, starts)
+        hashes, doc_positions = hashes[starts], doc_positions[starts]
+
+    terms, counts = np.unique(hashes, return_counts=True)
+    offsets = np.zeros(terms.size + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return {
+        'terms': terms,
+        'offsets': offsets,
+        'postings': doc_positions.astype(np.uint32),
+        'tfs': np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+        'doc_ids': doc_ids,
+        'doc_lens': doc_lens,
+    }
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over DocumentChunk text, stored as postings arrays.
+
+    Uses the same segment/tombstone layout as the FAISS store (see
+    SegmentDirectory): every ingested batch of chunks becomes a small
+    immutable segment, so the index is updated incrementally as documents
+    are processed, and segments are merged once KEYWORD_MAX_SEGMENTS is
+    reached. Segment arrays are memory-mapped ``.npy`` files.
+
+    Chunks stored before the index existed are not in it until the
+    ``rebuild_keyword_index`` command has been run.
+    """
+
+    def __init__(self, path=None, k1=None, b=None):
+        self.path = path or os.path.join(settings.RAG_INDEX_DIR, 'keyword')
+        self.k1 = settings.BM25_K1 if k1 is None else k1
+        self.b = settings.BM25_B if b is None else b
+        self.directory = SegmentDirectory(self.path)
+        self._load_lock = threading.Lock()
+        self._segments = []
+        self._manifest_stamp = None
+
+    # Writes
+
+    def add(self, ids, texts):
+        """
+        Index (or re-index) the given chunk ids with their text.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        arrays = build_segment_arrays(ids, [tokenize(text) for text in texts])
+
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            existing = [chunk_id for chunk_id in ids if chunk_id <= manifest['max_id']]
+            if existing:
+                self.directory.append_tombstone(manifest, existing)
+            seq = manifest['seq'] + 1
+            name = f'segment-{seq}'
+            self._write_segment(arrays, name)
+            manifest['segments'].append({'file': name, 'seq': seq, 'count': len(ids)})
+            manifest['seq'] = seq
+            manifest['max_id'] = max(manifest['max_id'], max(ids))
+            self.directory.write_manifest(manifest)
+
+        self._maybe_schedule_compaction(manifest)
+
+    def delete(self, ids):
+        ids = list(ids)
+        if not ids:
+            return
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            self.directory.append_tombstone(manifest, ids)
+            self.directory.write_manifest(manifest)
+        self._maybe_schedule_compaction(manifest)
+
+    def _write_segment(self, arrays, name):
+        with self.directory.atomic_path(name) as tmp:
+            os.makedirs(tmp)
+            for array_name in SEGMENT_ARRAYS:
+                np.save(os.path.join(tmp, f'{array_name}.npy'), arrays[array_name])
+
+    def _maybe_schedule_compaction(self, manifest):
+        entries, _ = SegmentDirectory.pending_work(manifest)
+        if entries < settings.KEYWORD_MAX_SEGMENTS:
+            return
+
+        from django.core.cache import cache
+        from .tasks import compact_keyword_index
+
+        if cache.add(f'rag:keyword:compaction:{self.path}', True, timeout=600):
+            compact_keyword_index.delay()
+
+    def compact(self):
+        """
+        Merge every segment into a single main segment, dropping deleted chunks.
+        """
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            if not manifest['segments'] and not manifest['tombstones']:
+                return manifest
+
+            tombstones = self.directory.load_tombstones(manifest)
+            entries = ([manifest['main']] if manifest['main'] else []) + manifest['segments']
+            if not entries:
+                manifest['tombstones'] = []
+                self.directory.write_manifest(manifest)
+                self.directory.remove_unreferenced(manifest)
+                return manifest
+
+            arrays = merge_segments(
+                _Segment(self._read_segment(entry['file'], mmap=False), entry['seq'],
+                         self.directory.deleted_after(tombstones, entry['seq']))
+                for entry in entries
+            )
+            seq = manifest['seq']
+            name = f'main-{seq}'
+            self._write_segment(arrays, name)
+            new_manifest = {
+                'seq': seq,
+                'max_id': manifest['max_id'],
+                'main': {'file': name, 'seq': seq, 'count': int(arrays['doc_ids'].size)},
+                'segments': [],
+                'tombstones': [],
+            }
+            self.directory.write_manifest(new_manifest)
+            self.directory.remove_unreferenced(new_manifest)
+
+        logger.info(f'Compacted keyword index at {self.path}: {new_manifest["main"]}')
+        return new_manifest
+
+    def rebuild(self, batches):
+        """
+        Replace the index with one built from ``(ids, texts)`` batches.
+
+        Used to index chunks stored before the keyword index existed or
+        after its files were lost; see the ``rebuild_keyword_index``
+        command. Segments and tombstones written by other workers while the
+        rebuild runs are kept.
+        """
+        start_seq = self.directory.read_manifest()['seq']
+        empty = np.empty(0, dtype=np.int64)
+        parts = []
+        max_id = -1
+        for ids, texts in batches:
+            ids = list(ids)
+            if not ids:
+                continue
+            parts.append(_Segment(build_segment_arrays(ids, [tokenize(text) for text in texts]), start_seq, empty))
+            max_id = max(max_id, max(ids))
+        arrays = merge_segments(parts) if parts else None
+
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            # A new seq names the segment, so it never replaces one readers have open
+            new_manifest = {
+                'seq': manifest['seq'] + 1,
+                'max_id': max(max_id, manifest['max_id']),
+                'main': None,
+                'segments': [entry for entry in manifest['segments'] if entry['seq'] > start_seq],
+                'tombstones': [entry for entry in manifest['tombstones'] if entry['seq'] > start_seq],
+            }
+            if arrays is not None:
+                name = f'main-{new_manifest["seq"]}-rebuild'
+                self._write_segment(arrays, name)
+                new_manifest['main'] = {'file': name, 'seq': start_seq, 'count': int(arrays['doc_ids'].size)}
+            self.directory.write_manifest(new_manifest)
+            self.directory.remove_unreferenced(new_manifest)
+        return new_manifest
+
+    # Reads
+
+    def _read_segment(self, name, mmap=True):
+        folder = self.directory.file(name)
+        return {
+            array_name: np.load(os.path.join(folder, f'{array_name}.npy'), mmap_mode='r' if mmap else None)
+            for array_name in SEGMENT_ARRAYS
+        }
+
+    def _load(self):
+        stamp = self.directory.manifest_stamp()
+        if stamp is None:
+            return []
+        if stamp == self._manifest_stamp:
+            return self._segments
+
+        with self._load_lock:
+            if stamp != self._manifest_stamp:
+                for attempt in range(3):
+                    try:
+                        manifest = self.directory.read_manifest()
+                        tombstones = self.directory.load_tombstones(manifest)
+                        entries = ([manifest['main']] if manifest['main'] else []) + manifest['segments']
+                        self._segments = [
+                            _Segment(self._read_segment(entry['file']), entry['seq'],
+                                     self.directory.deleted_after(tombstones, entry['seq']))
+                            for entry in entries
+                        ]
+                        break
+                    except FileNotFoundError:
+                        if attempt == 2:
+                            raise
+                self._manifest_stamp = stamp
+        return self._segments
+
+    def search(self, query, k, allowed=None):
+        """
+        Return up to ``k`` ``(chunk_id, bm25_score)`` tuples, best first.
+
+        With ``allowed`` (a ``rag.chunk_filter.ChunkFilter``), matching
+        chunks outside it are masked out before the top ``k`` are chosen.
+        Corpus statistics still cover every chunk.
+        """
+        hashed = [term_hash(term) for term in dict.fromkeys(tokenize(query))]
+        segments = self._load()
+        if not hashed or not segments:
+            return []
+
+        # Corpus statistics are summed over segments; document frequencies
+        # include not-yet-compacted deletions, which only nudges the idf.
+        doc_count = sum(segment.doc_count for segment in segments)
+        if not doc_count:
+            return []
+        avg_length = max(sum(segment.total_length for segment in segments) / doc_count, 1.0)
+
+        postings = [[segment.postings_for(h) for h in hashed] for segment in segments]
+        doc_freqs = np.zeros(len(hashed))
+        for segment_postings in postings:
+            for position, found in enumerate(segment_postings):
+                if found is not None:
+                    doc_freqs[position] += found[0].size
+        idf = np.log(1 + (doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+        results = []
+        for segment, segment_postings in zip(segments, postings):
+            # Score only the documents in the query terms' postings
+            matched = [(position, found) for position, found in enumerate(segment_postings) if found is not None]
+            if not matched:
+                continue
+            docs = np.concatenate([found[0] for _, found in matched])
+            tfs = np.concatenate([found[1] for _, found in matched]).astype(np.float32)
+            weights = np.repeat(idf[[position for position, _ in matched]], [found[0].size for _, found in matched])
+            norms = self.k1 * (1 - self.b + self.b * segment.doc_lens[docs] / avg_length)
+            candidates, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights * tfs * (self.k1 + 1) / (tfs + norms))
+
+            keep = np.ones(candidates.size, dtype=bool) if segment.live is None else segment.live[candidates]
+            if allowed is not None:
+                keep &= allowed.contains(segment.doc_ids[candidates])
+            candidates, scores = candidates[keep], scores[keep]
+            if candidates.size > k:
+                top = np.argpartition(-scores, k)[:k]
+                candidates, scores = candidates[top], scores[top]
+            results.extend(zip(segment.doc_ids[candidates].tolist(), scores.tolist()))
+
+        return sorted(results, key=lambda item: item[1], reverse=True)[:k]
+
+    def stats(self):
+        manifest = self.directory.read_manifest()
+        return {
+            'main': manifest['main'],
+            'segments': len(manifest['segments']),
+            'tombstones': sum(entry['count'] for entry in manifest['tombstones']),
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """
+    Return the per-process KeywordIndex.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = KeywordIndex()
+    return _index
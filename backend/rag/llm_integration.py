@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """
+    Raised when the LLM API cannot produce a response.
+    """
+
+
+class GeminiClient:
+    """
+    Minimal client for the Gemini ``generateContent`` REST API.
+
+    Talks to GEMINI_API_BASE_URL so it can be pointed at a local fake server
+    in development and tests. A single pooled HTTP client is reused for all
+    blocking requests from this process, and one pooled async client per
+    event loop for streaming, since async connections belong to the loop
+    that opened them.
+    """
+
+    def __init__(self, api_key=None, model=None, base_url=None, timeout=None):
+        self.api_key = settings.GEMINI_API_KEY if api_key is None else api_key
+        self.model = model or settings.GEMINI_MODEL
+        self.base_url = (base_url or settings.GEMINI_API_BASE_URL).rstrip('/')
+        self.timeout = timeout or settings.GEMINI_TIMEOUT_SECONDS
+        self._client = httpx.Client(timeout=self.timeout)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(timeout=self.timeout)
+        return client
+
+    def _url(self, method):
+        return f'{self.base_url}/v1beta/models/{self.model}:{method}'
+
+    @staticmethod
+    def _payload(prompt, system_instruction=None):
+        payload = {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+        if system_instruction:
+            payload['systemInstruction'] = {'parts': [{'text': system_instruction}]}
+        return payload
+
+    @staticmethod
+    def _parse(data):
+        candidates = data.get('candidates') or []
+        if not candidates:
+            raise LLMError('LLM returned no candidates')
+        parts = candidates[0].get('content', {}).get('parts', [])
+        text = ''.join(part.get('text', '') for part in parts)
+        usage = data.get('usageMetadata', {})
+        return text, usage
+
+    def generate(self, prompt, system_instruction=None):
+        """
+        Return ``(text, usage)`` for a single prompt.
+        """
+        try:
+            response = self._client.post(
+                self._url('generateContent'),
+                params={'key': self.api_key},
+                json=self._payload(prompt, system_instruction),
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f'Gemini request failed: {e}')
+            raise LLMError(str(e)) from e
+        return self._parse(response.json())
+
+    @staticmethod
+    def _fragments(line, usage):
+        """
+        Text fragments in one line of a ``streamGenerateContent`` SSE
+        response; ``usage`` is updated with its usage metadata.
+        """
+        if not line.startswith('data:'):
+            return []
+        try:
+            data = json.loads(line[len('data:'):].strip())
+        except ValueError as e:
+            logger.error(f'Gemini sent a malformed stream event: {line[:200]!r}')
+            raise LLMError(f'Malformed stream event: {e}') from e
+        usage.update(data.get('usageMetadata', {}))
+        return [
+            part['text']
+            for candidate in data.get('candidates', [])[:1]
+            for part in candidate.get('content', {}).get('parts', [])
+            if part.get('text')
+        ]
+
+    def _stream_request(self, prompt, system_instruction):
+        return {
+            'method': 'POST',
+            'url': self._url('streamGenerateContent'),
+            'params': {'key': self.api_key, 'alt': 'sse'},
+            'json': self._payload(prompt, system_instruction),
+        }
+
+    async def astream(self, prompt, system_instruction=None, usage=None):
+        """
+        Yield text fragments as the model produces them.
+
+        Uses ``streamGenerateContent`` with server-sent events. If a ``usage``
+        dict is passed it is filled with the final usage metadata.
+        """
+        usage = {} if usage is None else usage
+        try:
+            async with self._async_client().stream(**self._stream_request(prompt, system_instruction)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    for fragment in self._fragments(line, usage):
+                        yield fragment
+        except httpx.HTTPError as e:
+            logger.error(f'Gemini streaming request failed: {e}')
+            raise LLMError(str(e)) from e
+
+    def stream(self, prompt, system_instruction=None, usage=None):
+        """
+        ``astream`` for blocking callers.
+        """
+        usage = {} if usage is None else usage
+        try:
+            with self._client.stream(**self._stream_request(prompt, system_instruction)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    yield from self._fragments(line, usage)
+        except httpx.HTTPError as e:
+            logger.error(f'Gemini streaming request failed: {e}')
+            raise LLMError(str(e)) from e
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Return the per-process LLM client.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
@@ -0,0 +1,376 @@
+import json
+import platform
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from conversation.models import Conversation
+from documents.models import Document
+from documents.services import process_document
+from rag import llm_integration
+from rag.benchmark import render_pdf, render_text, summarize, synthetic_document, synthetic_questions
+from rag.llm_integration import GeminiClient
+from rag.retriever import Retriever
+from .fake_llm_server import make_handler
+
+BENCH_EMAIL_DOMAIN = 'bench.invalid'
+# NFR1.1: 95% of queries answered within 3 s; NFR1.2: a 10 MB document ingested within 60 s
+QUERY_P95_TARGET_MS = 3000
+INGEST_SECONDS_PER_10MB_TARGET = 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark ingestion, retrieval and end-to-end queries on a synthetic corpus of statistical '
+        'reports, with a local stub standing in for the LLM. Prints a summary and can write JSON for '
+        'comparing runs.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=5)
+        parser.add_argument('--pages', type=int, default=30, help='Pages per document')
+        parser.add_argument('--format', choices=('pdf', 'txt', 'mixed'), default='pdf')
+        parser.add_argument('--queries', type=int, default=50, help='Questions for the retrieval and query phases')
+        parser.add_argument(
+            '--concurrency', default='1,10,50',
+            help='Comma-separated concurrent user counts for the load phase; empty to skip it',
+        )
+        parser.add_argument('--requests-per-user', type=int, default=5)
+        parser.add_argument('--phases', default='ingest,retrieve,query,load')
+        parser.add_argument('--llm-first-token-ms', type=float, default=300)
+        parser.add_argument('--llm-token-ms', type=float, default=5)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--json', action='store_true', help='Print the JSON report instead of a summary')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users and documents')
+
+    def handle(self, *args, **options):
+        phases = {phase.strip() for phase in options['phases'].split(',') if phase.strip()}
+        unknown = phases - {'ingest', 'retrieve', 'query', 'load'}
+        if unknown:
+            raise CommandError(f'Unknown phases: {", ".join(sorted(unknown))}')
+
+        run_id = f'{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}'
+        report = {
+            'run_id': run_id,
+            'started_at': timezone.now().isoformat(),
+            'environment': self.environment(),
+            'parameters': {
+                key: options[key] for key in (
+                    'documents', 'pages', 'format', 'queries', 'concurrency', 'requests_per_user',
+                    'llm_first_token_ms', 'llm_token_ms',
+                )
+            },
+        }
+
+        corpus = [synthetic_document(seed, options['pages']) for seed in range(options['documents'])]
+        questions = synthetic_questions(corpus, options['queries'])
+        owner = self.create_user(run_id, 0)
+        server, previous_client = self.start_llm_stub(options)
+        try:
+            if 'ingest' in phases:
+                report['ingest'] = self.bench_ingest(corpus, owner, run_id, options['format'])
+            if 'retrieve' in phases:
+                report['retrieve'] = self.bench_retrieve(questions)
+            if 'query' in phases:
+                report['query'] = self.bench_query(questions, owner)
+            if 'load' in phases and options['concurrency']:
+                levels = [int(level) for level in options['concurrency'].split(',')]
+                accounts = [self.create_user(run_id, number) for number in range(1, max(levels) + 1)]
+                report['load'] = [
+                    self.bench_load(questions, accounts[:users], options['requests_per_user']) for users in levels
+                ]
+        finally:
+            server.shutdown()
+            server.server_close()
+            llm_integration._client = previous_client
+            if not options['keep']:
+                self.cleanup(run_id)
+
+        report['nfr'] = self.check_targets(report)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        if options['json']:
+            self.stdout.write(output)
+        else:
+            self.print_summary(report)
+
+    # Setup
+
+    @staticmethod
+    def environment():
+        return {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'database': connection.vendor,
+            'vector_db': settings.VECTOR_DB_TYPE,
+            'faiss_index_type': settings.FAISS_INDEX_TYPE,
+            'faiss_quantization': settings.FAISS_QUANTIZATION,
+            'hybrid_search': settings.RAG_HYBRID_SEARCH,
+            'embedding_model': settings.EMBEDDING_MODEL,
+            'rerank_model': settings.RAG_RERANK_MODEL if settings.RAG_RERANK_ENABLED else None,
+        }
+
+    def start_llm_stub(self, options):
+        """
+        Serve canned LLM answers from a local thread and point this process's LLM client at it.
+        """
+        handler = make_handler(
+            'According to the report the figure rose over the previous year, led by manufacturing and trade.',
+            options['llm_first_token_ms'] / 1000,
+            options['llm_token_ms'] / 1000,
+        )
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        previous = llm_integration._client
+        llm_integration._client = GeminiClient(api_key='bench', base_url=f'http://127.0.0.1:{server.server_port}')
+        return server, previous
+
+    @staticmethod
+    def create_user(run_id, number):
+        return get_user_model().objects.create_user(
+            email=f'bench-{run_id}-{number}@{BENCH_EMAIL_DOMAIN}',
+            username=f'bench-{run_id}-{number}',
+            password=None,
+        )
+
+    @staticmethod
+    def cleanup(run_id):
+        users = get_user_model().objects.filter(
+            email__startswith=f'bench-{run_id}-', email__endswith=BENCH_EMAIL_DOMAIN,
+        )
+        for document in Document.objects.filter(user__in=users):
+            document.file.delete(save=False)
+            document.delete()
+        users.delete()
+
+    # Phases
+
+    def bench_ingest(self, corpus, owner, run_id, file_format):
+        documents = []
+        for number, synthetic in enumerate(corpus):
+            file_type = file_format if file_format != 'mixed' else ('pdf', 'txt')[number % 2]
+            content = render_pdf(synthetic.pages) if file_type == 'pdf' else render_text(synthetic.pages)
+            document = Document(
+                title=synthetic.title, user=owner, is_public=False, file_type=file_type, file_size=len(content),
+            )
+            document.file.save(f'bench-{run_id}-{number}.{file_type}', ContentFile(content), save=False)
+            document.save()
+            documents.append(document)
+
+        seconds, per_document = [], []
+        started = time.perf_counter()
+        for document in documents:
+            begin = time.perf_counter()
+            result = process_document(document)
+            elapsed = time.perf_counter() - begin
+            seconds.append(elapsed)
+            per_document.append({
+                'file_type': document.file_type,
+                'bytes': document.file_size,
+                'pages': result['pages'],
+                'chunks': result['chunks'],
+                'duplicates': result['duplicates'],
+                'seconds': round(elapsed, 3),
+                'peak_rss_bytes': result['peak_rss_bytes'],
+            })
+        wall = time.perf_counter() - started
+
+        total_bytes = sum(item['bytes'] for item in per_document)
+        total_pages = sum(item['pages'] for item in per_document)
+        total_chunks = sum(item['chunks'] for item in per_document)
+        duplicates = sum(item['duplicates'] for item in per_document)
+        return {
+            'documents': len(documents),
+            'pages': total_pages,
+            'chunks': total_chunks,
+            'duplicates': duplicates,
+            'dedup_ratio': round(duplicates / total_chunks, 4) if total_chunks else 0.0,
+            'bytes': total_bytes,
+            'seconds': round(wall, 3),
+            'pages_per_second': round(total_pages / wall, 2) if wall else 0.0,
+            'mb_per_second': round(total_bytes / 1048576 / wall, 3) if wall else 0.0,
+            # Synthetic PDFs are text only, so this is a lower bound for scanned reports
+            'seconds_per_10mb': round(wall * 10 * 1048576 / total_bytes, 1) if total_bytes else None,
+            'latency': summarize(seconds),
+            'per_document': per_document,
+        }
+
+    def bench_retrieve(self, questions):
+        retriever = Retriever()
+        retriever.retrieve(questions[0])  # load the model and indexes before timing
+        samples = []
+        for question in questions:
+            begin = time.perf_counter()
+            retriever.retrieve(question)
+            samples.append(time.perf_counter() - begin)
+        return {'latency': summarize(samples), 'queries_per_second': round(len(samples) / sum(samples), 2)}
+
+    def bench_query(self, questions, owner):
+        """
+        Sequential end-to-end queries through the message API of one conversation per question.
+        """
+        client = self.client_for(owner)
+        samples, errors, answered_by, reranks = [], 0, {}, []
+        for question in questions:
+            conversation = Conversation.objects.create(user=owner, title='bench')
+            begin = time.perf_counter()
+            response = client.post(
+                f'/api/conversations/{conversation.pk}/messages/', {'content': question}, content_type='application/json',
+            )
+            samples.append(time.perf_counter() - begin)
+            errors += response.status_code != 201
+            source = self.answer_source(response)
+            answered_by[source] = answered_by.get(source, 0) + 1
+            if source == 'llm':
+                rerank = response.json()['assistant_message']['metadata'].get('rerank')
+                if rerank is not None:
+                    reranks.append(rerank)
+        result = {'latency': summarize(samples), 'errors': errors, 'answered_by': answered_by}
+        if reranks:
+            result['rerank'] = self.rerank_summary(reranks)
+        return result
+
+    @staticmethod
+    def rerank_summary(reranks):
+        applied = [rerank for rerank in reranks if rerank['applied']]
+        candidate_tokens = sum(rerank['candidate_tokens'] for rerank in reranks)
+        tokens_saved = sum(rerank['tokens_saved'] for rerank in reranks)
+        return {
+            'queries': len(reranks),
+            'within_budget': len(applied),
+            'latency': summarize([rerank['ms'] / 1000 for rerank in reranks]),
+            'mean_tokens_saved': round(tokens_saved / len(reranks), 1),
+            'tokens_saved_ratio': round(tokens_saved / candidate_tokens, 3) if candidate_tokens else 0.0,
+        }
+
+    def bench_load(self, questions, accounts, requests_per_user):
+        """
+        One virtual user per account, each in its own thread, sends
+        ``requests_per_user`` messages one after another to a new conversation.
+        """
+        users = len(accounts)
+        samples, statuses, answered_by = [], {}, {}
+        lock = threading.Lock()
+
+        def run_user(number):
+            account = accounts[number]
+            client = self.client_for(account)
+            try:
+                conversation = Conversation.objects.create(user=account, title='bench load')
+                for request in range(requests_per_user):
+                    question = questions[(number * requests_per_user + request) % len(questions)]
+                    begin = time.perf_counter()
+                    response = client.post(
+                        f'/api/conversations/{conversation.pk}/messages/', {'content': question},
+                        content_type='application/json',
+                    )
+                    elapsed = time.perf_counter() - begin
+                    source = self.answer_source(response)
+                    with lock:
+                        samples.append(elapsed)
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                        answered_by[source] = answered_by.get(source, 0) + 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as executor:
+            list(executor.map(run_user, range(users)))
+        wall = time.perf_counter() - started
+        return {
+            'users': users,
+            'requests': len(samples),
+            'seconds': round(wall, 3),
+            'requests_per_second': round(len(samples) / wall, 2) if wall else 0.0,
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            'answered_by': answered_by,
+            'latency': summarize(samples),
+        }
+
+    @staticmethod
+    def answer_source(response):
+        """
+        How a message was answered: 'llm', 'cache' (semantic answer cache), 'table' or 'error'.
+        """
+        if response.status_code != 201:
+            return 'error'
+        metadata = response.json()['assistant_message']['metadata']
+        if metadata.get('cache_hit'):
+            return 'cache'
+        return 'table' if metadata.get('table_answer') else 'llm'
+
+    @staticmethod
+    def client_for(user):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host and '*' not in host and not host.startswith('.')]
+        token = RefreshToken.for_user(user).access_token
+        return Client(HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_HOST=hosts[0] if hosts else 'testserver')
+
+    # Reporting
+
+    @staticmethod
+    def check_targets(report):
+        checks = {}
+        if 'ingest' in report and report['ingest']['seconds_per_10mb'] is not None:
+            checks['ingest_10mb_within_60s'] = report['ingest']['seconds_per_10mb'] <= INGEST_SECONDS_PER_10MB_TARGET
+        if 'query' in report and report['query']['latency']['count']:
+            checks['query_p95_within_3s'] = report['query']['latency']['p95_ms'] <= QUERY_P95_TARGET_MS
+        for level in report.get('load', []):
+            if level['latency']['count']:
+                checks[f'load_{level["users"]}_users_p95_within_3s'] = (
+                    level['latency']['p95_ms'] <= QUERY_P95_TARGET_MS and not level['errors']
+                )
+        return checks
+
+    def print_summary(self, report):
+        def latency(values):
+            if not values.get('count'):
+                return 'no samples'
+            return f'p50 {values["p50_ms"]} ms, p95 {values["p95_ms"]} ms, p99 {values["p99_ms"]} ms'
+
+        if 'ingest' in report:
+            ingest = report['ingest']
+            self.stdout.write(
+                f'Ingest: {ingest["documents"]} documents, {ingest["pages"]} pages, {ingest["chunks"]} chunks '
+                f'({ingest["dedup_ratio"]:.1%} near-duplicates) in '
+                f'{ingest["seconds"]}s ({ingest["pages_per_second"]} pages/s, {ingest["mb_per_second"]} MB/s, '
+                f'~{ingest["seconds_per_10mb"]}s per 10 MB); per document {latency(ingest["latency"])}'
+            )
+        if 'retrieve' in report:
+            self.stdout.write(
+                f'Retrieve: {latency(report["retrieve"]["latency"])} '
+                f'({report["retrieve"]["queries_per_second"]} queries/s)'
+            )
+        if 'query' in report:
+            query = report['query']
+            self.stdout.write(
+                f'Query: {latency(query["latency"])}, {query["errors"]} errors, answered by {query["answered_by"]}'
+            )
+            if 'rerank' in query:
+                rerank = query['rerank']
+                self.stdout.write(
+                    f'Rerank: {latency(rerank["latency"])}, {rerank["within_budget"]}/{rerank["queries"]} within '
+                    f'budget, {rerank["mean_tokens_saved"]} excerpt tokens saved per query '
+                    f'({rerank["tokens_saved_ratio"]:.0%} of candidates)'
+                )
+        for level in report.get('load', []):
+            self.stdout.write(
+                f'Load {level["users"]} users: {level["requests"]} requests, {level["requests_per_second"]} req/s, '
+                f'{latency(level["latency"])}, {level["errors"]} errors'
+            )
+        for name, passed in report['nfr'].items():
+            self.stdout.write(self.style.SUCCESS(f'PASS {name}') if passed else self.style.ERROR(f'FAIL {name}'))
@@ -0,0 +1,163 @@
+import json
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import DocumentChunk
+from rag.chunk_filter import ChunkFilter
+from rag.faiss_store import QUANTIZATIONS, FaissVectorStore
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure recall@k, latency and index size of quantized FAISS indexes against exact '
+        'float32 search, using stored chunk embeddings or synthetic vectors, optionally with '
+        'searches pre-filtered to a random share of the chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--queries', type=int, default=200, help='Held-out vectors used as queries')
+        parser.add_argument('--limit', type=int, default=100000, help='Maximum chunk embeddings to load')
+        parser.add_argument('--synthetic', type=int, default=0, help='Use this many synthetic vectors instead')
+        parser.add_argument('--index-type', default=None, help='Defaults to FAISS_INDEX_TYPE')
+        parser.add_argument('--quantization', default=','.join(QUANTIZATIONS))
+        parser.add_argument('--rescore-factors', default='1,4,10')
+        parser.add_argument(
+            '--visible', default='',
+            help='Comma-separated shares of chunks a filtered search may return, e.g. 0.5,0.1,0.01',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        ids, vectors = self.load_vectors(options)
+        if ids.size <= options['queries']:
+            raise CommandError(f'Need more than {options["queries"]} vectors, found {ids.size}')
+
+        # Queries are held out of the index, like questions that match no chunk exactly
+        rng = np.random.default_rng(0)
+        held_out = np.zeros(ids.size, dtype=bool)
+        held_out[rng.choice(ids.size, options['queries'], replace=False)] = True
+        queries, ids, vectors = vectors[held_out], ids[~held_out], vectors[~held_out]
+        filters = [(None, None, self.exact_top_k(vectors, ids, queries, k))]
+        for share in [float(share) for share in options['visible'].split(',') if share]:
+            visible = rng.random(ids.size) < share
+            filters.append((share, ChunkFilter.from_ids(ids[visible]), self.exact_top_k(
+                vectors[visible], ids[visible], queries, k,
+            )))
+
+        results = []
+        for quantization in options['quantization'].split(','):
+            factors = [1] if quantization == 'none' else [int(f) for f in options['rescore_factors'].split(',')]
+            with tempfile.TemporaryDirectory() as path:
+                store = FaissVectorStore(
+                    path=path, index_type=options['index_type'], dimension=vectors.shape[1], quantization=quantization,
+                )
+                started = time.perf_counter()
+                store.rebuild(self.batches(ids, vectors))
+                build_seconds = time.perf_counter() - started
+                stats = store.stats()
+                for factor in factors:
+                    store.rescore_factor = factor
+                    for share, allowed, truth in filters:
+                        results.append({
+                            'quantization': quantization,
+                            'kind': stats['main']['kind'],
+                            'rescore_factor': factor if quantization != 'none' else None,
+                            'visible': share,
+                            'build_seconds': round(build_seconds, 2),
+                            'index_bytes_per_vector': round(stats['main_index_bytes'] / ids.size, 1),
+                            'index_mb': round(stats['main_index_bytes'] / 1048576, 2),
+                            'disk_only_mb': round(stats.get('full_precision_bytes', 0) / 1048576, 2),
+                            **self.measure(store, queries, truth, k, allowed),
+                        })
+
+        baseline = next((row['index_mb'] for row in results if row['quantization'] == 'none'), None)
+        for row in results:
+            row['memory_reduction'] = round(baseline / row['index_mb'], 1) if baseline and row['index_mb'] else None
+
+        summary = {'vectors': int(ids.size), 'dimension': int(vectors.shape[1]), 'queries': len(queries), 'k': k}
+        if options['json']:
+            self.stdout.write(json.dumps({**summary, 'results': results}, indent=2))
+            return
+        self.stdout.write(
+            f'{summary["vectors"]} vectors x {summary["dimension"]} dims, {summary["queries"]} queries, recall@{k}'
+        )
+        self.stdout.write(
+            f'{"quantization":<13}{"kind":<8}{"rescore":>8}{"visible":>8}{"recall":>8}{"p50 ms":>9}{"p95 ms":>9}'
+            f'{"B/vector":>10}{"RAM MB":>9}{"disk MB":>9}{"saving":>8}'
+        )
+        for row in results:
+            self.stdout.write(
+                f'{row["quantization"]:<13}{row["kind"]:<8}{row["rescore_factor"] or "-":>8}'
+                f'{row["visible"] or "all":>8}{row["recall"]:>8.3f}{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}'
+                f'{row["index_bytes_per_vector"]:>10}{row["index_mb"]:>9}{row["disk_only_mb"]:>9}'
+                f'{(row["memory_reduction"] or 0):>7}x'
+            )
+
+    def load_vectors(self, options):
+        if options['synthetic']:
+            return self.synthetic_vectors(options['synthetic'], settings.EMBEDDING_DIMENSION)
+        rows = (
+            DocumentChunk.objects
+            .exclude(embedding=None)
+            .order_by('id')
+            .values_list('id', 'embedding')[:options['limit']]
+        )
+        ids, vectors = [], []
+        for chunk_id, embedding in rows.iterator(chunk_size=5000):
+            ids.append(chunk_id)
+            vectors.append(np.asarray(embedding, dtype=np.float32))
+        if not ids:
+            raise CommandError('No chunk embeddings found; use --synthetic N to evaluate on generated vectors')
+        return np.asarray(ids, dtype=np.int64), normalize(np.vstack(vectors))
+
+    @staticmethod
+    def synthetic_vectors(count, dimension):
+        """
+        Clustered vectors, closer to real sentence embeddings than isotropic noise.
+        """
+        rng = np.random.default_rng(42)
+        centers = rng.normal(size=(max(1, count // 50), dimension)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), count)] + 0.6 * rng.normal(size=(count, dimension))
+        return np.arange(1, count + 1, dtype=np.int64), normalize(vectors)
+
+    @staticmethod
+    def batches(ids, vectors, size=5000):
+        for start in range(0, ids.size, size):
+            yield ids[start:start + size], vectors[start:start + size]
+
+    @staticmethod
+    def exact_top_k(vectors, ids, queries, k):
+        if ids.size <= k:
+            return [set(ids.tolist()) for _ in queries]
+        truth = []
+        for start in range(0, len(queries), 64):
+            scores = queries[start:start + 64] @ vectors.T
+            top = np.argpartition(-scores, k, axis=1)[:, :k]
+            truth.extend(set(ids[row].tolist()) for row in top)
+        return truth
+
+    @staticmethod
+    def measure(store, queries, truth, k, allowed=None):
+        store.search(queries[0], k, allowed)  # load the index before timing
+        timings, hits = [], 0
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            found = store.search(query, k, allowed)
+            timings.append((time.perf_counter() - started) * 1000)
+            hits += len(expected & {chunk_id for chunk_id, _ in found})
+        return {
+            'recall': hits / max(sum(len(expected) for expected in truth), 1),
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p95_ms': float(np.percentile(timings, 95)),
+        }
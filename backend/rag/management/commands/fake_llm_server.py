@@ -0,0 +1,94 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+
+
+def make_handler(answer, first_token_delay, token_delay):
+    words = answer.split(' ')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _usage(self, prompt):
+            prompt_tokens = len(prompt.split())
+            return {
+                'promptTokenCount': prompt_tokens,
+                'candidatesTokenCount': len(words),
+                'totalTokenCount': prompt_tokens + len(words),
+            }
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            prompt = ' '.join(
+                part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', [])
+            )
+            path = urlparse(self.path).path
+            time.sleep(first_token_delay)
+
+            if path.endswith(':streamGenerateContent'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for i, word in enumerate(words):
+                    if i:
+                        time.sleep(token_delay)
+                    chunk = {'candidates': [{'content': {'parts': [{'text': word if i == 0 else f' {word}'}]}}]}
+                    if i == len(words) - 1:
+                        chunk['usageMetadata'] = self._usage(prompt)
+                    self.wfile.write(f'data: {json.dumps(chunk)}\r\n\r\n'.encode())
+                    self.wfile.flush()
+                self.close_connection = True
+                return
+
+            if path.endswith(':generateContent'):
+                time.sleep(token_delay * (len(words) - 1))
+                data = json.dumps({
+                    'candidates': [{'content': {'parts': [{'text': answer}]}}],
+                    'usageMetadata': self._usage(prompt),
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+
+            self.send_error(404)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local stand-in for the Gemini API (generateContent and streamGenerateContent). '
+        'Point the app at it with GEMINI_API_BASE_URL=http://<host>:<port>.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--answer', default='This is a canned answer from the local fake LLM server.')
+        parser.add_argument('--first-token-delay-ms', type=float, default=200)
+        parser.add_argument('--token-delay-ms', type=float, default=20)
+
+    def handle(self, *args, **options):
+        handler = make_handler(
+            options['answer'],
+            options['first_token_delay_ms'] / 1000,
+            options['token_delay_ms'] / 1000,
+        )
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write(f'Fake LLM server listening on http://{options["host"]}:{options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from documents.models import DocumentChunk
+from rag.keyword_index import get_keyword_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the BM25 keyword index from the text of the indexed DocumentChunk rows. Run it once after '
+        'deploying hybrid search, so chunks stored before the keyword index existed are searchable by keyword.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # The chunks that reach the search indexes: near-duplicates are only
+        # indexed through their canonical chunk, which holds the embedding
+        rows = (
+            DocumentChunk.objects
+            .exclude(embedding=None)
+            .order_by('id')
+            .values_list('id', 'text_content')
+            .iterator(chunk_size=batch_size)
+        )
+
+        def batches():
+            ids, texts = [], []
+            for chunk_id, text in rows:
+                ids.append(chunk_id)
+                texts.append(text)
+                if len(ids) >= batch_size:
+                    yield ids, texts
+                    ids, texts = [], []
+            if ids:
+                yield ids, texts
+
+        manifest = get_keyword_index().rebuild(batches())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt keyword index: {manifest["main"]}'))
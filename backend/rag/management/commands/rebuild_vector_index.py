@@ -0,0 +1,41 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from documents.models import DocumentChunk
+from rag.vector_store import get_vector_store
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the vector index from the embeddings stored on DocumentChunk rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        store = get_vector_store()
+        if not hasattr(store, 'rebuild'):
+            self.stdout.write('The configured vector store indexes DocumentChunk.embedding directly; nothing to rebuild.')
+            return
+
+        batch_size = options['batch_size']
+        rows = (
+            DocumentChunk.objects
+            .exclude(embedding=None)
+            .order_by('id')
+            .values_list('id', 'embedding')
+            .iterator(chunk_size=batch_size)
+        )
+
+        def batches():
+            ids, vectors = [], []
+            for chunk_id, embedding in rows:
+                ids.append(chunk_id)
+                vectors.append(np.asarray(embedding, dtype=np.float32))
+                if len(ids) >= batch_size:
+                    yield ids, np.vstack(vectors)
+                    ids, vectors = [], []
+            if ids:
+                yield ids, np.vstack(vectors)
+
+        manifest = store.rebuild(batches())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt vector index: {manifest["main"]}'))
@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from utils.timing import record_stage
+
+from .answer_cache import access_scope, get_answer_cache
+from .embeddings import embed_query
+from .retriever import Retriever, reciprocal_rank_fusion
+from .table_query import TableQueryEngine
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_stage_executor():
+    """
+    Pool the query orchestrator's stages run on, sized by RAG_STAGE_WORKERS
+    for every stage of the requests a process serves at once, plus the
+    threads of abandoned stages that are still finishing.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.RAG_STAGE_WORKERS, thread_name_prefix='rag-stage')
+    return _executor
+
+
+def _reset_after_fork():
+    # Pool threads do not survive fork()
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@dataclass
+class QueryContext:
+    """
+    Result of the pre-generation stages for one question.
+
+    ``stages`` maps each stage name to its wall time in milliseconds and
+    ``degraded`` lists the stages that timed out or failed and were skipped.
+    ``rerank`` holds the reranker's stats when it ran and ``allowed`` the
+    search pre-filter (None when the user may search everything).
+    When ``cached`` or ``table_answer`` is set, retrieval was skipped.
+    """
+    question: str
+    query_vector: object = None
+    scope: str = None
+    allowed: object = None
+    history: list = field(default_factory=list)
+    cached: dict = None
+    table_answer: object = None
+    retrieved: list = field(default_factory=list)
+    rerank: dict = None
+    stages: dict = field(default_factory=dict)
+    degraded: list = field(default_factory=list)
+
+
+class QueryOrchestrator:
+    """
+    Runs the independent stages of the RAG query path concurrently.
+
+    Embedding, the search pre-filter, the access-scope lookup and history
+    loading start together, as does the table query when enabled; the
+    keyword leg starts once the filter is ready, the cache lookup and vector
+    leg once the query vector is. Every stage has its own time budget. A
+    stage that overruns or fails is recorded in ``degraded`` and the request
+    carries on without it: no history, keyword-only retrieval when the
+    embedding is late, no answer cache when the scope cannot be computed,
+    unfiltered search (still checked for visibility) without the filter.
+    The optional rerank runs last, on the visible chunks, under its own
+    budget; when it runs out the retrieval order is kept, which is not
+    counted as degraded.
+
+    Stages run on their own pool (``get_stage_executor``). A stage's budget
+    starts when a pool thread picks it up, so time spent queued behind other
+    requests does not degrade it; a stage still queued after
+    RAG_STAGE_QUEUE_TIMEOUT is cancelled and degraded instead. Database
+    stages get their own pooled-thread connection, released afterwards
+    under the usual CONN_MAX_AGE rules, so a slow query in one stage cannot
+    hold up another. A timed-out stage is abandoned, not interrupted.
+    """
+
+    def __init__(self, retriever=None, answer_cache=None, table_engine=None, timeouts=None):
+        self.retriever = retriever or Retriever()
+        self.answer_cache = get_answer_cache() if answer_cache is None else answer_cache
+        if table_engine is None and settings.TABLE_QUERY_ENABLED:
+            table_engine = TableQueryEngine()
+        self.table_engine = table_engine
+        self.timeouts = {
+            'embed': settings.RAG_EMBED_TIMEOUT,
+            'scope': settings.RAG_DB_STAGE_TIMEOUT,
+            'filter': settings.RAG_DB_STAGE_TIMEOUT,
+            'history': settings.RAG_DB_STAGE_TIMEOUT,
+            'cache_lookup': settings.RAG_CACHE_LOOKUP_TIMEOUT,
+            'vector_search': settings.RAG_SEARCH_TIMEOUT,
+            'keyword_search': settings.RAG_SEARCH_TIMEOUT,
+            'load_chunks': settings.RAG_DB_STAGE_TIMEOUT,
+            'table_query': settings.RAG_DB_STAGE_TIMEOUT,
+        }
+        self.timeouts.update(timeouts or {})
+
+    async def _stage(self, context, name, func, *args, db=False, default=None):
+        call = functools.partial(func, *args)
+        if db:
+            call = functools.partial(_with_db_cleanup, call)
+        # Carry the request's context (e.g. its metrics) into the pool thread
+        call = functools.partial(contextvars.copy_context().run, call)
+        loop = asyncio.get_running_loop()
+        running = asyncio.Event()
+        future = get_stage_executor().submit(_when_running, loop, running, call)
+
+        started = time.perf_counter()
+        try:
+            try:
+                await asyncio.wait_for(running.wait(), settings.RAG_STAGE_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                future.cancel()
+                logger.warning(f'RAG stage {name} waited {settings.RAG_STAGE_QUEUE_TIMEOUT}s for a thread, '
+                               f'continuing without it')
+            else:
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeouts.get(name))
+        except asyncio.TimeoutError:
+            logger.warning(f'RAG stage {name} exceeded {self.timeouts.get(name)}s, continuing without it')
+        except Exception:
+            logger.exception(f'RAG stage {name} failed, continuing without it')
+        finally:
+            context.stages[name] = round((time.perf_counter() - started) * 1000, 1)
+            record_stage(name, context.stages[name])
+        context.degraded.append(name)
+        return default
+
+    async def _keyword_leg(self, context, filter_task, question, k):
+        allowed = await filter_task
+        return await self._stage(context, 'keyword_search', self.retriever.keyword_search, question, k, allowed, default=[])
+
+    async def _scope_leg(self, context, history_task, user, category):
+        # Answers to follow-up turns are never stored, so they must not be looked up either
+        if history_task is not None and await history_task:
+            return None
+        return await self._stage(context, 'scope', access_scope, user, category, db=True)
+
+    async def run(self, question, user, load_history=None, category=None, cacheable=True):
+        """
+        Prepare a question for generation.
+
+        ``load_history`` is a callable returning prior messages, or ``None``
+        when the caller already has them. With ``category``, only documents
+        in it or its subcategories are searched. The answer cache is only
+        consulted when ``cacheable`` is true and ``load_history`` returns no
+        messages. Returns a QueryContext.
+        """
+        context = QueryContext(question=question)
+        started = time.perf_counter()
+        top_k = self.retriever.top_k
+        limit = self.retriever.rerank_candidates(top_k)
+        candidates = max(limit, settings.RAG_CANDIDATES)
+
+        pending = []
+
+        def start(coroutine):
+            task = asyncio.ensure_future(coroutine)
+            pending.append(task)
+            return task
+
+        embed_task = start(self._stage(context, 'embed', embed_query, question))
+        filter_task = start(self._stage(context, 'filter', self.retriever.chunk_filter, user, category, db=True))
+        history_task = None
+        if load_history is not None:
+            history_task = start(self._stage(context, 'history', load_history, db=True, default=[]))
+        scope_task = None
+        if self.answer_cache is not None and cacheable:
+            scope_task = start(self._scope_leg(context, history_task, user, category))
+        table_task = None
+        if self.table_engine is not None:
+            table_task = start(self._stage(
+                context, 'table_query', self.table_engine.answer, question, user, category, db=True,
+            ))
+        keyword_task = None
+        if self.retriever.hybrid:
+            keyword_task = start(self._keyword_leg(context, filter_task, question, candidates))
+
+        try:
+            if table_task is not None:
+                # Exact answers from stored tables take precedence over everything else
+                context.table_answer = await table_task
+                if context.table_answer is not None:
+                    return context
+
+            context.query_vector = await embed_task
+            if scope_task is not None:
+                context.scope = await scope_task
+
+            if context.query_vector is not None and context.scope is not None:
+                context.cached = await self._stage(
+                    context, 'cache_lookup', self.answer_cache.lookup, context.scope, context.query_vector,
+                )
+                if context.cached is not None:
+                    return context
+
+            result_lists = []
+            context.allowed = await filter_task
+            if context.query_vector is not None:
+                vector_hits = await self._stage(
+                    context, 'vector_search', self.retriever.vector_store.search,
+                    context.query_vector, candidates, context.allowed, default=None,
+                )
+                if vector_hits is not None:
+                    result_lists.append(vector_hits)
+            if keyword_task is None and not result_lists:
+                # Vector leg unavailable: fall back to keyword search even in vector-only mode
+                keyword_task = start(self._keyword_leg(context, filter_task, question, candidates))
+            if keyword_task is not None:
+                result_lists.append(await keyword_task)
+
+            if len(result_lists) > 1:
+                hits = reciprocal_rank_fusion(result_lists)[:limit]
+            else:
+                hits = (result_lists[0] if result_lists else [])[:limit]
+            context.retrieved = await self._stage(
+                context, 'load_chunks', self.retriever.load_visible_chunks, hits, user, category, db=True, default=[],
+            )
+            if self.retriever.reranker and context.retrieved:
+                context.retrieved, context.rerank = await self.retriever.reranker.arerank(
+                    question, context.retrieved, top_k,
+                )
+                context.stages['rerank'] = context.rerank['ms']
+            if history_task is not None:
+                context.history = await history_task
+            return context
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+            context.stages['total'] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _when_running(loop, running, call):
+    try:
+        loop.call_soon_threadsafe(running.set)
+    except RuntimeError:
+        # The request is gone (its event loop closed) while the stage was queued
+        return None
+    return call()
+
+
+def _with_db_cleanup(func):
+    try:
+        return func()
+    finally:
+        close_old_connections()
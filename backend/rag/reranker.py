@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import replace
+
+from django.conf import settings
+
+from utils.timing import record_stage
+
+from .context_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def get_cross_encoder():
+    """
+    Load the cross-encoder named by RAG_RERANK_MODEL once per process.
+    """
+    from sentence_transformers import CrossEncoder
+
+    logger.info(f'Loading rerank model {settings.RAG_RERANK_MODEL}')
+    return CrossEncoder(settings.RAG_RERANK_MODEL, device='cpu', max_length=settings.RAG_RERANK_MAX_LENGTH)
+
+
+def get_rerank_executor():
+    """
+    Pool the cross-encoder runs on, separate from the search pool.
+
+    With one worker (RAG_RERANK_WORKERS) concurrent requests queue for the
+    model instead of splitting the CPU between them; time spent queued
+    counts against the request's budget.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.RAG_RERANK_WORKERS, thread_name_prefix='rag-rerank')
+    return _executor
+
+
+def _reset_after_fork():
+    # Pool threads do not survive fork()
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Reranker:
+    """
+    Reorders retrieved chunks by cross-encoder relevance to the query.
+
+    All ``(query, chunk)`` pairs are scored in one batched CPU pass and the
+    best ``top_n`` are kept, so fewer, better excerpts reach the prompt. The
+    pass must finish within ``budget_ms`` of being submitted, queueing
+    included; otherwise the candidates keep their original order, cut to
+    the caller's ``top_k``. A pass that has already started when the budget
+    runs out finishes in the background and its scores are discarded.
+
+    ``rerank``, and ``arerank`` for the query orchestrator, which waits
+    without blocking the event loop, return the chunks and a stats dict
+    with the wall time, the number of candidates and kept chunks, and the
+    excerpt tokens saved against sending every candidate.
+    """
+
+    def __init__(self, model=None, top_n=None, budget_ms=None):
+        self._model = model
+        self.top_n = top_n or settings.RAG_RERANK_TOP_N
+        self.budget_ms = settings.RAG_RERANK_BUDGET_MS if budget_ms is None else budget_ms
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else get_cross_encoder()
+
+    def score(self, query, retrieved):
+        pairs = [(query, item.chunk.text_content) for item in retrieved]
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False, convert_to_numpy=True)
+
+    def submit(self, query, retrieved):
+        return get_rerank_executor().submit(self.score, query, retrieved)
+
+    def rerank(self, query, retrieved, top_k):
+        """
+        Rerank within the budget, blocking the calling thread.
+        """
+        if not retrieved:
+            return [], None
+        started = time.perf_counter()
+        future = self.submit(query, retrieved)
+        try:
+            scores = future.result(timeout=self.budget_ms / 1000)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning(f'Rerank exceeded {self.budget_ms} ms, keeping the retrieval order')
+            scores = None
+        except Exception:
+            logger.exception('Rerank failed, keeping the retrieval order')
+            scores = None
+        return self.apply(retrieved, scores, top_k, started)
+
+    async def arerank(self, query, retrieved, top_k):
+        """
+        ``rerank`` for coroutines.
+        """
+        if not retrieved:
+            return [], None
+        started = time.perf_counter()
+        future = self.submit(query, retrieved)
+        try:
+            # Cancelling the wrapper also cancels the pass if it has not started
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning(f'Rerank exceeded {self.budget_ms} ms, keeping the retrieval order')
+            scores = None
+        except Exception:
+            logger.exception('Rerank failed, keeping the retrieval order')
+            scores = None
+        return self.apply(retrieved, scores, top_k, started)
+
+    def apply(self, retrieved, scores, top_k, started):
+        """
+        Order ``retrieved`` by ``scores`` and keep ``top_n``, or keep the
+        first ``top_k`` when ``scores`` is None. Returns ``(chunks, stats)``.
+        """
+        ms = (time.perf_counter() - started) * 1000
+        record_stage('rerank', ms)
+        if scores is None:
+            kept = retrieved[:top_k]
+        else:
+            order = sorted(range(len(retrieved)), key=lambda index: scores[index], reverse=True)
+            kept = [replace(retrieved[index], score=float(scores[index])) for index in order[:self.top_n]]
+
+        candidate_tokens = sum(estimate_tokens(item.chunk.text_content) for item in retrieved)
+        kept_tokens = sum(estimate_tokens(item.chunk.text_content) for item in kept)
+        stats = {
+            'applied': scores is not None,
+            'ms': round(ms, 1),
+            'candidates': len(retrieved),
+            'kept': len(kept),
+            'candidate_tokens': candidate_tokens,
+            'tokens_saved': candidate_tokens - kept_tokens,
+        }
+        return kept, stats
+
+
+def get_reranker():
+    """
+    Return the per-process Reranker, or None when RAG_RERANK_ENABLED is off.
+    """
+    global _reranker
+    if not settings.RAG_RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
@@ -0,0 +1,189 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from documents.models import Document, DocumentChunk
+from .chunk_filter import build_chunk_filter
+from .embeddings import embed_query
+from .keyword_index import get_keyword_index
+from .reranker import get_reranker
+from .vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_search_executor():
+    """
+    Shared thread pool used to run retrieval legs concurrently.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.RAG_SEARCH_WORKERS, thread_name_prefix='rag-search')
+    return _executor
+
+
+@dataclass
+class RetrievedChunk:
+    chunk: DocumentChunk
+    score: float
+
+    @property
+    def document(self):
+        return self.chunk.document
+
+
+def reciprocal_rank_fusion(result_lists, k=None):
+    """
+    Fuse ranked ``(chunk_id, score)`` lists with reciprocal rank fusion.
+
+    Each list contributes ``1 / (k + rank)`` for every chunk it contains, so
+    only ranks matter and BM25 and cosine scores need no calibration.
+    """
+    k = settings.RAG_RRF_K if k is None else k
+    fused = {}
+    for results in result_lists:
+        for rank, (chunk_id, _) in enumerate(results, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class Retriever:
+    """
+    Retrieves the document chunks most relevant to a query.
+
+    With RAG_HYBRID_SEARCH enabled the BM25 keyword leg and the embedding +
+    vector search leg run concurrently and are fused with reciprocal rank
+    fusion, so exact codes and table numbers are found even when dense
+    embeddings rank them poorly. With a reranker (RAG_RERANK_ENABLED), the
+    first RAG_RERANK_CANDIDATES results are reordered by a cross-encoder
+    before being cut.
+
+    Searches for a user are pre-filtered inside both indexes to the chunks
+    the user may see, optionally within one category (see
+    ``rag.chunk_filter``), so narrow access does not starve the results.
+    """
+
+    def __init__(self, vector_store=None, keyword_index=None, top_k=None, hybrid=None, reranker=None):
+        self.vector_store = vector_store or get_vector_store()
+        self.keyword_index = keyword_index or get_keyword_index()
+        self.top_k = top_k or settings.RAG_TOP_K
+        self.hybrid = settings.RAG_HYBRID_SEARCH if hybrid is None else hybrid
+        self.reranker = get_reranker() if reranker is None else reranker
+
+    def rerank_candidates(self, top_k):
+        """
+        How many results to load: enough for the reranker to choose from, if there is one.
+        """
+        return max(top_k, settings.RAG_RERANK_CANDIDATES) if self.reranker else top_k
+
+    def retrieve(self, query, top_k=None, query_vector=None, user=None, category=None):
+        """
+        Retrieve chunks for ``query``, from every document or, with
+        ``user``, from those the user may see, limited to ``category`` and
+        its subcategories when given.
+        """
+        top_k = top_k or self.top_k
+        limit = self.rerank_candidates(top_k)
+        allowed = self.chunk_filter(user, category) if user is not None else None
+        if not self.hybrid:
+            hits = self.vector_search(query, limit, query_vector, allowed)
+            return self.rerank(query, self.load_hits(hits, user, category), top_k)
+
+        candidates = max(limit, settings.RAG_CANDIDATES)
+        keyword_future = get_search_executor().submit(self.keyword_search, query, candidates, allowed)
+        vector_hits = self.vector_search(query, candidates, query_vector, allowed)
+        try:
+            keyword_hits = keyword_future.result()
+        except Exception:
+            logger.exception('Keyword search failed, using vector results only')
+            keyword_hits = []
+
+        fused = reciprocal_rank_fusion([vector_hits, keyword_hits])[:limit]
+        return self.rerank(query, self.load_hits(fused, user, category), top_k)
+
+    def chunk_filter(self, user, category=None):
+        return build_chunk_filter(user, category)
+
+    def load_hits(self, hits, user=None, category=None):
+        if user is None:
+            return self.load_chunks(hits)
+        return self.load_visible_chunks(hits, user, category)
+
+    def rerank(self, query, retrieved, top_k):
+        if not self.reranker:
+            return retrieved
+        retrieved, stats = self.reranker.rerank(query, retrieved, top_k)
+        if stats is not None:
+            logger.debug(f'Rerank: {stats}')
+        return retrieved
+
+    def vector_search(self, query, k, query_vector=None, allowed=None):
+        if query_vector is None:
+            query_vector = embed_query(query)
+        return self.vector_store.search(query_vector, k, allowed)
+
+    def keyword_search(self, query, k, allowed=None):
+        return self.keyword_index.search(query, k, allowed)
+
+    def load_chunks(self, hits):
+        """
+        Turn ``(chunk_id, score)`` hits into RetrievedChunk objects, preserving order.
+        """
+        if not hits:
+            return []
+        chunks = (
+            DocumentChunk.objects
+            .select_related('document')
+            .defer('embedding', 'minhash')
+            .in_bulk([chunk_id for chunk_id, _ in hits])
+        )
+        return [
+            RetrievedChunk(chunk=chunks[chunk_id], score=score)
+            for chunk_id, score in hits
+            if chunk_id in chunks
+        ]
+
+    def load_visible_chunks(self, hits, user, category=None):
+        """
+        ``load_chunks`` limited to documents ``user`` may see, and to
+        ``category`` and its subcategories when given.
+
+        A hit on a chunk of a hidden document is served from a
+        near-duplicate of it in a visible document when there is one. The
+        search pre-filter already keeps other hidden chunks out; checking
+        again here covers a filter that lags behind a change of access.
+        """
+        retrieved = self.load_chunks(hits)
+        documents = Document.objects.visible_to(user)
+        if category is not None:
+            documents = documents.filter(category__in=category.with_descendants())
+        visible = set(
+            documents.filter(pk__in={item.chunk.document_id for item in retrieved}).values_list('pk', flat=True)
+        )
+        hidden = {item.chunk.id for item in retrieved if item.chunk.document_id not in visible}
+        substitutes = {}
+        if hidden:
+            duplicates = (
+                DocumentChunk.objects
+                .filter(duplicate_of__in=hidden, document__in=documents)
+                .select_related('document')
+                .defer('embedding', 'minhash')
+                .order_by('id')
+            )
+            for chunk in duplicates:
+                substitutes.setdefault(chunk.duplicate_of_id, chunk)
+        results = []
+        for item in retrieved:
+            if item.chunk.id not in hidden:
+                results.append(item)
+            elif item.chunk.id in substitutes:
+                results.append(RetrievedChunk(chunk=substitutes[item.chunk.id], score=item.score))
+        return results
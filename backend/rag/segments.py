@@ -0,0 +1,130 @@
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+
+import numpy as np
+
+EMPTY_MANIFEST = {'seq': 0, 'max_id': -1, 'main': None, 'segments': [], 'tombstones': []}
+
+
+class SegmentDirectory:
+    """
+    On-disk layout shared by the append-only search indexes in this app.
+
+    A directory holds an optional *main* segment, small *delta* segments and
+    *tombstone* files (sorted arrays of deleted chunk ids), all listed in
+    ``manifest.json``. Every entry carries a sequence number; a tombstone
+    hides its ids from every segment with a lower sequence number, which is
+    how deletes and upserts work without rewriting existing segments.
+
+    Files are written to a temporary name and renamed into place, so readers
+    never observe partial writes. Writers serialize on ``flock`` so the
+    directory can be shared by every web and Celery process on a node.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def read_manifest(self):
+        try:
+            with open(self.file('manifest.json')) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return json.loads(json.dumps(EMPTY_MANIFEST))
+
+    def write_manifest(self, manifest):
+        with self.atomic_path('manifest.json') as tmp:
+            with open(tmp, 'w') as fh:
+                json.dump(manifest, fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    def manifest_stamp(self):
+        """
+        Return a value that changes whenever the manifest is replaced, or None.
+        """
+        try:
+            stat = os.stat(self.file('manifest.json'))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @contextlib.contextmanager
+    def atomic_path(self, name):
+        """
+        Yield a temporary path which is renamed to ``name`` on success.
+        """
+        tmp = self.file(f'{name}.{os.getpid()}.tmp')
+        try:
+            yield tmp
+            os.replace(tmp, self.file(name))
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+
+    @contextlib.contextmanager
+    def lock(self):
+        with open(self.file('write.lock'), 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def append_tombstone(self, manifest, ids):
+        seq = manifest['seq'] + 1
+        name = f'tombstone-{seq}.npy'
+        with self.atomic_path(name) as tmp:
+            with open(tmp, 'wb') as fh:
+                np.save(fh, np.unique(np.asarray(ids, dtype=np.int64)))
+        manifest['tombstones'].append({'file': name, 'seq': seq, 'count': int(len(ids))})
+        manifest['seq'] = seq
+
+    def load_tombstones(self, manifest):
+        return [(entry['seq'], np.load(self.file(entry['file']))) for entry in manifest['tombstones']]
+
+    @staticmethod
+    def deleted_after(tombstones, seq):
+        """
+        Ids deleted by tombstones newer than a segment with sequence ``seq``.
+        """
+        later = [ids for tombstone_seq, ids in tombstones if tombstone_seq > seq]
+        if not later:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(later))
+
+    def remove_unreferenced(self, manifest):
+        """
+        Delete files no longer listed in ``manifest``, including the main
+        segment's ``sidecars`` (extra files stored next to it).
+        """
+        referenced = {'manifest.json', 'write.lock'}
+        if manifest['main']:
+            referenced.add(manifest['main']['file'])
+            referenced.update(manifest['main'].get('sidecars', {}).values())
+        referenced.update(entry['file'] for entry in manifest['segments'] + manifest['tombstones'])
+        for name in os.listdir(self.path):
+            if name in referenced or name.endswith('.tmp'):
+                continue
+            path = self.file(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    @staticmethod
+    def pending_work(manifest):
+        """
+        Number of segments/tombstones and ids waiting to be compacted.
+        """
+        entries = manifest['segments'] + manifest['tombstones']
+        return len(entries), sum(entry['count'] for entry in entries)
@@ -0,0 +1,251 @@
+import logging
+import math
+import re
+from dataclasses import dataclass
+
+import numpy as np
+from django.db.models import Case, IntegerField, Value, When
+
+from documents.models import Document, DocumentTable
+from .keyword_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = (
+    ('sum', np.nansum, re.compile(r'\b(sum|add up|combined|aggregate|total of|overall total)\b')),
+    ('mean', np.nanmean, re.compile(r'\b(average|mean|avg)\b')),
+    ('max', np.nanmax, re.compile(r'\b(highest|maximum|max|largest)\b')),
+    ('min', np.nanmin, re.compile(r'\b(lowest|minimum|min|smallest|(?<!at )least)\b')),
+)
+OPERATION_LABELS = {'sum': 'Sum', 'mean': 'Average', 'max': 'Highest', 'min': 'Lowest'}
+# Lookups must be phrased as one; a bare year or "value" is not enough to try the tables
+LOOKUP_RE = re.compile(r'\b(how much|values? (of|for)|figures? (of|for)|(according to|from|in) the table)\b')
+TOTAL_ROW_RE = re.compile(r'\b(total|all[- ]india)\b', re.IGNORECASE)
+YEAR_COLUMN_RE = re.compile(r'^\s*(19|20)\d{2}([-/](\d{2}|(19|20)\d{2}))?\s*$')
+GENERIC_COLUMN_TERMS = frozenset({'column'})
+
+
+@dataclass
+class TableMatch:
+    table: DocumentTable
+    column: int
+    rows: list
+    score: int
+
+
+@dataclass
+class TableAnswer:
+    """
+    An exact answer computed from a stored table.
+    """
+    answer: str
+    references: list
+    operation: str
+    value: float
+
+
+def match_terms(text):
+    """
+    Index terms with a naive plural strip, so "states" matches "State".
+    """
+    return {term[:-1] if len(term) > 3 and term.endswith('s') else term for term in tokenize(text)}
+
+
+# Question words that carry no meaning a table has to account for
+QUESTION_TERMS = frozenset(match_terms(
+    'what which who whom whose when where how much many had have did does do show give list tell me please '
+    'recorded reported registered value figure table according across among between during'
+))
+OPERATION_TERMS = frozenset(match_terms(
+    'sum add up combined aggregate total overall average mean avg highest maximum max largest '
+    'lowest minimum min smallest least'
+))
+# Words that name rows or periods, never the measure itself
+GENERIC_TERMS = frozenset(match_terms('state india all year district region country union territory ut'))
+
+
+def content_terms(question):
+    """
+    The question's terms a table has to account for before it may answer it.
+    """
+    return match_terms(question) - QUESTION_TERMS - OPERATION_TERMS
+
+
+def detect_operation(question):
+    lowered = question.lower()
+    for name, _, pattern in OPERATIONS:
+        if pattern.search(lowered):
+            return name
+    return None
+
+
+def is_table_question(question):
+    """
+    Cheap gate so ordinary questions never reach the database.
+    """
+    return detect_operation(question) is not None or LOOKUP_RE.search(question.lower()) is not None
+
+
+def title_pattern(word):
+    """
+    Word-boundary regex for ``word`` (and its plural) that PostgreSQL and SQLite both accept.
+    """
+    return rf'(^|[^a-z0-9]){word}s?([^a-z0-9]|$)'
+
+
+def format_number(value):
+    if float(value).is_integer():
+        return f'{int(value):,}'
+    return f'{value:,.2f}'
+
+
+class TableQueryEngine:
+    """
+    Answers lookup and aggregation questions from stored document tables.
+
+    The question is matched against table titles, column names and row
+    labels; when one table, one column and a set of rows are identified
+    unambiguously, the result is computed with NumPy over that column
+    alone. Anything less certain returns ``None`` and the question goes
+    through normal retrieval and generation, including when any content
+    term of the question is not covered by the table or only generic words
+    (state, year, ...) and year columns tie the question to it.
+    """
+
+    def __init__(self, max_candidates=50):
+        self.max_candidates = max_candidates
+
+    def answer(self, question, user, category=None):
+        if not is_table_question(question):
+            return None
+        terms = match_terms(question)
+        operation = detect_operation(question)
+        content = content_terms(question)
+
+        match = None
+        for table in self.candidate_tables(terms, user, category):
+            candidate = self.match(table, terms, operation, content)
+            if candidate is not None and (match is None or candidate.score > match.score):
+                match = candidate
+        if match is None:
+            return None
+        return self.compute(match, operation)
+
+    def candidate_tables(self, terms, user, category=None):
+        words = sorted(term for term in terms if len(term) >= 3 and term.isalnum() and not term.isdigit())
+        if not words:
+            return []
+        # Rank by whole-word title matches so "rate" does not pull in "Corporate"
+        title_score = sum(
+            Case(When(title__iregex=title_pattern(word), then=Value(1)), default=Value(0), output_field=IntegerField())
+            for word in words
+        )
+        documents = Document.objects.visible_to(user)
+        if category is not None:
+            documents = documents.filter(category__in=category.with_descendants())
+        return list(
+            DocumentTable.objects
+            .filter(document__in=documents, document__status=Document.STATUS_COMPLETED)
+            .annotate(title_score=title_score)
+            .filter(title_score__gt=0)
+            .order_by('-title_score', '-document__created_at', 'table_index')
+            .select_related('document')[:self.max_candidates]
+        )
+
+    def match(self, table, terms, operation, content):
+        title_terms = match_terms(table.title)
+        title_score = len(terms & title_terms)
+        if not title_score:
+            return None
+
+        measure_terms = title_terms.union(*(
+            match_terms(name) for name in table.columns if not YEAR_COLUMN_RE.match(name)
+        ))
+        covered = measure_terms.union(
+            *(match_terms(name) for name in table.columns), *(match_terms(label) for label in table.row_labels),
+        )
+        # Every term must be accounted for, and at least one must name the measure
+        if not content <= covered or not (content & measure_terms) - GENERIC_TERMS:
+            return None
+
+        column_scores = [len(terms & (match_terms(name) - GENERIC_COLUMN_TERMS)) for name in table.columns]
+        best = max(column_scores, default=0)
+        if best:
+            if column_scores.count(best) > 1:
+                return None
+            column = column_scores.index(best)
+        elif len(table.columns) == 1:
+            column = 0
+        else:
+            return None
+
+        matched = []
+        for position, label in enumerate(table.row_labels):
+            label_terms = match_terms(label)
+            if label_terms and label_terms <= terms:
+                matched.append(position)
+
+        if operation is None:
+            # A plain lookup needs both a row and a column named in the question
+            if not matched or not best:
+                return None
+            rows = matched
+        else:
+            rows = [row for row in matched if not TOTAL_ROW_RE.search(table.row_labels[row])]
+            if not rows:
+                rows = [
+                    position for position, label in enumerate(table.row_labels) if not TOTAL_ROW_RE.search(label)
+                ]
+            if not rows:
+                return None
+        return TableMatch(table=table, column=column, rows=rows, score=2 * title_score + best + len(matched))
+
+    def compute(self, match, operation):
+        table = match.table
+        column_name = table.columns[match.column]
+        try:
+            values = table.column_values([match.column])[match.column][match.rows]
+        except (OSError, KeyError, ValueError):
+            logger.exception(f'Could not read table {table.pk}')
+            return None
+        present = ~np.isnan(values)
+        if not present.any():
+            return None
+
+        source = f'Source: {table.document.title}, page {table.page_number}'
+        if table.title:
+            source += f' ("{table.title}")'
+        missing = int((~present).sum())
+        note = f' {missing} row(s) with no value were skipped.' if missing else ''
+
+        if operation is None:
+            lines = [
+                f'{table.row_labels[row]}, {column_name}: {format_number(value) if not math.isnan(value) else "not available"}'
+                for row, value in zip(match.rows, values)
+            ]
+            answer = '\n'.join(lines) + f'\n\n{source}'
+            value = float(values[present][0])
+            operation = 'lookup'
+        elif operation in ('max', 'min'):
+            position = int(np.nanargmax(values) if operation == 'max' else np.nanargmin(values))
+            value = float(values[position])
+            answer = (
+                f'{OPERATION_LABELS[operation]} {column_name} across {len(match.rows)} rows: '
+                f'{table.row_labels[match.rows[position]]} with {format_number(value)}.{note}\n\n{source}'
+            )
+        else:
+            function = dict((name, function) for name, function, _ in OPERATIONS)[operation]
+            value = float(function(values))
+            answer = (
+                f'{OPERATION_LABELS[operation]} of {column_name} across {int(present.sum())} rows: '
+                f'{format_number(value)}.{note}\n\n{source}'
+            )
+
+        references = [{
+            'document_id': str(table.document_id),
+            'title': table.document.title,
+            'table_id': str(table.pk),
+            'page_number': table.page_number,
+            'score': 1.0,
+        }]
+        return TableAnswer(answer=answer, references=references, operation=operation, value=value)
@@ -0,0 +1,37 @@
+import logging
+
+from celery import shared_task
+from django.core.cache import cache
+
+from .keyword_index import get_keyword_index
+from .vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def compact_vector_index():
+    """
+    Fold pending delta segments and deletions into the main vector index.
+    """
+    store = get_vector_store()
+    if not hasattr(store, 'compact'):
+        return None
+    try:
+        manifest = store.compact()
+    finally:
+        cache.delete(f'rag:faiss:compaction:{store.path}')
+    return manifest['main']
+
+
+@shared_task
+def compact_keyword_index():
+    """
+    Merge keyword index segments and drop deleted chunks.
+    """
+    index = get_keyword_index()
+    try:
+        manifest = index.compact()
+    finally:
+        cache.delete(f'rag:keyword:compaction:{index.path}')
+    return manifest['main']
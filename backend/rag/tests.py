@@ -0,0 +1,331 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.client import AsyncRequestFactory
+
+from documents.models import Document
+from documents.tables import ExtractedTable, save_tables
+from utils.sse import event_stream, is_asgi
+from .llm_integration import GeminiClient, LLMError
+from .management.commands.fake_llm_server import make_handler
+from .chunk_filter import ChunkFilter
+from .faiss_store import FaissVectorStore
+from .table_query import TableQueryEngine, is_table_question
+from .vector_store import PgVectorStore
+
+
+def serve(handler):
+    """
+    Start ``handler`` on a free local port; returns the server and its base URL.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class MalformedStreamHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        self.wfile.write(b'data: {"candidates": [{"content": {"parts": [{"text": "Hello"}]}}]}\r\n\r\n')
+        self.wfile.write(b'data: {not json\r\n\r\n')
+        self.wfile.flush()
+
+
+class LLMStreamingTests(SimpleTestCase):
+    answer = 'Inflation eased to 4.2 percent in March.'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server, cls.base_url = serve(make_handler(cls.answer, first_token_delay=0, token_delay=0))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def llm(self, base_url=None):
+        return GeminiClient(api_key='test', model='fake', base_url=base_url or self.base_url, timeout=5)
+
+    def test_stream_yields_fragments_and_usage(self):
+        usage = {}
+        fragments = list(self.llm().stream('What was inflation?', usage=usage))
+        self.assertEqual(len(fragments), len(self.answer.split(' ')))
+        self.assertEqual(''.join(fragments), self.answer)
+        self.assertEqual(usage['candidatesTokenCount'], len(fragments))
+
+    def test_astream_yields_fragments_and_reuses_client(self):
+        client = self.llm()
+
+        async def collect():
+            usage = {}
+            first = [fragment async for fragment in client.astream('What was inflation?', usage=usage)]
+            pooled = client._async_client()
+            second = [fragment async for fragment in client.astream('And in April?')]
+            self.assertIs(client._async_client(), pooled)
+            return first, second, usage
+
+        first, second, usage = asyncio.run(collect())
+        self.assertEqual(''.join(first), self.answer)
+        self.assertEqual(''.join(second), self.answer)
+        self.assertIn('totalTokenCount', usage)
+
+    def test_malformed_event_raises_llm_error(self):
+        server, base_url = serve(MalformedStreamHandler)
+        try:
+            fragments = []
+            with self.assertRaises(LLMError):
+                for fragment in self.llm(base_url).stream('Hi'):
+                    fragments.append(fragment)
+            self.assertEqual(fragments, ['Hello'])
+
+            async def consume():
+                async for _ in self.llm(base_url).astream('Hi'):
+                    pass
+
+            with self.assertRaises(LLMError):
+                asyncio.run(consume())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_event_stream_matches_the_server_interface(self):
+        async def async_events():
+            yield 'event: token\n\n'
+
+        def sync_events():
+            yield 'event: token\n\n'
+
+        wsgi_request = RequestFactory().get('/')
+        asgi_request = AsyncRequestFactory().get('/')
+        self.assertFalse(is_asgi(wsgi_request))
+        self.assertTrue(is_asgi(asgi_request))
+        self.assertFalse(event_stream(wsgi_request, async_events, sync_events).is_async)
+        self.assertTrue(event_stream(asgi_request, async_events, sync_events).is_async)
+        self.assertEqual(list(event_stream(wsgi_request, async_events, sync_events)), [b'event: token\n\n'])
+
+
+class TableQueryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.storage = tempfile.mkdtemp()
+        cls.storage_settings = override_settings(DOCUMENT_STORAGE_PATH=cls.storage)
+        cls.storage_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.storage_settings.disable()
+        shutil.rmtree(cls.storage, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email='tables@example.com', username='tables', password=None)
+        document = Document.objects.create(
+            title='Statistical Year Book 2023', file='yearbook.pdf', file_type='pdf',
+            user=cls.user, status=Document.STATUS_COMPLETED,
+        )
+        save_tables(document, [
+            ExtractedTable(
+                page_number=12, title='Corporate tax collections by state', columns=['2021', '2022'],
+                row_labels=['Kerala', 'Punjab'], rows=[[10.0, 11.0], [20.0, 21.0]],
+            ),
+            ExtractedTable(
+                page_number=40, title='Literacy rate by state', columns=['2011', '2021'],
+                row_labels=['Kerala', 'Punjab', 'All India'], rows=[[94.0, 96.2], [75.8, 83.7], [73.0, 77.7]],
+            ),
+            ExtractedTable(
+                page_number=55, title='Per capita GSDP by State', columns=['2021', '2022'],
+                row_labels=['Kerala', 'Punjab'], rows=[[230000.0, 250000.0], [160000.0, 170000.0]],
+            ),
+        ])
+
+    def test_ordinary_year_questions_skip_the_tables(self):
+        questions = [
+            'What was the inflation rate in 2022?',
+            'Summarise the 2021 census report for Kerala',
+            'What does the 2023 estimate say about export growth?',
+            'How many states reported literacy data in 2011?',
+            'Which districts need at least two new schools?',
+        ]
+        for question in questions:
+            with self.subTest(question=question):
+                self.assertFalse(is_table_question(question))
+                with self.assertNumQueries(0):
+                    self.assertIsNone(TableQueryEngine().answer(question, self.user))
+
+    def test_table_phrasings_pass_the_gate(self):
+        for question in [
+            'What is the average literacy rate by state in 2021?',
+            'Which state has the highest literacy rate in 2011?',
+            'How much was the literacy rate of Kerala in 2021?',
+            'What is the value of corporate tax for Punjab in 2022?',
+        ]:
+            with self.subTest(question=question):
+                self.assertTrue(is_table_question(question))
+
+    def test_candidates_match_whole_title_words_in_score_order(self):
+        engine = TableQueryEngine()
+        titles = [table.title for table in engine.candidate_tables({'rate', 'state'}, self.user)]
+        self.assertEqual(titles[0], 'Literacy rate by state')
+        self.assertCountEqual(titles[1:], ['Corporate tax collections by state', 'Per capita GSDP by State'])
+        self.assertEqual(
+            [table.title for table in engine.candidate_tables({'rate'}, self.user)], ['Literacy rate by state'],
+        )
+        engine.max_candidates = 1
+        self.assertEqual(
+            [table.title for table in engine.candidate_tables({'literacy', 'rate', 'state'}, self.user)],
+            ['Literacy rate by state'],
+        )
+
+    def test_answers_from_the_matching_table(self):
+        result = TableQueryEngine().answer('Which state has the highest literacy rate in 2021?', self.user)
+        self.assertEqual(result.operation, 'max')
+        self.assertEqual(result.value, 96.2)
+        self.assertIn('Kerala', result.answer)
+
+        result = TableQueryEngine().answer('How much was the literacy rate of Punjab in 2011?', self.user)
+        self.assertEqual(result.operation, 'lookup')
+        self.assertEqual(result.value, 75.8)
+
+    def test_unrelated_measures_are_not_answered_from_a_table(self):
+        questions = [
+            # Only "state" and the year column overlap with the GSDP table
+            'Which state had the highest unemployment rate in 2022?',
+            'What is the average unemployment in 2021 across states?',
+            # Nothing names the measure at all
+            'Which state had the highest value in 2022?',
+            # "rate" is covered, "female" is not
+            'Which state has the highest female literacy rate in 2021?',
+        ]
+        for question in questions:
+            with self.subTest(question=question):
+                self.assertTrue(is_table_question(question))
+                self.assertIsNone(TableQueryEngine().answer(question, self.user))
+
+    def test_measure_named_by_the_title_is_answered(self):
+        result = TableQueryEngine().answer('Which state had the highest per capita GSDP in 2022?', self.user)
+        self.assertEqual(result.operation, 'max')
+        self.assertEqual(result.value, 250000.0)
+
+
+class RankedPgVectorStore(PgVectorStore):
+    """
+    PgVectorStore over a fixed ranking of chunk ids, recording the queries it runs.
+    """
+
+    def __init__(self, ranking):
+        self.ranking = ranking
+        self.queries = []
+
+    def _query(self, chunks, vector, k, exact=False):
+        self.queries.append(('ann', k))
+        return [(chunk_id, 1.0 - position / 1000) for position, chunk_id in enumerate(self.ranking[:k])]
+
+    def _exact(self, chunks, vector, k, allowed):
+        self.queries.append(('exact', k))
+        members = allowed.contains(self.ranking)
+        return [(chunk_id, 1.0) for chunk_id, member in zip(self.ranking, members) if member][:k]
+
+
+@override_settings(RAG_FILTER_EXACT_MAX_CHUNKS=10, RAG_FILTER_MAX_BOOST=4)
+class PgVectorFilteredSearchTests(SimpleTestCase):
+    ranking = list(range(1000))
+
+    def test_selective_filter_is_searched_exactly(self):
+        store = RankedPgVectorStore(self.ranking)
+        # 50 of 1000 chunks: a 20x boost, past the cap
+        allowed = ChunkFilter.from_ids(list(range(950, 1000)))
+        self.assertEqual([chunk_id for chunk_id, _ in store.search(None, 5, allowed)], [950, 951, 952, 953, 954])
+        self.assertEqual(store.queries, [('exact', 5)])
+
+    def test_spread_filter_is_over_fetched_once(self):
+        store = RankedPgVectorStore(self.ranking)
+        allowed = ChunkFilter.from_ids(list(range(0, 1000, 2)))
+        self.assertEqual([chunk_id for chunk_id, _ in store.search(None, 5, allowed)], [0, 2, 4, 6, 8])
+        self.assertEqual(store.queries, [('ann', 10)])
+
+    def test_short_over_fetch_is_retried_then_exact(self):
+        store = RankedPgVectorStore(self.ranking)
+        # Half the corpus, but all of it ranked below the first retry
+        allowed = ChunkFilter.from_ids(list(range(500, 1000)))
+        self.assertEqual([chunk_id for chunk_id, _ in store.search(None, 5, allowed)], [500, 501, 502, 503, 504])
+        self.assertEqual(store.queries, [('ann', 10), ('ann', 40), ('exact', 5)])
+
+
+class FaissCompactionTests(SimpleTestCase):
+    dimension = 16
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        self.store = self.open_store()
+        self.vectors = np.random.default_rng(0).standard_normal((30, self.dimension)).astype(np.float32)
+
+    def open_store(self):
+        return FaissVectorStore(self.path, index_type='hnsw', dimension=self.dimension, quantization='none')
+
+    def build_while(self, work):
+        """
+        Wrap the store's ``_build`` to run ``work`` as another worker would, while the index is being built.
+        """
+        build = self.store._build
+
+        def build_with_work(ids, vectors):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive(), 'blocked on the directory lock')
+            return build(ids, vectors)
+        return build_with_work
+
+    def ids(self):
+        store = self.open_store()
+        return sorted(int(chunk_id) for chunk_id, _ in store.search(np.ones(self.dimension), 100))
+
+    def test_writes_during_a_graph_rebuild_are_not_blocked_or_lost(self):
+        self.store.add(list(range(20)), self.vectors[:20])
+        self.store.compact()
+        self.store.delete([0])
+
+        def concurrent_writes():
+            writer = self.open_store()
+            writer.add([20, 21], self.vectors[20:22])
+            writer.delete([1, 20])
+
+        with mock.patch.object(self.store, '_build', side_effect=self.build_while(concurrent_writes)):
+            manifest = self.store.compact()
+
+        self.assertEqual(manifest['main']['count'], 19)
+        self.assertEqual(len(manifest['segments']), 1)
+        self.assertEqual(len(manifest['tombstones']), 1)
+        self.assertEqual(self.ids(), list(range(2, 20)) + [21])
+
+        manifest = self.store.compact()
+        self.assertEqual((manifest['main']['count'], manifest['segments'], manifest['tombstones']), (19, [], []))
+        self.assertEqual(self.ids(), list(range(2, 20)) + [21])
+
+    def test_concurrent_compaction_of_the_same_snapshot_is_skipped(self):
+        self.store.add(list(range(20)), self.vectors[:20])
+        self.store.delete([3])
+        compact = self.build_while(lambda: self.open_store().compact())
+        with mock.patch.object(self.store, '_build', side_effect=compact):
+            manifest = self.store.compact()
+        self.assertEqual(manifest['main']['count'], 19)
+        self.assertEqual(self.ids(), [chunk_id for chunk_id in range(20) if chunk_id != 3])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import RagStatsView
+
+urlpatterns = [
+    path('stats/', RagStatsView.as_view(), name='rag-stats'),
+]
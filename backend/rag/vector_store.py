@@ -0,0 +1,136 @@
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+
+class BaseVectorStore:
+    """
+    Interface for the similarity index over DocumentChunk embeddings.
+
+    ``DocumentChunk.embedding`` is always the full-precision source of truth
+    and is written together with the chunk row; a vector store makes those
+    stored vectors searchable. Ids are DocumentChunk primary keys and vectors
+    are L2-normalized, so scores are cosine similarities (higher is better).
+    """
+
+    def add(self, ids, vectors):
+        """
+        Index (or re-index) the vectors stored for the given chunk ids.
+        """
+        raise NotImplementedError
+
+    def delete(self, ids):
+        """
+        Remove the given chunk ids from the index.
+        """
+        raise NotImplementedError
+
+    def search(self, vector, k, allowed=None):
+        """
+        Return up to ``k`` ``(chunk_id, score)`` tuples, best first, limited
+        to the chunks of ``allowed`` (a ``rag.chunk_filter.ChunkFilter``)
+        when given.
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        return {'backend': settings.VECTOR_DB_TYPE}
+
+
+class PgVectorStore(BaseVectorStore):
+    """
+    Similarity search on the pgvector ``DocumentChunk.embedding`` column.
+
+    Postgres maintains the HNSW index declared on ``DocumentChunk`` (cosine
+    distance), so adding and deleting need no work beyond writing or
+    deleting the chunk rows.
+
+    The index cannot take the filter bitmap, so a filter admitting at most
+    RAG_FILTER_EXACT_MAX_CHUNKS chunks, or excluding more than
+    RAG_FILTER_MAX_BOOST times the chunks it admits, is passed to Postgres
+    as an id array and searched exactly, bypassing the index. For other
+    filters the index is asked for more results, in proportion to the share
+    of chunks the filter excludes, and they are filtered afterwards; when
+    fewer than ``k`` remain, the search is repeated with RETRY_FACTOR times
+    the fetch and then exactly.
+    """
+    RETRY_FACTOR = 4
+
+    def add(self, ids, vectors):
+        pass
+
+    def delete(self, ids):
+        pass
+
+    def search(self, vector, k, allowed=None):
+        from documents.models import DocumentChunk
+
+        chunks = DocumentChunk.objects.exclude(embedding=None)
+        if allowed is None:
+            return self._query(chunks, vector, k)
+        if not allowed.count:
+            return []
+        # Chunk ids are dense enough for the bitmap length to stand in for the corpus size
+        boost = max(allowed.bitmap.size * 8 / allowed.count, 1.0)
+        if allowed.count <= settings.RAG_FILTER_EXACT_MAX_CHUNKS or boost > settings.RAG_FILTER_MAX_BOOST:
+            return self._exact(chunks, vector, k, allowed)
+
+        fetch = int(k * boost)
+        for _ in range(2):
+            rows = self._query(chunks, vector, fetch)
+            members = allowed.contains([chunk_id for chunk_id, _ in rows])
+            results = [row for row, member in zip(rows, members) if member][:k]
+            if len(results) == k or len(rows) < fetch:
+                return results
+            fetch *= self.RETRY_FACTOR
+        return self._exact(chunks, vector, k, allowed)
+
+    def _query(self, chunks, vector, k, exact=False):
+        from pgvector.django import CosineDistance
+
+        rows = (
+            chunks
+            .annotate(distance=CosineDistance('embedding', np.asarray(vector, dtype=np.float32)))
+            .order_by('distance')
+            .values_list('id', 'distance')[:k]
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            if exact:
+                cursor.execute('SET LOCAL enable_indexscan = off')
+            else:
+                # An HNSW scan returns at most ef_search rows (pgvector caps it at 1000)
+                cursor.execute('SELECT set_config(%s, %s, true)', ['hnsw.ef_search', str(min(max(k, 40), 1000))])
+            return [(chunk_id, 1.0 - distance) for chunk_id, distance in rows]
+
+    def _exact(self, chunks, vector, k, allowed):
+        # One array parameter, however many ids the filter admits
+        ids = RawSQL('SELECT unnest(%s::bigint[])', [allowed.ids().tolist()])
+        return self._query(chunks.filter(id__in=ids), vector, k, exact=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """
+    Return the per-process vector store selected by VECTOR_DB_TYPE.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.VECTOR_DB_TYPE == 'pgvector':
+                    _store = PgVectorStore()
+                elif settings.VECTOR_DB_TYPE == 'faiss':
+                    from .faiss_store import FaissVectorStore
+                    _store = FaissVectorStore()
+                else:
+                    raise ValueError(f'Unsupported VECTOR_DB_TYPE: {settings.VECTOR_DB_TYPE}')
+    return _store
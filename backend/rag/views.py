@@ -0,0 +1,23 @@
+from rest_framework import permissions, views
+from rest_framework.response import Response
+
+from users.permissions import IsAdmin
+from .answer_cache import get_answer_cache
+from .embeddings import get_embedding_service
+from .keyword_index import get_keyword_index
+from .vector_store import get_vector_store
+
+
+class RagStatsView(views.APIView):
+    """
+    Runtime statistics for the RAG services running in this process (admin only)
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response({
+            'embeddings': get_embedding_service().stats(),
+            'vector_store': get_vector_store().stats(),
+            'keyword_index': get_keyword_index().stats(),
+            'answer_cache': get_answer_cache().stats() if get_answer_cache() is not None else None,
+        })
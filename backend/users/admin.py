@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from .authentication import invalidate_cached_users
 from .models import User, UserPreference
 
 class UserPreferenceInline(admin.StackedInline):
@@ -26,5 +27,14 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('email', 'username', 'first_name', 'last_name')
     ordering = ('email',)
     inlines = (UserPreferenceInline,)
+    actions = ('deactivate_users',)
+
+    @admin.action(description='Deactivate selected users')
+    def deactivate_users(self, request, queryset):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        # A queryset update sends no post_save, so the auth cache is cleared here
+        updated = User.objects.filter(pk__in=user_ids).update(is_active=False)
+        invalidate_cached_users(*user_ids)
+        self.message_user(request, f'Deactivated {updated} users.')
 
 admin.site.register(User, CustomUserAdmin)
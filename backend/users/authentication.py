@@ -0,0 +1,150 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from utils.timing import record_cache
+
+logger = logging.getLogger(__name__)
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+class CachedUserStore:
+    """
+    Two-tier cache of ``User`` rows, with preferences, for request
+    authentication.
+
+    Lookups try a process-local LRU (entries live USER_CACHE_LOCAL_TTL
+    seconds), then Redis (USER_CACHE_TIMEOUT seconds), then load the user
+    with ``select_related('preferences')`` and fill both tiers.
+    ``invalidate`` clears Redis and this process's entry; other processes
+    may keep serving their local copy until it expires, so the local TTL
+    bounds how long a password change or deactivation takes to apply
+    everywhere. Callers get a copy of the cached instance and may modify it.
+    """
+
+    def __init__(self, local_ttl=None, timeout=None, max_entries=None, cache_alias='default'):
+        self.local_ttl = settings.USER_CACHE_LOCAL_TTL if local_ttl is None else local_ttl
+        self.timeout = settings.USER_CACHE_TIMEOUT if timeout is None else timeout
+        self.max_entries = max_entries or settings.USER_CACHE_MAX_ENTRIES
+        self.cache_alias = cache_alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id):
+        return f'users:auth:{user_id}'
+
+    def get(self, user_id):
+        """
+        Return the user with primary key ``user_id``, or None if there is none.
+        """
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(user_id)
+                record_cache('user', 1)
+                return copy.copy(entry[1])
+
+        user = None
+        try:
+            user = caches[self.cache_alias].get(self._key(user_id))
+        except Exception as e:
+            logger.warning(f'User cache unavailable, loading user from the database: {e}')
+        record_cache('user', user is not None)
+        if user is None:
+            user = get_user_model().objects.select_related('preferences').filter(pk=user_id).first()
+            if user is None:
+                return None
+            try:
+                caches[self.cache_alias].set(self._key(user_id), user, timeout=self.timeout)
+            except Exception as e:
+                logger.warning(f'Could not cache user {user_id}: {e}')
+
+        with self._lock:
+            self._local[user_id] = (now + self.local_ttl, user)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+        return copy.copy(user)
+
+    def invalidate(self, user_ids):
+        user_ids = [str(user_id) for user_id in user_ids]
+        with self._lock:
+            for user_id in user_ids:
+                self._local.pop(user_id, None)
+        try:
+            caches[self.cache_alias].delete_many([self._key(user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.warning(f'Could not invalidate cached users {user_ids}: {e}')
+
+
+def get_user_cache():
+    """
+    Return the per-process CachedUserStore.
+    """
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = CachedUserStore()
+    return _user_cache
+
+
+def invalidate_cached_users(*user_ids):
+    """
+    Drop users from the authentication cache, now and again once the
+    current transaction commits, so a request that read the old row in
+    between cannot leave it cached.
+    """
+    if not user_ids:
+        return
+    cache = get_user_cache()
+    cache.invalidate(user_ids)
+    transaction.on_commit(lambda: cache.invalidate(user_ids))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` resolving the token's user through
+    ``CachedUserStore`` instead of a query per request, with the same
+    active-user and revoked-token checks.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        if api_settings.USER_ID_FIELD != get_user_model()._meta.pk.name:
+            # The cache is keyed by primary key
+            return super().get_user(validated_token)
+
+        user = get_user_cache().get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Recent additions kept in Redis so processes can catch up without reloading the bitmap
+LOG_SIZE = 10000
+
+_blacklist_filter = None
+_blacklist_filter_lock = threading.Lock()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Sized for ``capacity`` keys at ``error_rate`` false positives; never
+    gives false negatives. Bits are numbered like Redis SETBIT (bit 0 is
+    the high bit of the first byte), so ``bits`` can be stored as a Redis
+    string and updated there bit by bit.
+    """
+
+    def __init__(self, capacity, error_rate):
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(64, (size + 7) // 8 * 8)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8)
+
+    def positions(self, key):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (0x80 >> (position & 7)) for position in self.positions(key))
+
+    def load(self, data):
+        bits = np.frombuffer(data, dtype=np.uint8)[:self.bits.size]
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8)
+        self.bits[:bits.size] = bits
+
+    @property
+    def fill_ratio(self):
+        return int(np.unpackbits(self.bits).sum()) / self.size
+
+
+class SharedBlacklistFilter:
+    """
+    Bloom filter of blacklisted refresh-token JTIs, shared through Redis
+    and mirrored in every process.
+
+    A token the filter has never seen is certainly not blacklisted, which
+    is the common case on refresh, so the database is only asked about
+    the rare positives. Blacklisting sets the bits in Redis and appends the
+    JTI to a short log in one MULTI/EXEC. Every
+    TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS a process checks the log sequence
+    and applies the JTIs it has missed, reloading the whole bitmap only when
+    it fell more than LOG_SIZE behind or the filter was rebuilt. A token
+    blacklisted by another process can therefore pass the local check for
+    up to that interval.
+
+    Until the filter has been built from the database (``rebuild``, queued
+    automatically) every check falls through to the database.
+    """
+
+    def __init__(self, client, capacity=None, error_rate=None, sync_interval=None, key_prefix='users:blacklist:bloom'):
+        self.client = client
+        self.capacity = capacity or settings.TOKEN_BLACKLIST_BLOOM_CAPACITY
+        self.error_rate = error_rate or settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE
+        self.sync_interval = settings.TOKEN_BLACKLIST_BLOOM_SYNC_SECONDS if sync_interval is None else sync_interval
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        # Keys include the geometry, so a resized filter starts from scratch
+        prefix = f'{key_prefix}:{self.filter.size}:{self.filter.hashes}'
+        self.bits_key = prefix
+        self.log_key = f'{prefix}:log'
+        self.seq_key = f'{prefix}:seq'
+        self.generation_key = f'{prefix}:generation'
+        self._generation = None
+        self._seq = 0
+        self._synced = 0.0
+        self._lock = threading.Lock()
+
+    def might_contain(self, jti):
+        now = time.monotonic()
+        if now - self._synced >= self.sync_interval:
+            with self._lock:
+                if now - self._synced >= self.sync_interval:
+                    self._sync()
+                    self._synced = now
+        if self._generation is None:
+            return True
+        return jti in self.filter
+
+    def add(self, jti):
+        pipe = self.client.pipeline()
+        for position in self.filter.positions(jti):
+            pipe.setbit(self.bits_key, position, 1)
+        pipe.rpush(self.log_key, jti)
+        pipe.ltrim(self.log_key, -LOG_SIZE, -1)
+        pipe.incr(self.seq_key)
+        pipe.execute()
+        with self._lock:
+            self.filter.add(jti)
+
+    def _sync(self):
+        generation, seq = self.client.mget([self.generation_key, self.seq_key])
+        seq = int(seq or 0)
+        if generation is None:
+            self._generation = None
+            _queue_rebuild()
+            return
+        if generation != self._generation or seq - self._seq > LOG_SIZE:
+            self._reload()
+        elif seq > self._seq:
+            pipe = self.client.pipeline()
+            pipe.get(self.seq_key)
+            pipe.lrange(self.log_key, -min(seq - self._seq + 100, LOG_SIZE), -1)
+            latest, entries = pipe.execute()
+            latest = int(latest or 0)
+            if latest - self._seq > len(entries):
+                self._reload()
+                return
+            # The log ends at sequence ``latest``
+            for offset, jti in enumerate(entries):
+                if latest - len(entries) + 1 + offset > self._seq:
+                    self.filter.add(jti.decode())
+            self._seq = latest
+
+    def _reload(self):
+        pipe = self.client.pipeline()
+        pipe.get(self.generation_key)
+        pipe.get(self.seq_key)
+        pipe.get(self.bits_key)
+        generation, seq, data = pipe.execute()
+        self.filter.load(data or b'')
+        self._generation = generation
+        self._seq = int(seq or 0)
+
+    def rebuild(self):
+        """
+        Rebuild the shared filter from the unexpired blacklisted tokens in
+        the database, dropping the bits of expired ones.
+
+        Tokens blacklisted while the database is scanned are replayed from
+        the log into the new bitmap before it is published, and the bitmap
+        and generation are published together, so no process ever loads a
+        filter missing them.
+        """
+        started_seq = int(self.client.get(self.seq_key) or 0)
+        fresh = BloomFilter(self.capacity, self.error_rate)
+        count = 0
+        jtis = (
+            BlacklistedToken.objects
+            .filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True)
+        )
+        for jti in jtis.iterator(chunk_size=10000):
+            fresh.add(jti)
+            count += 1
+
+        def publish(pipe):
+            seq = int(pipe.get(self.seq_key) or 0)
+            entries = pipe.lrange(self.log_key, 0, -1)
+            # The log ends at sequence ``seq``
+            for offset, jti in enumerate(entries):
+                if seq - len(entries) + 1 + offset > started_seq:
+                    fresh.add(jti.decode())
+            pipe.multi()
+            pipe.set(self.bits_key, fresh.bits.tobytes())
+            pipe.incr(self.generation_key)
+            return seq, len(entries)
+
+        # Retried if a token is blacklisted between reading the log and publishing
+        seq, logged = self.client.transaction(publish, self.seq_key, value_from_callable=True)
+        if seq - started_seq > logged:
+            logger.warning('Token blacklist log overflowed during the filter rebuild; rebuild again')
+        if count > self.capacity:
+            logger.warning(
+                f'{count} blacklisted tokens exceed TOKEN_BLACKLIST_BLOOM_CAPACITY={self.capacity}; '
+                f'false positives will rise above {self.error_rate}'
+            )
+        logger.info(f'Rebuilt token blacklist filter: {count} tokens, {fresh.fill_ratio:.1%} of bits set')
+        return count
+
+
+def get_blacklist_filter():
+    """
+    Return the per-process SharedBlacklistFilter, or None when it is
+    disabled or the default cache is not Redis.
+    """
+    global _blacklist_filter
+    if not settings.TOKEN_BLACKLIST_BLOOM_ENABLED:
+        return None
+    if _blacklist_filter is None:
+        with _blacklist_filter_lock:
+            if _blacklist_filter is None:
+                try:
+                    from django_redis import get_redis_connection
+
+                    _blacklist_filter = SharedBlacklistFilter(get_redis_connection('default'))
+                except (ImportError, NotImplementedError) as e:
+                    logger.warning(f'Redis is not available for the token blacklist filter ({e})')
+                    _blacklist_filter = False
+    return _blacklist_filter or None
+
+
+def _queue_rebuild():
+    from django.core.cache import cache
+    from .tasks import rebuild_token_blacklist_filter
+
+    # Only queue one rebuild at a time
+    if cache.add('users:blacklist:rebuild', True, timeout=600):
+        rebuild_token_blacklist_filter.delay()
+
+
+class BloomRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check consults the shared Bloom filter
+    before the database.
+    """
+
+    def check_blacklist(self):
+        blacklist_filter = get_blacklist_filter()
+        if blacklist_filter is not None:
+            try:
+                if not blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+                    return
+            except Exception as e:
+                logger.warning(f'Token blacklist filter unavailable, checking the database: {e}')
+        super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        blacklist_filter = get_blacklist_filter()
+        if blacklist_filter is not None:
+            try:
+                blacklist_filter.add(self.payload[api_settings.JTI_CLAIM])
+            except Exception:
+                # The database row stands; rebuild so other processes see it
+                logger.exception('Could not add a blacklisted token to the filter')
+                _queue_rebuild()
+        return blacklisted
+
+
+def delete_expired_tokens(batch_size=None, now=None):
+    """
+    Delete expired outstanding tokens, and with them their blacklist rows,
+    in short batches.
+
+    Tokens are walked in id windows, which use the primary key index, and
+    the walk stops at the first window holding rows but no expired ones:
+    with a fixed lifetime, tokens expire roughly in the order they were
+    issued. Stragglers are picked up by a later run. Returns the number of
+    outstanding tokens deleted.
+    """
+    batch_size = batch_size or settings.TOKEN_CLEANUP_BATCH_SIZE
+    now = now or timezone.now()
+    bounds = OutstandingToken.objects.order_by('id').values_list('id', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return 0
+
+    deleted = 0
+    start = first
+    while start <= last:
+        window = OutstandingToken.objects.filter(id__gte=start, id__lt=start + batch_size)
+        expired = list(window.filter(expires_at__lte=now).values_list('id', flat=True))
+        if expired:
+            # BlacklistedToken rows go first so the outstanding delete needs no cascade collection
+            BlacklistedToken.objects.filter(token_id__in=expired).delete()
+            deleted += OutstandingToken.objects.filter(id__in=expired).delete()[0]
+        elif window.exists():
+            break
+        start += batch_size
+    logger.info(f'Deleted {deleted} expired outstanding tokens')
+    return deleted
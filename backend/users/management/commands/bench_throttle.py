@@ -0,0 +1,121 @@
+import json
+import pickle
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework import throttling as drf_throttling
+
+from rag.benchmark import summarize
+from users import throttling
+from users.throttling import get_sliding_window_script
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the Redis sliding-window UserRateThrottle with DRF\'s cache-history UserRateThrottle: '
+        'latency per check for a user with a long request history, stored state size, and how many '
+        'requests concurrent workers let through past the limit'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', default='5000/day', help='Rate for the latency comparison')
+        parser.add_argument('--history', type=int, default=4000, help='Requests already made in the window')
+        parser.add_argument('--requests', type=int, default=500, help='Timed checks per throttle')
+        parser.add_argument('--burst-rate', default='100/min', help='Rate for the concurrency comparison')
+        parser.add_argument('--burst-requests', type=int, default=400)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        candidates = {'drf': drf_throttling.UserRateThrottle}
+        if get_sliding_window_script() is not None:
+            candidates['sliding_window'] = throttling.UserRateThrottle
+        else:
+            self.stderr.write('The default cache is not Redis; only the DRF throttle is measured')
+
+        results = {}
+        for name, throttle_class in candidates.items():
+            results[name] = {
+                'latency': self.measure_latency(throttle_class, options),
+                'burst': self.measure_burst(throttle_class, options),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f'{options["rate"]} with {options["history"]} earlier requests; '
+            f'burst of {options["burst_requests"]} at {options["burst_rate"]} from {options["threads"]} threads'
+        )
+        self.stdout.write(
+            f'{"throttle":<16}{"mean ms":>9}{"p95 ms":>9}{"state bytes":>13}{"allowed":>9}{"limit":>7}'
+        )
+        for name, result in results.items():
+            latency, burst = result['latency'], result['burst']
+            self.stdout.write(
+                f'{name:<16}{latency["mean_ms"]:>9.3f}{latency["p95_ms"]:>9.3f}'
+                f'{latency["state_bytes"] if latency["state_bytes"] is not None else "-":>13}'
+                f'{burst["allowed"]:>9}{burst["limit"]:>7}'
+            )
+
+    @staticmethod
+    def make_throttle(throttle_class, rate):
+        return type('BenchThrottle', (throttle_class,), {'rate': rate})()
+
+    @staticmethod
+    def make_request():
+        return SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=f'bench-{uuid.uuid4().hex}'), META={})
+
+    def measure_latency(self, throttle_class, options):
+        throttle = self.make_throttle(throttle_class, options['rate'])
+        request = self.make_request()
+        key = throttle.get_cache_key(request, None)
+        if throttle_class is drf_throttling.UserRateThrottle:
+            now = time.time()
+            cache.set(key, [now - 0.01 * n for n in range(options['history'])], throttle.duration)
+        else:
+            for _ in range(options['history']):
+                throttle.allow_request(request, None)
+
+        timings = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            throttle.allow_request(request, None)
+            timings.append(time.perf_counter() - started)
+        result = summarize(timings)
+        result['state_bytes'] = self.state_bytes(throttle_class, key)
+        self.forget(throttle_class, key)
+        return result
+
+    def measure_burst(self, throttle_class, options):
+        probe = self.make_throttle(throttle_class, options['burst_rate'])
+        request = self.make_request()
+
+        def check(_):
+            # One throttle per call, as DRF creates them per request
+            return self.make_throttle(throttle_class, options['burst_rate']).allow_request(request, None)
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            allowed = sum(pool.map(check, range(options['burst_requests'])))
+        self.forget(throttle_class, probe.get_cache_key(request, None))
+        return {'allowed': allowed, 'limit': probe.num_requests}
+
+    @staticmethod
+    def state_bytes(throttle_class, key):
+        if throttle_class is drf_throttling.UserRateThrottle:
+            return len(pickle.dumps(cache.get(key, [])))
+        try:
+            return get_sliding_window_script().registered_client.memory_usage(key)
+        except Exception:
+            return None
+
+    @staticmethod
+    def forget(throttle_class, key):
+        if throttle_class is drf_throttling.UserRateThrottle:
+            cache.delete(key)
+        else:
+            get_sliding_window_script().registered_client.delete(key)
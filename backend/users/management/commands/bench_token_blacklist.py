@@ -0,0 +1,167 @@
+import json
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from rag.benchmark import summarize
+from users.blacklist import BloomFilter, SharedBlacklistFilter, delete_expired_tokens, get_blacklist_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed the token blacklist tables with synthetic rows (10M by default) and measure blacklist '
+        'checks through the database against the Bloom filter, and the batched cleanup of expired '
+        'tokens. The cleanup also deletes any real tokens that have expired.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Outstanding tokens to seed')
+        parser.add_argument('--blacklisted', type=float, default=0.1, help='Fraction of tokens blacklisted')
+        parser.add_argument('--expired', type=float, default=0.5, help='Fraction of tokens already expired')
+        parser.add_argument('--checks', type=int, default=2000, help='Blacklist checks per method')
+        parser.add_argument('--error-rate', type=float, default=0.001)
+        parser.add_argument('--seed-batch', type=int, default=20000)
+        parser.add_argument('--skip-cleanup', action='store_true', help='Do not time the expired token cleanup')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        results = {'rows': options['rows']}
+        started = time.perf_counter()
+        first_id, last_id, blacklisted = self.seed(prefix, options)
+        results['seed_seconds'] = round(time.perf_counter() - started, 1)
+        try:
+            results['checks'] = self.measure_checks(prefix, blacklisted, options)
+            if not options['skip_cleanup']:
+                started = time.perf_counter()
+                deleted = delete_expired_tokens()
+                seconds = time.perf_counter() - started
+                results['cleanup'] = {
+                    'deleted': deleted,
+                    'seconds': round(seconds, 2),
+                    'rows_per_second': round(deleted / seconds) if seconds else None,
+                }
+        finally:
+            if not options['keep']:
+                self.remove(prefix, first_id, last_id, options['seed_batch'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{results["rows"]} outstanding tokens seeded in {results["seed_seconds"]}s')
+        checks = results['checks']
+        self.stdout.write(
+            f'Bloom filter: {checks["filter_mb"]} MB, {checks["filter_hashes"]} hashes, built in '
+            f'{checks["filter_build_seconds"]}s, false positives {checks["false_positive_rate"]:.4%}'
+        )
+        self.stdout.write(f'{"check":<28}{"mean ms":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+        for name in ('database', 'filter_then_database', 'shared_filter_then_database'):
+            if name in checks:
+                latency = checks[name]
+                self.stdout.write(
+                    f'{name:<28}{latency["mean_ms"]:>9.3f}{latency["p50_ms"]:>9.3f}'
+                    f'{latency["p95_ms"]:>9.3f}{latency["p99_ms"]:>9.3f}'
+                )
+        if 'cleanup' in results:
+            cleanup = results['cleanup']
+            self.stdout.write(
+                f'Cleanup: {cleanup["deleted"]} expired tokens deleted in {cleanup["seconds"]}s '
+                f'({cleanup["rows_per_second"]} rows/s)'
+            )
+
+    def seed(self, prefix, options):
+        """
+        Insert tokens in id order with the expired ones first, as they would be issued.
+        """
+        now = timezone.now()
+        rows, batch = options['rows'], options['seed_batch']
+        expired_rows = int(rows * options['expired'])
+        every = max(1, round(1 / options['blacklisted'])) if options['blacklisted'] else 0
+        first_id = last_id = None
+        blacklisted = []
+        for start in range(0, rows, batch):
+            tokens = [
+                OutstandingToken(
+                    jti=f'{prefix}-{n}',
+                    token='',
+                    created_at=now,
+                    expires_at=now + (timedelta(days=-1) if n < expired_rows else timedelta(days=7)),
+                )
+                for n in range(start, min(start + batch, rows))
+            ]
+            with transaction.atomic():
+                created = OutstandingToken.objects.bulk_create(tokens)
+                revoked = [token for n, token in enumerate(created, start) if every and n % every == 0]
+                BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in revoked])
+            first_id = created[0].id if first_id is None else first_id
+            last_id = created[-1].id
+            blacklisted.extend(token.jti for token in revoked if token.expires_at > now)
+            if start and start % (batch * 50) == 0:
+                self.stderr.write(f'Seeded {start} tokens')
+        return first_id, last_id, blacklisted
+
+    def measure_checks(self, prefix, blacklisted, options):
+        rng = random.Random(0)
+        count = options['checks']
+        # Refreshes almost always carry tokens that are not blacklisted
+        clean = [f'{prefix}-fresh-{n}' for n in range(count)]
+        revoked = rng.sample(blacklisted, min(len(blacklisted), max(1, count // 100))) if blacklisted else []
+        jtis = clean + revoked
+        rng.shuffle(jtis)
+
+        def database(jti):
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        started = time.perf_counter()
+        bloom = BloomFilter(max(len(blacklisted), 1), options['error_rate'])
+        for jti in blacklisted:
+            bloom.add(jti)
+        build_seconds = time.perf_counter() - started
+
+        results = {
+            'filter_mb': round(bloom.bits.nbytes / 1048576, 2),
+            'filter_hashes': bloom.hashes,
+            'filter_build_seconds': round(build_seconds, 2),
+            'false_positive_rate': sum(jti in bloom for jti in clean) / len(clean),
+            'database': self.time_checks(jtis, database),
+            'filter_then_database': self.time_checks(jtis, lambda jti: jti in bloom and database(jti)),
+        }
+
+        shared_default = get_blacklist_filter()
+        if shared_default is not None:
+            shared = SharedBlacklistFilter(
+                shared_default.client, capacity=max(len(blacklisted), 1), error_rate=options['error_rate'],
+                key_prefix=f'users:blacklist:{prefix}',
+            )
+            try:
+                shared.rebuild()
+                results['shared_filter_then_database'] = self.time_checks(
+                    jtis, lambda jti: shared.might_contain(jti) and database(jti),
+                )
+            finally:
+                shared.client.delete(shared.bits_key, shared.log_key, shared.seq_key, shared.generation_key)
+        return results
+
+    @staticmethod
+    def time_checks(jtis, check):
+        timings = []
+        for jti in jtis:
+            started = time.perf_counter()
+            check(jti)
+            timings.append(time.perf_counter() - started)
+        return summarize(timings)
+
+    def remove(self, prefix, first_id, last_id, batch):
+        if first_id is None:
+            return
+        for start in range(first_id, last_id + 1, batch):
+            window = OutstandingToken.objects.filter(id__gte=start, id__lt=start + batch, jti__startswith=prefix)
+            BlacklistedToken.objects.filter(token__in=window).delete()
+            window.delete()
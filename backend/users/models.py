@@ -15,6 +15,12 @@ class User(AbstractUser):
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(fields=['created_at', 'id']),
+        ]
     
     def __str__(self):
         return self.email
@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from .authentication import invalidate_cached_users
 from .models import UserPreference
 
 User = get_user_model()
@@ -12,3 +13,19 @@ def create_user_preferences(sender, instance, created, **kwargs):
     """
     if created:
         UserPreference.objects.get_or_create(user=instance)
+    else:
+        invalidate_cached_users(instance.pk)
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    """
+    Stop authenticating a deleted user from the cache
+    """
+    invalidate_cached_users(instance.pk)
+
+@receiver([post_save, post_delete], sender=UserPreference)
+def refresh_cached_preferences(sender, instance, **kwargs):
+    """
+    Cached users carry their preferences, so drop the owner when they change
+    """
+    invalidate_cached_users(instance.user_id)
@@ -0,0 +1,30 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from .blacklist import delete_expired_tokens, get_blacklist_filter
+
+
+@shared_task
+def rebuild_token_blacklist_filter():
+    """
+    Rebuild the shared Bloom filter of blacklisted refresh tokens.
+    """
+    blacklist_filter = get_blacklist_filter()
+    if blacklist_filter is None:
+        return None
+    try:
+        return blacklist_filter.rebuild()
+    finally:
+        cache.delete('users:blacklist:rebuild')
+
+
+@shared_task
+def flush_expired_tokens():
+    """
+    Delete expired outstanding and blacklisted refresh tokens in batches,
+    then rebuild the blacklist filter without them.
+    """
+    deleted = delete_expired_tokens()
+    if deleted and get_blacklist_filter() is not None:
+        rebuild_token_blacklist_filter.delay()
+    return deleted
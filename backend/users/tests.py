@@ -1,3 +1,237 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .blacklist import SharedBlacklistFilter, delete_expired_tokens
+from .throttling import SLIDING_WINDOW_SCRIPT, ScopedRateThrottle, UserRateThrottle
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# A moment 10 seconds into a one-minute window
+WINDOW_START = 1_000_000 * 60
+NOW = WINDOW_START + 10
+
+
+class ThreePerMinute(UserRateThrottle):
+    rate = '3/min'
+
+
+def request_for(user_id='42'):
+    return SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=user_id), META={})
+
+
+@skipUnless(fakeredis, 'fakeredis[lua] is not installed')
+class SlidingWindowThrottleTests(SimpleTestCase):
+    """
+    Runs the sliding-window script on fakeredis, with its clock under test control.
+    """
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server)
+        self.now = NOW
+        clock = mock.patch('fakeredis.commands_mixins.server_mixin.time', SimpleNamespace(time=lambda: self.now))
+        script = mock.patch('users.throttling.get_sliding_window_script', return_value=self.register())
+        for patcher in (clock, script):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def register(self):
+        return self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def check(self, throttle_class=ThreePerMinute, at=None, view=None):
+        if at is not None:
+            self.now = at
+        throttle = throttle_class()
+        return throttle.allow_request(request_for(), view), throttle.wait()
+
+    def test_requests_within_the_limit_are_allowed(self):
+        self.assertEqual([self.check() for _ in range(3)], [(True, 0)] * 3)
+        self.assertFalse(self.check()[0])
+
+    def test_over_the_limit_waits_for_the_current_window_to_decay(self):
+        for _ in range(3):
+            self.check()
+        allowed, wait = self.check()
+        # 50s left in this window, then 20s until 3 * 40/60 + 1 <= 3
+        self.assertEqual((allowed, wait), (False, 70))
+        self.assertFalse(self.check(at=NOW + wait - 1)[0])
+        self.assertEqual(self.check(at=NOW + wait), (True, 0))
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for _ in range(3):
+            self.check(at=WINDOW_START + 50)
+        # At the next window's start the previous one still counts in full
+        allowed, wait = self.check(at=WINDOW_START + 60)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 20, places=2)
+        self.assertFalse(self.check(at=WINDOW_START + 60 + wait - 0.1)[0])
+        self.assertEqual(self.check(at=WINDOW_START + 60 + wait), (True, 0))
+        # 3 * 35/60 + 1 + 1 > 3
+        self.assertFalse(self.check(at=WINDOW_START + 85)[0])
+
+    def test_windows_older_than_the_previous_one_are_forgotten(self):
+        for _ in range(3):
+            self.check()
+        self.assertEqual(self.check(at=NOW + 120), (True, 0))
+        self.assertEqual(self.check(), (True, 0))
+
+    def test_zero_rate_waits_a_full_window(self):
+        class Closed(UserRateThrottle):
+            rate = '0/min'
+
+        self.assertEqual(self.check(Closed), (False, 60))
+
+    def test_scoped_throttle_uses_the_sliding_window(self):
+        view = SimpleNamespace(throttle_scope='uploads')
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'uploads': '2/min'}):
+            results = [self.check(ScopedRateThrottle, view=view) for _ in range(3)]
+            unscoped = self.check(ScopedRateThrottle, view=SimpleNamespace())
+        self.assertEqual([allowed for allowed, _ in results], [True, True, False])
+        self.assertEqual(results[-1][1], 50 + 60 * (1 - 1 / 2))
+        self.assertEqual(self.redis.hget('throttle_uploads_42', 'current'), b'2')
+        self.assertEqual(unscoped, (True, None))
+
+    def test_redis_errors_let_requests_through(self):
+        self.server.connected = False
+        self.assertEqual(self.check(), (True, None))
+
+
+class CacheFallbackThrottleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('users.throttling.get_sliding_window_script', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_redis_the_stock_throttle_is_used(self):
+        throttles = [ThreePerMinute() for _ in range(4)]
+        results = [throttle.allow_request(request_for('7'), None) for throttle in throttles]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertLessEqual(throttles[-1].wait(), 60)
+        self.assertEqual(len(cache.get('throttle_user_7')), 3)
+
+
+def outstanding(jti, expires_in, blacklisted=False):
+    now = timezone.now()
+    token = OutstandingToken.objects.create(
+        jti=jti, token=f'token-{jti}', created_at=now, expires_at=now + timedelta(days=expires_in),
+    )
+    if blacklisted:
+        BlacklistedToken.objects.create(token=token)
+    return token
+
+
+@skipUnless(fakeredis, 'fakeredis[lua] is not installed')
+class SharedBlacklistFilterTests(TestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.writer = self.open_filter()
+        self.reader = self.open_filter()
+
+    def open_filter(self):
+        # Each process has its own connection to the shared Redis
+        client = fakeredis.FakeRedis(server=self.server)
+        return SharedBlacklistFilter(client, capacity=1000, error_rate=0.001, sync_interval=0)
+
+    def test_rebuild_loads_unexpired_blacklisted_tokens(self):
+        outstanding('revoked', expires_in=1, blacklisted=True)
+        outstanding('expired', expires_in=-1, blacklisted=True)
+        outstanding('active', expires_in=1)
+
+        self.assertEqual(self.writer.rebuild(), 1)
+        self.assertTrue(self.reader.might_contain('revoked'))
+        self.assertFalse(self.reader.might_contain('expired'))
+        self.assertFalse(self.reader.might_contain('active'))
+
+    def test_tokens_blacklisted_during_a_rebuild_are_in_the_published_filter(self):
+        self.writer.rebuild()
+        self.reader.might_contain('anything')
+        outstanding('revoked', expires_in=1, blacklisted=True)
+
+        # Let the reader sync after every write the rebuild makes
+        seen = []
+        client = self.writer.client
+        pipeline = client.pipeline
+
+        def pipeline_then_sync(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def execute_then_sync(*args, **kwargs):
+                result = execute(*args, **kwargs)
+                self.reader._sync()
+                seen.append(('revoked' in self.reader.filter, 'late' in self.reader.filter))
+                return result
+
+            pipe.execute = execute_then_sync
+            return pipe
+
+        jtis = iter(BlacklistedToken.objects.values_list('token__jti', flat=True))
+
+        def scan(chunk_size):
+            yield next(jtis)
+            self.writer.add('late')
+
+        with mock.patch.object(client, 'pipeline', side_effect=pipeline_then_sync):
+            with mock.patch('django.db.models.query.QuerySet.iterator', side_effect=scan):
+                self.writer.rebuild()
+
+        self.assertEqual(seen, [(False, True), (True, True)])
+        self.assertEqual(self.reader._generation, b'2')
+
+    def test_sync_catches_up_from_the_log(self):
+        self.writer.rebuild()
+        self.assertFalse(self.reader.might_contain('first'))
+        for jti in ('first', 'second'):
+            self.writer.add(jti)
+
+        with mock.patch.object(self.reader, '_reload', wraps=self.reader._reload) as reload:
+            self.assertTrue(self.reader.might_contain('first'))
+            self.assertTrue(self.reader.might_contain('second'))
+        reload.assert_not_called()
+        self.assertEqual(self.reader._seq, 2)
+
+    def test_sync_reloads_when_the_log_was_trimmed(self):
+        self.writer.rebuild()
+        self.reader.might_contain('anything')
+        with mock.patch('users.blacklist.LOG_SIZE', 2):
+            for jti in ('first', 'second', 'third'):
+                self.writer.add(jti)
+            with mock.patch.object(self.reader, '_reload', wraps=self.reader._reload) as reload:
+                self.assertTrue(self.reader.might_contain('first'))
+        reload.assert_called_once()
+        self.assertEqual(self.reader._seq, 3)
+
+    def test_unbuilt_filter_falls_through_and_queues_a_rebuild(self):
+        with mock.patch('users.blacklist._queue_rebuild') as queue_rebuild:
+            self.assertTrue(self.reader.might_contain('anything'))
+        queue_rebuild.assert_called_once()
+
+
+class DeleteExpiredTokensTests(TestCase):
+    def test_expired_tokens_are_deleted_in_windows(self):
+        expired = [outstanding(f'expired-{number}', expires_in=-1, blacklisted=number % 2) for number in range(5)]
+        active = [outstanding(f'active-{number}', expires_in=1, blacklisted=True) for number in range(4)]
+        # Issued later with a shorter lifetime; left for a later run
+        straggler = outstanding('straggler', expires_in=-1)
+
+        self.assertEqual(delete_expired_tokens(batch_size=2), 5)
+
+        remaining = set(OutstandingToken.objects.values_list('jti', flat=True))
+        self.assertEqual(remaining, {token.jti for token in active + [straggler]})
+        self.assertEqual(BlacklistedToken.objects.count(), 4)
+        self.assertFalse(OutstandingToken.objects.filter(pk__in=[token.pk for token in expired]).exists())
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_expired_tokens(batch_size=2), 0)
+        outstanding('active', expires_in=1)
+        self.assertEqual(delete_expired_tokens(batch_size=2), 0)
@@ -0,0 +1,129 @@
+import logging
+import threading
+
+from rest_framework import throttling
+
+logger = logging.getLogger(__name__)
+
+# Sliding-window counter: the previous fixed window's count, weighted by how
+# much of it still overlaps the sliding window, plus the current window's
+# count. State is one hash of three integers per client, whatever the rate.
+# Redis' own clock is used so workers with skewed clocks agree. Returns
+# {allowed, milliseconds until a request would be allowed}.
+SLIDING_WINDOW_SCRIPT = """
+-- TIME before writes needs effects replication on Redis < 5
+if redis.replicate_commands then redis.replicate_commands() end
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2]) * 1000
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local index = math.floor(now / window)
+local elapsed = now - index * window
+
+local state = redis.call('HMGET', KEYS[1], 'window', 'current', 'previous')
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+local stored = tonumber(state[1])
+if stored ~= index then
+    if stored == index - 1 then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+
+local weight = (window - elapsed) / window
+if previous * weight + current + 1 > limit then
+    local wait
+    if current == 0 and previous == 0 then
+        wait = window
+    elseif current + 1 > limit then
+        -- Wait for the next window, then for this window's weight to decay enough
+        wait = (window - elapsed) + window * (1 - (limit - 1) / current)
+    else
+        wait = window * (1 - (limit - current - 1) / previous) - elapsed
+    end
+    return {0, math.max(math.ceil(wait), 1)}
+end
+
+redis.call('HSET', KEYS[1], 'window', index, 'current', current + 1, 'previous', previous)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {1, 0}
+"""
+
+_script = None
+_script_lock = threading.Lock()
+
+
+def get_sliding_window_script():
+    """
+    Return the registered sliding-window script, or None when the default
+    cache is not Redis.
+    """
+    global _script
+    if _script is None:
+        with _script_lock:
+            if _script is None:
+                try:
+                    from django_redis import get_redis_connection
+
+                    _script = get_redis_connection('default').register_script(SLIDING_WINDOW_SCRIPT)
+                except (ImportError, NotImplementedError) as e:
+                    logger.warning(f'Redis is not available for throttling ({e}); using the cache history throttle')
+                    _script = False
+    return _script or None
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    ``SimpleRateThrottle`` with the same rate strings and cache keys, but
+    counted by an atomic Redis script instead of a timestamp list.
+
+    The stock throttle reads, trims and rewrites the list of every request
+    in the window, so its cost grows with the rate and concurrent workers
+    overwrite each other's updates. Here each check is one EVALSHA on a
+    fixed-size hash. The sliding window is approximated by weighting the
+    previous fixed window, which may admit slightly more or fewer requests
+    than an exact log near window edges. If Redis errors, requests are let
+    through rather than failing the API. Without Redis the stock behaviour
+    is used.
+    """
+
+    def allow_request(self, request, view):
+        script = get_sliding_window_script()
+        if script is None:
+            return super().allow_request(request, view)
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        try:
+            allowed, wait_ms = script(keys=[self.key], args=[self.num_requests, self.duration])
+        except Exception as e:
+            logger.warning(f'Throttle check failed, allowing request: {e}')
+            return True
+        self.wait_seconds = wait_ms / 1000
+        return bool(allowed)
+
+    def wait(self):
+        if get_sliding_window_script() is None:
+            return super().wait()
+        return getattr(self, 'wait_seconds', None)
+
+
+class AnonRateThrottle(SlidingWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowRateThrottle, throttling.UserRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowRateThrottle):
+    # ScopedRateThrottle picks the view's rate, then defers to the sliding window
+    pass
+
@@ -4,6 +4,9 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
 from django.contrib.auth import get_user_model, logout
+from utils.pagination import KeysetPagination
+from .authentication import invalidate_cached_users
+from .blacklist import BloomRefreshToken
 from .models import UserPreference
 from .serializers import (
     UserSerializer, 
@@ -49,7 +52,7 @@ class LogoutView(views.APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = BloomRefreshToken(refresh_token)
             token.blacklist()
             logout(request)
             return Response({"detail": "Successfully logged out"}, status=status.HTTP_200_OK)
@@ -112,29 +115,43 @@ class ChangePasswordView(generics.UpdateAPIView):
         # Set the new password
         user.set_password(serializer.validated_data['new_password'])
         user.save()
+        # Tokens are checked against the cached user, which must not keep the old password hash
+        invalidate_cached_users(user.pk)
         
         return Response({"detail": "Password changed successfully"}, status=status.HTTP_200_OK)
 
 
 class UserListView(generics.ListAPIView):
     """
-    List users (admin only can see all users, others only see themselves)
+    List users (admin only can see all users, others only see themselves).
+    Page numbers by default; pass pagination=cursor for keyset pages.
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
     
     def get_queryset(self):
         user = self.request.user
+        # UserSerializer nests preferences; join them instead of a query per user
+        users = User.objects.select_related('preferences')
         if user.role == 'admin' or user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=user.id)
+            return users
+        return users.filter(id=user.id)
 
 
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a user instance (admin only)
     """
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('preferences')
     serializer_class = UserSerializer
     permission_classes = [IsOwnerOrAdmin]
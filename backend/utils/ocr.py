@@ -0,0 +1,309 @@
+import functools
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Bump when OCR output changes for the same image and settings, so cached text is not reused
+OCR_VERSION = 1
+
+_ALNUM_RE = re.compile(r'\w')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def ocr_available():
+    """
+    Whether pytesseract and the tesseract binary are installed.
+    """
+    try:
+        import pytesseract
+    except ImportError:
+        logger.warning('pytesseract is not installed; scanned pages will not be OCRed')
+        return False
+    if shutil.which(pytesseract.pytesseract.tesseract_cmd) is None:
+        logger.warning('The tesseract binary was not found; scanned pages will not be OCRed')
+        return False
+    return True
+
+
+def needs_ocr(text):
+    """
+    Whether a page's extracted text is too thin to be a real text layer.
+    """
+    return len(_ALNUM_RE.findall(text)) < settings.OCR_MIN_TEXT_CHARS
+
+
+def page_images(page):
+    """
+    Return ``(image bytes, page width in inches)`` for the images on a PDF
+    page large enough to hold text (OCR_MIN_IMAGE_PIXELS); logos and rules
+    are skipped.
+    """
+    from PIL import Image
+
+    width_inches = float(page.mediabox.width) / 72
+    images = []
+    try:
+        for image in page.images:
+            with Image.open(io.BytesIO(image.data)) as decoded:
+                if decoded.width * decoded.height >= settings.OCR_MIN_IMAGE_PIXELS:
+                    images.append((image.data, width_inches))
+    except Exception as e:
+        logger.warning(f'Could not decode the images of a page for OCR: {e}')
+    return images
+
+
+def normalize_image(image, page_width_inches, target_dpi, max_pixels):
+    """
+    Convert a page image to greyscale at ``target_dpi``.
+
+    The scan resolution is derived from the page width. High-resolution
+    scans are downscaled, which makes OCR much faster with no loss of
+    accuracy, and low-resolution ones are upscaled, which tesseract reads
+    better. The result never exceeds ``max_pixels``. Returns the image and
+    its resolution.
+    """
+    if image.mode != 'L':
+        image = image.convert('L')
+    dpi = image.width / page_width_inches if page_width_inches else target_dpi
+    scale = target_dpi / dpi
+    pixels = image.width * image.height
+    if pixels * scale * scale > max_pixels:
+        scale = math.sqrt(max_pixels / pixels)
+    if abs(scale - 1) > 0.05:
+        from PIL import Image
+
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    return image, max(1, round(dpi * scale))
+
+
+def ocr_image(data, page_width_inches, language, target_dpi, max_pixels):
+    """
+    OCR one page image; runs in the OCR pool. Returns ``(text, seconds)``.
+    """
+    import pytesseract
+    from PIL import Image
+
+    started = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as image:
+        normalized, dpi = normalize_image(image, page_width_inches, target_dpi, max_pixels)
+        text = pytesseract.image_to_string(normalized, lang=language, config=f'--dpi {dpi}')
+    return text, time.perf_counter() - started
+
+
+def get_ocr_pool():
+    """
+    Return this process's OCR process pool, or None when OCR_WORKERS is 0.
+
+    Workers are spawned rather than forked, so they do not inherit the
+    threads and connections of the Celery worker, and are reused across
+    documents.
+    """
+    global _pool, _pool_pid
+    if settings.OCR_WORKERS <= 0:
+        return None
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.OCR_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _resolve_repeat(repeat, done):
+    if done.exception() is not None:
+        repeat.set_exception(done.exception())
+    else:
+        repeat.set_result((done.result()[0], 0.0, True))
+
+
+class OcrStats:
+    """
+    OCR statistics for one ingest: pages OCRed, pages served from the
+    cache, failures and the OCR time of every page in milliseconds.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.cached = 0
+        self.failed = 0
+        self.page_ms = {}
+
+    def record(self, page_number, ms, cached):
+        self.pages += 1
+        self.cached += cached
+        self.page_ms[page_number] = round(ms, 1)
+
+    def as_dict(self):
+        timings = sorted(self.page_ms.values())
+        return {
+            'pages': self.pages,
+            'cached': self.cached,
+            'failed': self.failed,
+            'seconds': round(sum(timings) / 1000, 3),
+            'p50_ms': timings[len(timings) // 2] if timings else None,
+            'max_ms': timings[-1] if timings else None,
+            'page_ms': self.page_ms,
+        }
+
+
+def merge_ocr_stats(results):
+    """
+    Combine the ``OcrStats.as_dict`` of page ranges ingested in parallel.
+    """
+    stats = OcrStats()
+    for result in results:
+        stats.pages += result['pages']
+        stats.cached += result['cached']
+        stats.failed += result['failed']
+        stats.page_ms.update({int(page): ms for page, ms in result['page_ms'].items()})
+    return stats.as_dict()
+
+
+class PageOcr:
+    """
+    Fills in the text of image-only pages in a stream of PDF pages.
+
+    Takes ``(page_number, text, images)`` tuples, where ``images`` is set
+    only for pages without a usable text layer (see ``needs_ocr`` and
+    ``page_images``), and yields ``(page_number, text)`` in page order.
+    Page images are OCRed in the process pool while later pages are read,
+    at most ``window`` pages ahead, so the stream keeps its bounded memory.
+
+    OCR output is cached by image hash (OCR_CACHE_TIMEOUT), so re-uploaded
+    documents and pages repeated within or across documents are not OCRed
+    again. A page whose OCR fails or exceeds OCR_PAGE_TIMEOUT keeps its
+    extracted text.
+    """
+
+    def __init__(self, stats=None, window=None, cache_alias='default'):
+        self.stats = stats if stats is not None else OcrStats()
+        self.window = window or max(settings.OCR_WORKERS, 1) * 2
+        self.cache_alias = cache_alias
+        self._submitted = {}
+
+    @staticmethod
+    def cache_key(data):
+        digest = hashlib.sha256(data).hexdigest()
+        return f'ocr:{OCR_VERSION}:{settings.OCR_LANGUAGE}:{settings.OCR_TARGET_DPI}:{digest}'
+
+    def iter_pages(self, pages):
+        pending = deque()
+        for page_number, text, images in pages:
+            futures = [self._submit(data, width) for data, width in images] if images else None
+            pending.append((page_number, text, futures))
+            while pending and (pending[0][2] is None or len(pending) > self.window):
+                yield self._resolve(*pending.popleft())
+        while pending:
+            yield self._resolve(*pending.popleft())
+
+    def _submit(self, data, page_width_inches):
+        """
+        Return a future for ``(text, seconds, cached)``.
+        """
+        key = self.cache_key(data)
+        if key in self._submitted:
+            # Images repeated within the document are OCRed once
+            repeat = Future()
+            self._submitted[key].add_done_callback(functools.partial(_resolve_repeat, repeat))
+            return repeat
+        self._submitted[key] = self._start(key, data, page_width_inches)
+        return self._submitted[key]
+
+    def _start(self, key, data, page_width_inches):
+        future = Future()
+        try:
+            text = caches[self.cache_alias].get(key)
+        except Exception as e:
+            logger.warning(f'OCR cache unavailable: {e}')
+            text = None
+        if text is not None:
+            future.set_result((text, 0.0, True))
+            return future
+
+        args = (data, page_width_inches, settings.OCR_LANGUAGE, settings.OCR_TARGET_DPI, settings.OCR_MAX_PIXELS)
+        pool = get_ocr_pool()
+        if pool is None:
+            try:
+                text, seconds = ocr_image(*args)
+            except Exception as e:
+                future.set_exception(e)
+                return future
+            self._store(key, text)
+            future.set_result((text, seconds, False))
+            return future
+        try:
+            pool.submit(ocr_image, *args).add_done_callback(functools.partial(self._finish, future, key, pool))
+        except BrokenProcessPool as e:
+            _discard_pool(pool)
+            future.set_exception(e)
+        return future
+
+    def _finish(self, future, key, pool, done):
+        try:
+            text, seconds = done.result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); the next document gets a fresh pool
+            _discard_pool(pool)
+            future.set_exception(e)
+            return
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self._store(key, text)
+        future.set_result((text, seconds, False))
+
+    def _store(self, key, text):
+        try:
+            caches[self.cache_alias].set(key, text, timeout=settings.OCR_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f'Could not cache OCR output: {e}')
+
+    def _resolve(self, page_number, text, futures):
+        if futures is None:
+            return page_number, text
+        texts, seconds, cached = [], 0.0, True
+        try:
+            for future in futures:
+                image_text, image_seconds, image_cached = future.result(timeout=settings.OCR_PAGE_TIMEOUT)
+                texts.append(image_text)
+                seconds += image_seconds
+                cached = cached and image_cached
+        except Exception as e:
+            return self._failed(page_number, text, e)
+        self.stats.record(page_number, seconds * 1000, cached)
+        ocr_text = '\n\n'.join(part.strip() for part in texts if part.strip())
+        return page_number, ocr_text or text
+
+    def _failed(self, page_number, text, error):
+        logger.warning(f'OCR failed for page {page_number}, keeping its extracted text: {error!r}')
+        self.stats.failed += 1
+        return page_number, text
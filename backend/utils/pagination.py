@@ -0,0 +1,65 @@
+import json
+
+from django.db import NotSupportedError, connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+COUNT_MODES = ('exact', 'estimate')
+
+
+def estimate_count(queryset):
+    """
+    Row count of ``queryset`` from the PostgreSQL planner, without scanning.
+
+    Falls back to an exact ``count()`` on other databases.
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == 'postgresql':
+        try:
+            plan = json.loads(queryset.explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        except (NotSupportedError, ValueError, KeyError, IndexError):
+            pass
+    return queryset.count()
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over an indexed ``(created_at, id)`` key, newest first.
+
+    Each page is a range scan from the cursor position, so a page deep in
+    the list costs the same as the first one, and no ``COUNT(*)`` runs
+    unless the client asks for one with ``count=exact`` or the planner's
+    ``count=estimate``. ``page_size`` may be lowered or raised up to
+    ``max_page_size``. Subclasses change ``ordering`` for other keys.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        self.count_mode = request.query_params.get(self.count_query_param)
+        if self.count_mode == 'exact':
+            self.count = queryset.count()
+        elif self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_estimate'] = self.count_mode == 'estimate'
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count'] = {
+            'type': 'integer',
+            'description': f'Only present with {self.count_query_param}={"|".join(COUNT_MODES)}',
+        }
+        response['properties']['count_is_estimate'] = {'type': 'boolean'}
+        return response
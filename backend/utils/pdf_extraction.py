@@ -0,0 +1,82 @@
+import logging
+
+from PyPDF2 import PdfReader
+
+from .ocr import needs_ocr, page_images
+
+logger = logging.getLogger(__name__)
+
+
+def count_pdf_pages(path):
+    """
+    Return the number of pages in the PDF at ``path`` without extracting text.
+    """
+    with open(path, 'rb') as fh:
+        return len(PdfReader(fh).pages)
+
+
+def iter_pdf_pages(path, start_page=0, end_page=None, ocr=None):
+    """
+    Yield ``(page_number, text)`` tuples for a PDF, one page at a time.
+
+    The reader works directly on the file handle so the document is never
+    loaded into memory as a whole. PyPDF2 caches every object it resolves, so
+    the cache is dropped after each page to keep memory bounded by the largest
+    page instead of growing with the document. ``page_number`` is 1-based;
+    ``start_page``/``end_page`` are 0-based and end-exclusive.
+
+    With ``ocr`` (a ``utils.ocr.PageOcr``), pages without a text layer have
+    their images OCRed; pages that have one are never OCRed.
+    """
+    if ocr is not None:
+        yield from ocr.iter_pages(_iter_pdf_page_images(path, start_page, end_page))
+        return
+    for page_number, text, _ in _iter_pdf_page_images(path, start_page, end_page, images=False):
+        yield page_number, text
+
+
+def _iter_pdf_page_images(path, start_page, end_page, images=True):
+    """
+    Yield ``(page_number, text, images)``, with the page images taken only
+    for pages whose text layer is missing.
+    """
+    with open(path, 'rb') as fh:
+        reader = PdfReader(fh)
+        total = len(reader.pages)
+        end = total if end_page is None else min(end_page, total)
+
+        for index in range(start_page, end):
+            page = reader.pages[index]
+            try:
+                text = page.extract_text() or ''
+            except Exception as e:
+                logger.warning(f'Failed to extract text from page {index + 1} of {path}: {e}')
+                text = ''
+            yield index + 1, text, page_images(page) if images and needs_ocr(text) else None
+            _release_object_cache(reader)
+
+
+def iter_text_pages(path, page_size=8192):
+    """
+    Yield ``(page_number, text)`` tuples for a plain-text file.
+
+    Text files have no pages, so the file is read in blocks of about
+    ``page_size`` characters, completed to the end of the line, which are
+    treated as pages by the rest of the pipeline.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as fh:
+        page_number = 0
+        while True:
+            block = fh.read(page_size)
+            if not block:
+                break
+            if not block.endswith('\n'):
+                block += fh.readline()
+            page_number += 1
+            yield page_number, block
+
+
+def _release_object_cache(reader):
+    cache = getattr(reader, 'resolved_objects', None)
+    if cache:
+        cache.clear()
@@ -0,0 +1,20 @@
+import os
+import resource
+import sys
+
+
+def current_rss_bytes():
+    """
+    Return the current resident set size of this process in bytes.
+
+    Reads ``/proc/self/statm`` where available; other platforms fall back to
+    the peak RSS reported by ``getrusage``.
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            resident_pages = int(fh.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
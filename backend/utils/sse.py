@@ -0,0 +1,27 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+
+def is_asgi(request):
+    """
+    Whether ``request`` (a Django or DRF request) is served by the ASGI handler.
+    """
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def event_stream(request, async_events, sync_events, *args, **kwargs):
+    """
+    Server-sent events response for ``request``.
+
+    Under ASGI the body is the async generator ``async_events(*args,
+    **kwargs)`` and events go out as they are produced. Django can only
+    serve an async iterator under WSGI by collecting it first, which would
+    send every event at the end, so WSGI gets the plain generator
+    ``sync_events(*args, **kwargs)`` instead, holding the worker thread
+    while it runs.
+    """
+    events = async_events if is_asgi(request) else sync_events
+    response = StreamingHttpResponse(events(*args, **kwargs), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
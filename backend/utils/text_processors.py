@@ -0,0 +1,284 @@
+import re
+
+from django.conf import settings
+
+# Bump when chunk boundaries change for the same settings, so documents get re-indexed
+CHUNKER_VERSION = 2
+
+_WHITESPACE_RE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+# Roughly one WordPiece token per word, number group or punctuation mark
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+(?=["\'(]?[A-Z0-9])')
+# 1234, 1,234, 1,23,456 (Indian grouping), -12.5, 7.3% and the usual missing-value marks
+_NUMERIC_CELL_RE = re.compile(r'^(?:[-+]?(?:\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d+)?%?|-|–|—|na|n\.a\.?|\.\.)$', re.IGNORECASE)
+_NUMBERED_HEADING_RE = re.compile(
+    r'^(?:(?:chapter|section|part|annex(?:ure)?|appendix)\s+[\dIVXLC]+\b|\d{1,2}(?:\.\d{1,2}){0,3}\.?\s+[A-Z]|[IVX]{1,4}\.\s+[A-Z])',
+    re.IGNORECASE,
+)
+_CAPTION_RE = re.compile(r'^(?:table|statement|figure|chart|box)\s+[A-Z\d][\w.-]*\s*[:.\-–]', re.IGNORECASE)
+MAX_HEADING_CHARS = 120
+MAX_HEADING_WORDS = 15
+
+HEADING, TABLE, TEXT = 'heading', 'table', 'text'
+
+
+def normalize_text(text):
+    """
+    Normalize extracted text: drop NUL bytes, collapse runs of spaces and
+    excessive blank lines, and strip surrounding whitespace.
+    """
+    text = text.replace('\x00', '')
+    text = _WHITESPACE_RE.sub(' ', text)
+    text = _BLANK_LINES_RE.sub('\n\n', text)
+    return text.strip()
+
+
+def count_tokens(text):
+    """
+    Approximate the number of embedding-model tokens in ``text``.
+
+    Counts words, number groups and punctuation marks, which tracks
+    WordPiece closely for English and numeric text without loading a
+    tokenizer.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def classify_line(line):
+    """
+    Return HEADING, TABLE or TEXT for one line of extracted text.
+
+    Table rows end in two or more numeric cells. Headings are short lines
+    that are numbered (``3.2 Employment``, ``Chapter IV``), captions
+    (``Table 5: ...``) or all capitals, and do not end like a sentence.
+    """
+    tokens = line.split()
+    cells = 0
+    for token in reversed(tokens):
+        if not _NUMERIC_CELL_RE.match(token):
+            break
+        cells += 1
+    if cells >= 2:
+        return TABLE
+    if len(line) > MAX_HEADING_CHARS or len(tokens) > MAX_HEADING_WORDS or line[-1] in '.,;':
+        return TEXT
+    if _CAPTION_RE.match(line) or _NUMBERED_HEADING_RE.match(line):
+        return HEADING
+    letters = [char for char in line if char.isalpha()]
+    if len(letters) >= 4 and line.isupper():
+        return HEADING
+    return TEXT
+
+
+def iter_blocks(pages):
+    """
+    Split a stream of ``(page_number, text)`` tuples into structural blocks.
+
+    Yields ``(kind, page_number, text)`` where ``kind`` is HEADING (one
+    line), TABLE (consecutive rows, one per line) or TEXT (a paragraph with
+    its line breaks and hyphenation undone). Paragraphs end at blank lines,
+    headings, tables and page breaks.
+    """
+    for page_number, text in pages:
+        text = normalize_text(text)
+        kind, lines = None, []
+        for line in text.split('\n'):
+            line = line.strip()
+            line_kind = classify_line(line) if line else None
+            if lines and (line_kind != kind or kind == HEADING):
+                yield kind, page_number, _join_lines(kind, lines)
+                lines = []
+            kind = line_kind
+            if line:
+                lines.append(line)
+        if lines:
+            yield kind, page_number, _join_lines(kind, lines)
+
+
+def _join_lines(kind, lines):
+    if kind != TEXT:
+        return '\n'.join(lines)
+    text = lines[0]
+    for line in lines[1:]:
+        if text.endswith('-') and line[:1].islower():
+            text = text[:-1] + line
+        else:
+            text = f'{text} {line}'
+    return text
+
+
+class _ChunkBuilder:
+    """
+    Packs blocks into chunks of at most ``max_tokens``.
+    """
+
+    def __init__(self, max_tokens, overlap):
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.chunk_index = 0
+        self.section = ''
+        # Section a table caption interrupts, restored once the table's prose continues
+        self.outer_section = None
+        self.chunk_section = ''
+        self.lines = []
+        self.tokens = 0
+        self.has_body = False
+        self.first_page = self.last_page = None
+
+    def add_heading(self, page_number, text):
+        if self.has_body:
+            yield from self.flush()
+        if _CAPTION_RE.match(text):
+            if self.outer_section is None:
+                self.outer_section = self.section
+        else:
+            self.outer_section = None
+        if self.lines:
+            # Consecutive headings ("CHAPTER 3" / "Employment") form one section title
+            self.section = f'{self.section}\n{text}'
+        else:
+            self.section = text
+        self._append(page_number, text)
+
+    def add_table(self, page_number, text):
+        rows = text.split('\n')
+        if self.has_body and self.tokens + count_tokens(text) > self.max_tokens:
+            yield from self.flush()
+        for row in rows:
+            cost = count_tokens(row)
+            if self.has_body and self.tokens + cost > self.max_tokens:
+                yield from self.flush()
+                self._start_body(page_number)
+                # Continuation chunks repeat the column header row
+                self._append(page_number, rows[0])
+            self._start_body(page_number)
+            self._append(page_number, row, cost)
+            self.has_body = True
+
+    def add_text(self, page_number, text):
+        if self.outer_section is not None and self.has_body:
+            self.section, self.outer_section = self.outer_section, None
+        cost = count_tokens(text)
+        if self.has_body and self.tokens + cost > self.max_tokens and cost <= self.max_tokens // 2:
+            # Short paragraphs move to the next chunk whole rather than being split
+            yield from self.flush()
+        self._start_body(page_number)
+        if self.tokens + cost <= self.max_tokens:
+            self._append(page_number, text, cost)
+            self.has_body = True
+            return
+
+        started = False
+        for sentence in self._sentences(text):
+            cost = count_tokens(sentence)
+            if self.has_body and self.tokens + cost > self.max_tokens:
+                tail = self._overlap_tail() if started else ''
+                yield from self.flush()
+                self._start_body(page_number)
+                started = bool(tail)
+                if tail:
+                    self._append(page_number, tail)
+            if started:
+                self.lines[-1] = f'{self.lines[-1]} {sentence}'
+                self.tokens += cost
+                self.last_page = page_number
+            else:
+                self._append(page_number, sentence, cost)
+                started = True
+            self.has_body = True
+
+    def flush(self):
+        if self.has_body:
+            yield {
+                'chunk_index': self.chunk_index,
+                'page_number': self.first_page,
+                'end_page': self.last_page,
+                'section': self.chunk_section,
+                'text': '\n'.join(self.lines),
+            }
+            self.chunk_index += 1
+        self.lines, self.tokens, self.has_body = [], 0, False
+        self.first_page = self.last_page = None
+
+    def _start_body(self, page_number):
+        # Chunks continuing a section start with its heading
+        if not self.lines and self.section:
+            self._append(page_number, self.section)
+
+    def _append(self, page_number, text, cost=None):
+        if not self.lines:
+            self.chunk_section = self.section
+        self.lines.append(text)
+        self.tokens += count_tokens(text) if cost is None else cost
+        self.first_page = page_number if self.first_page is None else self.first_page
+        self.last_page = page_number
+
+    def _sentences(self, text):
+        # Sentences longer than half a chunk are cut between words
+        limit = max(self.max_tokens // 2, 1)
+        for sentence in _SENTENCE_END_RE.split(text):
+            piece, tokens = [], 0
+            for word in sentence.split():
+                piece.append(word)
+                tokens += count_tokens(word)
+                if tokens >= limit:
+                    yield ' '.join(piece)
+                    piece, tokens = [], 0
+            if piece:
+                yield ' '.join(piece)
+
+    def _overlap_tail(self):
+        """
+        The last sentences of the open paragraph, up to ``overlap`` tokens.
+        """
+        tail, tokens = [], 0
+        for sentence in reversed(_SENTENCE_END_RE.split(self.lines[-1])):
+            tokens += count_tokens(sentence)
+            if tokens > self.overlap:
+                break
+            tail.insert(0, sentence)
+        return ' '.join(tail)
+
+
+def iter_text_chunks(pages, max_tokens=None, overlap=None):
+    """
+    Split a stream of ``(page_number, text)`` tuples into chunks along the
+    document structure.
+
+    Headings start a new chunk and are repeated at the top of every chunk
+    of their section; tables are kept whole when they fit and otherwise
+    split between rows, repeating the header row; paragraphs are packed
+    whole, and a paragraph that does not fit is split between sentences,
+    the next chunk repeating up to ``overlap`` tokens of the previous one.
+    Sizes are in tokens as counted by ``count_tokens`` and stay within
+    ``max_tokens`` (CHUNK_MAX_TOKENS), which should not exceed the
+    embedding model's sequence length.
+
+    Chunks are produced while pages are still being extracted. Each chunk
+    is a dict with ``chunk_index``, ``page_number`` (the page the chunk
+    starts on), ``end_page``, ``section`` (the heading it falls under) and
+    ``text``.
+    """
+    max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+    overlap = settings.CHUNK_OVERLAP_TOKENS if overlap is None else overlap
+    overlap = min(overlap, max_tokens // 4)
+    builder = _ChunkBuilder(max_tokens, overlap)
+    adders = {HEADING: builder.add_heading, TABLE: builder.add_table, TEXT: builder.add_text}
+    for kind, page_number, text in iter_blocks(pages):
+        yield from adders[kind](page_number, text)
+    yield from builder.flush()
+
+
+def iter_batches(iterable, size):
+    """
+    Group an iterable into lists of at most ``size`` items.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,154 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Stage timings, SQL activity and cache lookups collected for one request.
+
+    An instance is made current by ``activate`` (the request metrics
+    middleware does this) and filled in by ``stage``, ``record_stage``,
+    ``record_cache`` and the query counter installed on every database
+    connection. Outside an active request all of these are no-ops. Stages
+    of one request may run on several threads, so updates take a lock.
+    """
+
+    __slots__ = ('started', 'stages', 'sql_count', 'sql_ms', 'caches', 'total_ms', '_lock')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.caches = {}
+        self.total_ms = None
+
+    def add_stage(self, name, ms):
+        # Stages that run more than once per request (e.g. per batch) accumulate
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def add_query(self, ms):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_ms += ms
+
+    def add_cache(self, name, hits, lookups):
+        with self._lock:
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0] += hits
+            counts[1] += lookups
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        return self.total_ms
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total_ms, 1) if self.total_ms is not None else None,
+            'stages': {name: round(ms, 1) for name, ms in self.stages.items()},
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_ms, 1),
+            'caches': {name: {'hits': hits, 'lookups': lookups} for name, (hits, lookups) in self.caches.items()},
+        }
+
+    def server_timing(self):
+        """
+        Value for a ``Server-Timing`` response header.
+        """
+        entries = [f'{name};dur={ms:.1f}' for name, ms in self.stages.items()]
+        entries.append(f'sql;dur={self.sql_ms:.1f};desc="{self.sql_count} queries"')
+        for name, (hits, lookups) in self.caches.items():
+            entries.append(f'cache-{name};desc="{hits}/{lookups} hits"')
+        if self.total_ms is not None:
+            entries.append(f'total;dur={self.total_ms:.1f}')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def activate(metrics):
+    """
+    Make ``metrics`` current; returns a token for ``deactivate``.
+    """
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_stage(name, ms):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_stage(name, ms)
+
+
+def record_cache(name, hits, lookups=1):
+    """
+    Record ``hits`` out of ``lookups`` cache lookups, e.g. ``record_cache('answer', 1)``.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_cache(name, int(hits), lookups)
+
+
+class stage(contextlib.ContextDecorator):
+    """
+    Time a block or function as a named stage of the current request::
+
+        with stage('rerank'):
+            ...
+
+        @stage('serialize')
+        def build_payload(...):
+            ...
+
+    The elapsed time is also available as ``ms`` after the block.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.ms = None
+
+    def _recreate_cm(self):
+        # A fresh timer per call when used as a decorator
+        return stage(self.name)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._started) * 1000
+        record_stage(self.name, self.ms)
+        return False
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries and their time for the current request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query((time.perf_counter() - started) * 1000)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding ``count_queries`` to every new connection.
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)